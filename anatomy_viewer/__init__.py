@@ -1,3 +1,9 @@
 from __future__ import absolute_import
 
-from .anatomy_viewer import AnatomyViewerApp
+
+def __getattr__(name):
+    # NOTE: imported on first use, so that the rendering modules can be used without the viewer and its widgets
+    if name == 'AnatomyViewerApp':
+        from .anatomy_viewer import AnatomyViewerApp
+        return AnatomyViewerApp
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
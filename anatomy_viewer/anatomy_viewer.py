@@ -1,32 +1,60 @@
 from __future__ import absolute_import
 
-from PyQt5 import QtCore, QtGui, QtWidgets
+import collections
+
+from PyQt5 import QtCore, QtWidgets
 
 import numpy as np
-import cv2
 import six
 
 from .image_view import ImageView
 from .anatomy_viewer_ui import Ui_AnatomyViewer
-from .utils import lut, clim
-
+from .render import SliceRenderer, RenderState, panelNames, panel_key
+from .render import changed_inputs, invalidated_panels, get_slice_position, get_slice_voxel
+from .oblique import ObliquePlane
+from .cache import LRUCache
+from .prefetch import SlicePrefetcher
+from .layout import AxisLayouts
+from .projection import SlabTables
+from .triplanar import TriPlanarRenderer, TriPlanarView, plane_states
+from .scheduler import RenderScheduler
+from .loader import VolumeLoader
+from .stats import get_statistics
+from .profiling import Profiler
+from .labels import compact_labels, get_label_index, compute_label_report
+from .utils import color_table
+from .window_level import imageWindowPresets, uncertWindowPresets, adaptiveWindowPresets
+
+# NOTE: evaluated on the cached `VolumeStatistics` of each volume
 imageStatistics = {
-    'mean': lambda x: np.mean(x),
-    'std': lambda x: np.std(x),
-    'min': lambda x: np.min(x),
-    'max': lambda x: np.max(x),
+    'mean': lambda x: x.mean,
+    'std': lambda x: x.std,
+    'min': lambda x: x.min,
+    'max': lambda x: x.max,
 }
 
 labeStatistics = {
-    'min': lambda x: np.min(x),
-    'max': lambda x: np.max(x),
+    'min': lambda x: x.min,
+    'max': lambda x: x.max,
 }
 
 uncertStatistics = {
-    'mean': lambda x: np.mean(x),
-    'std': lambda x: np.std(x),
-    'min': lambda x: np.min(x),
-    'max': lambda x: np.max(x),
+    'mean': lambda x: x.mean,
+    'std': lambda x: x.std,
+    'min': lambda x: x.min,
+    'max': lambda x: x.max,
+    'p99': lambda x: x.percentile(99),
+}
+
+mapStatistics = {
+    'image': imageStatistics,
+    'label': labeStatistics,
+    'uncert': uncertStatistics,
+}
+
+mapWindowPresets = {
+    'image': imageWindowPresets,
+    'uncert': uncertWindowPresets,
 }
 
 mapSliceAxis = {
@@ -35,9 +63,18 @@ mapSliceAxis = {
     'Sagittal': 0,
 }
 
+mapProjectionModes = collections.OrderedDict([
+    ('Slice', None),
+    ('MIP', 'max'),
+    ('Mean', 'mean'),
+    ('MinIP', 'min'),
+])
+
 
 def checkVolume(x, name):
-    assert isinstance(x, np.ndarray), '%s should be `np.ndarray`..' % name
+    # NOTE: lazily indexed volumes (e.g. `ChunkedVolume`) only need shape, dtype and slicing
+    assert all(hasattr(x, a) for a in ('shape', 'dtype', 'ndim', '__getitem__')), \
+        '%s should be `np.ndarray` or indexable like one..' % name
     assert x.ndim == 3, '%s.ndim should be 3..' % name
 
 
@@ -46,33 +83,77 @@ class AnatomyViewerApp(QtWidgets.QMainWindow):
                  image,
                  label, label_cmap,
                  uncert, uncert_cmap,
-                 spacing):
+                 spacing,
+                 cache_bytes=512*1024**2,
+                 prefetch_depth=4,
+                 prefetch_workers=None,
+                 render_interval=0,
+                 indexed_labels=True,
+                 profile=False,
+                 layout_bytes=1024**3,
+                 projection_bytes=2*1024**3,
+                 pyramid_levels=2,
+                 refine_delay=150):
 
         super().__init__()
 
-        checkVolume(image, 'image')
-        checkVolume(label, 'label')
-        checkVolume(uncert, 'uncert')
-
-        assert image.shape == label.shape, 'image.shape != label.shape'
-        assert image.shape == uncert.shape, 'image.shape != uncert.shape'
-
-        self.imageVolume  = image
-        self.labelVolume  = label
-        self.uncertVolume = uncert
+        self.imageVolume  = None
+        self.labelVolume  = None
+        self.uncertVolume = None
+        self.volumeShape  = None
+        self.volumeStatistics = {}
+        self.labelIndex = None
+        self.labelReport = None
+        self.skipEmptySlices = False
 
         self.labelColorMap  = label_cmap
         self.uncertColorMap = uncert_cmap
 
         self.volumeSpacing = spacing
 
-        self.imageMean = np.mean(image)
-        self.imageStd = np.std(image)
-        self.uncertMean = np.mean(uncert)
-        self.uncertStd = np.std(uncert)
+        self.renderer = SliceRenderer(None,
+                                      None, label_cmap,
+                                      None, uncert_cmap,
+                                      spacing,
+                                      indexed_labels)
+        self.labelColorTable = color_table(self.renderer.label_table)
+        self.profiler = Profiler(profile)
+        self.renderer.profiler = self.profiler
+        self.layouts = AxisLayouts(layout_bytes) if layout_bytes > 0 else None
+        self.renderer.layouts = self.layouts
+        self.projections = SlabTables(projection_bytes) if projection_bytes > 0 else None
+        self.renderer.projections = self.projections
+        self.sliceCache = LRUCache(cache_bytes)
+        self.prefetcher = SlicePrefetcher(self.renderer, self.sliceCache,
+                                          prefetch_depth, prefetch_workers)
+        self.triPlanar = TriPlanarRenderer(self.renderer, self.sliceCache)
+        self.loader = None
+        self.loadProgress = {}
+
+        self.imageMean = 0.
+        self.imageStd = 1.
+        self.uncertMean = 0.
+        self.uncertStd = 1.
+
+        self.windowPresets = {
+            'image': list(imageWindowPresets.keys())[0],
+            'uncert': list(uncertWindowPresets.keys())[0],
+        }
 
         self.sliceIndex = 0
         self.sliceAxis = 'Axial'
+        self.sliceDirection = 1
+
+        # oblique planes tilt the last axis-aligned plane by (pitch, yaw) degrees
+        self.obliqueBase = 'Axial'
+        self.obliqueAngles = [0., 0.]
+
+        # voxel (x, y, z) that the orthogonal planes of the tri-planar view go through
+        self.cursorVoxel = None
+
+        # slab projection of the image and uncertainty: None, 'max', 'mean' or 'min', over `slabThickness` slices
+        self.projectionMode = None
+        self.slabThickness = 9
 
         self.imageWindowLevel  = [1., 0.]
         self.uncertWindowLevel = [1., 0.]
@@ -80,9 +161,27 @@ class AnatomyViewerApp(QtWidgets.QMainWindow):
         self.imageAlpha  = 0.2
         self.uncertAlpha = 0.2
 
+        self.renderedState = None
+        self.dirtyInputs = set()
+
+        # coarse rendering while scrolling, refined once input goes idle
+        self.pyramidLevels = pyramid_levels
+        self.interacting = False
+        self.panelLevels = {}
+        self.refineTimer = QtCore.QTimer(self)
+        self.refineTimer.setSingleShot(True)
+        self.refineTimer.setInterval(refine_delay)
+        self.refineTimer.timeout.connect(self.refine)
+
+        self.scheduler = RenderScheduler(self.update, render_interval, self)
+
         self.ui = None
         self.setupUi()
-        self.setupTextBrowser()
+
+        for name, volume in zip(['image', 'label', 'uncert'], [image, label, uncert]):
+            if volume is not None:
+                self.setVolume(name, volume)
+        self.updateLabelReport()
 
     def setupUi(self):
         self.ui = Ui_AnatomyViewer()
@@ -90,6 +189,39 @@ class AnatomyViewerApp(QtWidgets.QMainWindow):
 
         _margins = (0,0,0,0)
 
+        # window/level presets
+        self.presetComboBoxes = {
+            'image': self.ui.comboBoxImagePreset,
+            'uncert': self.ui.comboBoxUncertPreset,
+        }
+        for name, comboBox in six.iteritems(self.presetComboBoxes):
+            comboBox.addItem('Manual')
+            comboBox.addItems(list(mapWindowPresets[name].keys()))
+            comboBox.setCurrentText(self.windowPresets[name])
+
+        # tri-planar view
+        self.triPlanarView = TriPlanarView(self)
+        self.triPlanarView.setPanel(self.triPlanar.panel)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.triPlanarView)
+        self.triPlanarView.hide()
+        for view in self.triPlanarView.views.values():
+            view.profiler = self.profiler
+
+        # slab projections
+        self.ui.spinBoxSlabThickness.setValue(self.slabThickness)
+
+        # loading progress
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setRange(0, 100)
+        self.progressBar.setMaximumWidth(200)
+        self.progressBar.hide()
+        self.ui.statusBar.addPermanentWidget(self.progressBar)
+
+        # frame timing
+        self.frameTimeLabel = QtWidgets.QLabel()
+        self.frameTimeLabel.setVisible(self.profiler.enabled)
+        self.ui.statusBar.addPermanentWidget(self.frameTimeLabel)
+
         # image
         self.viewImage = ImageView(self.ui.graphicsViewImage)
         self.ui.viewImage_layout = QtWidgets.QHBoxLayout()
@@ -125,6 +257,17 @@ class AnatomyViewerApp(QtWidgets.QMainWindow):
         self.ui.viewUncertOverlay_layout.setContentsMargins(*_margins)
         self.ui.graphicsViewUncertOverlay.setLayout(self.ui.viewUncertOverlay_layout)
 
+        self.panelViews = {
+            'image': self.viewImage,
+            'label': self.viewLabel,
+            'labelOverlay': self.viewLabelOverlay,
+            'uncert': self.viewUncert,
+            'uncertOverlay': self.viewUncertOverlay,
+        }
+
+        for view in self.panelViews.values():
+            view.profiler = self.profiler
+
         # synchronization
         self.viewImage.setSyncCenter([self.viewLabel, self.viewLabelOverlay, self.viewUncert, self.viewUncertOverlay])
         self.viewLabel.setSyncCenter([self.viewImage, self.viewLabelOverlay, self.viewUncert, self.viewUncertOverlay])
@@ -157,71 +300,408 @@ class AnatomyViewerApp(QtWidgets.QMainWindow):
 
         self.ui.comboBoxSliceAxis.activated[str].connect(self.setSliceAxis)
 
+        self.ui.comboBoxImagePreset.activated[str].connect(lambda value: self.setWindowPreset('image', value))
+        self.ui.comboBoxUncertPreset.activated[str].connect(lambda value: self.setWindowPreset('uncert', value))
+
+        self.ui.comboBoxStructure.activated[int].connect(self.selectStructure)
+        self.ui.checkBoxSkipEmpty.toggled[bool].connect(self.setSkipEmptySlices)
+        self.ui.doubleSpinBoxPitch.valueChanged[float].connect(lambda value: self.setObliqueAngle(0, value))
+        self.ui.doubleSpinBoxYaw.valueChanged[float].connect(lambda value: self.setObliqueAngle(1, value))
+
+        self.ui.checkBoxTriPlanar.toggled[bool].connect(self.setTriPlanar)
+        self.triPlanarView.comboBoxPanel.activated[str].connect(self.setTriPlanarPanel)
+        self.triPlanarView.planeClicked.connect(self.setCursorPosition)
+        self.triPlanarView.planeScrolled.connect(self.addCursorIndex)
+
+        self.ui.comboBoxProjection.activated[str].connect(lambda value: self.setProjection(mapProjectionModes[value]))
+        self.ui.spinBoxSlabThickness.valueChanged[int].connect(self.setSlabThickness)
+
     def setupTextBrowser(self):
 
+        self.ui.textBrowserShape.clear()
+        self.ui.textBrowserScalar.clear()
+
         # volume shape
         spacing = self.volumeSpacing
-        shape_pix = self.imageVolume.shape
-        shape_mm = np.asarray(shape_pix) * np.asarray(spacing)
+        shape_pix = self.volumeShape
 
-        self.ui.textBrowserShape.append('size [pixel]: %d, %d, %d' % \
-                                (shape_pix[0], shape_pix[1], shape_pix[2]))
-        self.ui.textBrowserShape.append('size [mm]: %f, %f, %f' % \
-                                (shape_mm[0], shape_mm[1], shape_mm[2]))
-        self.ui.textBrowserShape.append('spacing: %f, %f, %f' % \
-                                (spacing[0], spacing[1], spacing[2]))
+        if shape_pix is not None and spacing is not None:
+            shape_mm = np.asarray(shape_pix) * np.asarray(spacing)
+
+            self.ui.textBrowserShape.append('size [pixel]: %d, %d, %d' % \
+                                    (shape_pix[0], shape_pix[1], shape_pix[2]))
+            self.ui.textBrowserShape.append('size [mm]: %f, %f, %f' % \
+                                    (shape_mm[0], shape_mm[1], shape_mm[2]))
+            self.ui.textBrowserShape.append('spacing: %f, %f, %f' % \
+                                    (spacing[0], spacing[1], spacing[2]))
 
         # scalar statistics
-        for name, x, statistics in zip(['image', 'label', 'uncertainty'], \
-                                    [self.imageVolume, self.labelVolume, self.uncertVolume], \
-                                    [imageStatistics, labeStatistics, uncertStatistics]):
+        for name, key in zip(['image', 'label', 'uncertainty'], ['image', 'label', 'uncert']):
+            if key not in self.volumeStatistics:
+                continue
             self.ui.textBrowserScalar.append(name + ':')
-            for function_name, function in six.iteritems(statistics):
-                self.ui.textBrowserScalar.append('  %s: %f' % (function_name, function(x)))
+            for function_name, function in six.iteritems(mapStatistics[key]):
+                self.ui.textBrowserScalar.append('  %s: %f' % (function_name, function(self.volumeStatistics[key])))
+            self.ui.textBrowserScalar.append('------')
+
+        # per-label statistics
+        if self.labelReport is not None:
+            report = self.labelReport
+            self.ui.textBrowserScalar.append('structures:')
+            for i, label in enumerate(report.labels):
+                line = '  %d: %d voxels' % (label, report.voxels[i])
+                if report.volume_mm3 is not None:
+                    line += ', %.1f mm3' % report.volume_mm3[i]
+                if report.uncert_mean is not None:
+                    line += ', uncert %f +/- %f (max %f)' % \
+                        (report.uncert_mean[i], report.uncert_std[i], report.uncert_max[i])
+                self.ui.textBrowserScalar.append(line)
             self.ui.textBrowserScalar.append('------')
 
+    def setVolume(self, name, volume, spacing=None, statistics=None):
+        """ Set the `image`, `label` or `uncert` volume, possibly after the window is shown. """
+        assert name in mapStatistics, 'unknown volume: %s' % name
+        checkVolume(volume, name)
+        if name == 'label':
+            volume = compact_labels(volume)
+        if self.volumeShape is not None and volume.shape != self.volumeShape:
+            raise ValueError('shape of %s %s != %s' % (name, volume.shape, self.volumeShape))
+
+        if statistics is None:
+            statistics = get_statistics(volume)
+
+        firstVolume = self.volumeShape is None
+        setattr(self, name + 'Volume', volume)
+        self.volumeShape = volume.shape
+        if firstVolume:
+            self.cursorVoxel = [n // 2 for n in volume.shape]
+        self.volumeStatistics[name] = statistics
+
+        # NOTE: the image's spacing wins over one taken from a volume that arrived first, e.g. a `.npy` file
+        newSpacing = spacing is not None and (self.volumeSpacing is None or
+                                              name == 'image' and not np.array_equal(spacing, self.volumeSpacing))
+        if newSpacing:
+            self.volumeSpacing = spacing
+            self.renderer.spacing = spacing
+
+        if name == 'image':
+            self.imageMean = statistics.mean
+            self.imageStd = statistics.std
+        elif name == 'uncert':
+            self.uncertMean = statistics.mean
+            self.uncertStd = statistics.std
+        elif name == 'label':
+            self.labelIndex = get_label_index(volume) if volume.dtype.kind in 'iu' else None
+            self.setupStructureControls()
+
+        # NOTE: the report is gathered elsewhere, see `setLabelReport`; a new spacing only rescales it
+        if name in ('label', 'uncert'):
+            self.labelReport = None
+        elif newSpacing and self.labelReport is not None:
+            self.labelReport = self.labelReport.with_spacing(spacing)
+
+        # drop whatever was rendered without this volume
+        self.prefetcher.cancel()
+        self.renderer.set_volume(name, volume)
+        panels = invalidated_panels(set([name + '_volume']))
+        self.sliceCache.evict(lambda key: key[0] in panels)
+        self.dirtyInputs.add(name + '_volume')
+        self.triPlanar.invalidate()
+        self.prepareLayouts()
 
-    def show(self):
-        super().show()
+        self.setupTextBrowser()
 
-        nSlices = self.imageVolume.shape[mapSliceAxis[self.sliceAxis]]
+        if self.isVisible():
+            if firstVolume:
+                self.setupSliceControls()
+            self.setupWindowControls(name)
+        self.scheduler.request()
+
+    def updateLabelReport(self):
+        """ Gather the per-label report of the current volumes in one sweep, on the calling thread. """
+        if self.labelVolume is None or self.labelVolume.dtype.kind not in 'iu':
+            self.setLabelReport(None)
+            return
+        self.setLabelReport(compute_label_report(self.labelVolume, self.uncertVolume))
+
+    def setLabelReport(self, report):
+        """ Show a `LabelReport` of the current volumes, gathered without a spacing, e.g. by the loader. """
+        if report is not None and self.labelVolume is None:
+            return
+        self.labelReport = report.with_spacing(self.volumeSpacing) if report is not None else None
+        self.setupTextBrowser()
+
+    def exportLabelReport(self, filename):
+        """ Write the per-label volume and uncertainty statistics to a CSV file. """
+        if self.labelReport is None:
+            raise RuntimeError('no label volume to report on')
+        self.labelReport.to_csv(filename)
+
+    def loadVolumes(self, filenames, max_workers=None):
+        """ Load `{name: filename}` in the background; panels fill in as volumes arrive. """
+        if self.loader is not None:
+            self.loader.shutdown()
+
+        self.loadProgress = {name: 0. for name in filenames}
+        self.progressBar.setValue(0)
+        self.progressBar.show()
+
+        self.loader = VolumeLoader(filenames, max_workers, self)
+        self.loader.loaded.connect(self.onVolumeLoaded)
+        self.loader.progress.connect(self.onLoadProgress)
+        self.loader.failed.connect(self.onLoadFailed)
+        self.loader.reported.connect(self.setLabelReport)
+        self.loader.start()
+
+    def onVolumeLoaded(self, name, volume, spacing, statistics):
+        try:
+            self.setVolume(name, volume, spacing, statistics)
+        except ValueError as e:
+            self.onLoadFailed(name, '%s: %s' % (self.loader.filenames[name], e))
+            return
+        self.onLoadProgress(name, 1.)
+
+    def onLoadProgress(self, name, value):
+        self.loadProgress[name] = value
+        self.progressBar.setValue(int(100 * np.mean(list(self.loadProgress.values()))))
+
+        loading = [n for n, v in six.iteritems(self.loadProgress) if v < 1.]
+        if loading:
+            self.ui.statusBar.showMessage('loading %s..' % ', '.join(loading))
+        else:
+            self.progressBar.hide()
+            self.ui.statusBar.clearMessage()
+
+    def onLoadFailed(self, name, message):
+        self.loadProgress.pop(name, None)
+        self.ui.statusBar.showMessage('failed to load %s' % message)
+        if not self.loadProgress:
+            self.progressBar.hide()
+
+    def clearVolumes(self):
+        """ Drop the volumes and everything derived from them, keeping the UI and settings. """
+        if self.loader is not None:
+            self.loader.shutdown()
+            self.loader = None
+            self.loadProgress = {}
+            self.progressBar.hide()
+        self.prefetcher.cancel()
+        self.refineTimer.stop()
+
+        for name in ('image', 'label', 'uncert'):
+            setattr(self, name + 'Volume', None)
+            self.renderer.set_volume(name, None)
+        self.volumeShape = None
+        self.volumeSpacing = None
+        self.renderer.spacing = None
+        self.cursorVoxel = None
+        self.volumeStatistics = {}
+        self.labelIndex = None
+        self.labelReport = None
+        self.setupStructureControls()
+
+        self.sliceCache.clear()
+        self.renderedState = None
+        self.dirtyInputs = set()
+        self.interacting = False
+        self.panelLevels = {}
+
+    def setCase(self, volumes, spacing, statistics=None, report=None):
+        """ Replace all volumes at once, e.g. with another case of a study, without rebuilding the UI.
+
+        Without a `report`, the per-label report is gathered here.
+        """
+        statistics = statistics or {}
+        self.clearVolumes()
+
+        for name in ('image', 'uncert', 'label'):
+            if volumes.get(name) is not None:
+                self.setVolume(name, volumes[name], spacing, statistics.get(name))
+        if report is not None:
+            self.setLabelReport(report)
+        else:
+            self.updateLabelReport()
+
+        if self.isVisible():
+            self.scheduler.flush()
+            for view in self.panelViews.values():
+                view.fitInView()
+            self.triPlanarView.fitInView()
+
+    def closeEvent(self, event):
+        if self.loader is not None:
+            self.loader.shutdown()
+        self.prefetcher.shutdown()
+        self.triPlanar.shutdown()
+        if self.layouts is not None:
+            self.layouts.shutdown()
+        if self.projections is not None:
+            self.projections.shutdown()
+        super().closeEvent(event)
+
+    def prepareLayouts(self):
+        """ Start building slice-contiguous copies of the volumes, and projection tables, for the current axis. """
+        if self.volumeShape is not None:
+            self.renderer.prepare_layouts(self.sliceAxis)
+            self.renderer.prepare_projections(self.sliceAxis, self.renderState().projection)
+
+    def setProfiling(self, enabled):
+        """ Switch the per-stage timing of rendering on or off. """
+        self.profiler.enabled = enabled
+        self.frameTimeLabel.setVisible(enabled)
+        if not enabled:
+            self.frameTimeLabel.clear()
+
+    def exportTrace(self, filename):
+        """ Write the recorded stages as Chrome trace events (chrome://tracing, Perfetto). """
+        self.profiler.save_trace(filename)
+
+    def showFrameTime(self):
+        frameTime = self.profiler.frame_time()
+        if frameTime is not None:
+            self.frameTimeLabel.setText('frame %.1f ms (%.0f fps)' % (1e3 * frameTime, 1. / frameTime))
+
+    def setupSliceControls(self, index=None):
+        nSlices = self.renderer.slice_count(self.sliceAxis)
+        if index is None:
+            index = nSlices//2
 
-        self.ui.spinBoxSliceIndex.setValue(nSlices//2)
         self.ui.spinBoxSliceIndex.setMinimum(0)
         self.ui.spinBoxSliceIndex.setMaximum(nSlices-1)
+        self.ui.spinBoxSliceIndex.setValue(index)
 
-        self.ui.sliderSliceIndex.setValue(nSlices//2)
         self.ui.sliderSliceIndex.setRange(0, nSlices-1)
+        self.ui.sliderSliceIndex.setValue(index)
         self.ui.sliderSliceIndex.setTracking(True)
 
-        self.ui.doubleSpinBoxImageWindow.setValue(3.0 * self.imageStd)
-        self.ui.doubleSpinBoxImageWindow.setSingleStep(0.05 * self.imageStd)
-        self.ui.doubleSpinBoxImageLevel.setValue(self.imageMean)
-        self.ui.doubleSpinBoxImageLevel.setSingleStep(0.05 * self.imageStd)
+        self.ui.spinBoxSlabThickness.setMaximum(nSlices)
+
+    def setupStructureControls(self):
+        self.ui.comboBoxStructure.clear()
+        self.ui.comboBoxStructure.addItem('Structure')
+        if self.labelIndex is None:
+            return
+        for label in self.labelIndex.labels:
+            self.ui.comboBoxStructure.addItem('label %d' % label, int(label))
+
+    def setupWindowControls(self, name):
+
+        if name not in mapWindowPresets:
+            return
+
+        if name == 'image':
+            self.ui.doubleSpinBoxImageWindow.setSingleStep(0.05 * self.imageStd)
+            self.ui.doubleSpinBoxImageLevel.setSingleStep(0.05 * self.imageStd)
+        elif name == 'uncert':
+            self.ui.doubleSpinBoxUncertWindow.setSingleStep(0.05 * self.uncertStd)
+            self.ui.doubleSpinBoxUncertLevel.setSingleStep(0.05 * self.uncertStd)
+
+        self.applyWindowPreset(name)
+
+    def setWindowPreset(self, name, preset):
+        """ Select a window/level preset of `image` or `uncert`; `Manual` or `None` keeps the current values. """
+        if preset == 'Manual':
+            preset = None
+        assert preset is None or preset in mapWindowPresets[name], 'unknown preset: %s' % preset
+
+        self.windowPresets[name] = preset
+
+        comboBox = self.presetComboBoxes[name]
+        comboBox.blockSignals(True)
+        comboBox.setCurrentText(preset or 'Manual')
+        comboBox.blockSignals(False)
+
+        self.applyWindowPreset(name)
+
+    def applyWindowPreset(self, name, request=True):
+
+        preset = self.windowPresets[name]
+        volume = getattr(self, name + 'Volume')
+        if preset is None or volume is None:
+            return
+
+        x = None
+        if preset in adaptiveWindowPresets:
+            x = self.renderer.get_projection(name, self.sliceAxis, int(self.sliceIndex), self.renderState().projection)
+
+        window, level = mapWindowPresets[name][preset](self.volumeStatistics[name], x)
+        self.setWindowLevel(name, window, level, request)
+
+    def setWindowLevel(self, name, window, level, request=True):
+
+        if getattr(self, name + 'WindowLevel') == [window, level]:
+            return
+
+        if name == 'image':
+            self.imageWindowLevel = [window, level]
+            spinBoxes = (self.ui.doubleSpinBoxImageWindow, self.ui.doubleSpinBoxImageLevel)
+        else:
+            self.uncertWindowLevel = [window, level]
+            spinBoxes = (self.ui.doubleSpinBoxUncertWindow, self.ui.doubleSpinBoxUncertLevel)
+
+        for spinBox, value in zip(spinBoxes, (window, level)):
+            spinBox.blockSignals(True)
+            spinBox.setValue(value)
+            spinBox.blockSignals(False)
+
+        if request:
+            self.scheduler.request()
+
+    def dropAdaptivePreset(self, name):
+        # manual edits take over from a preset that follows the slice
+        if self.windowPresets[name] in adaptiveWindowPresets:
+            self.setWindowPreset(name, None)
+
+    def show(self):
+        super().show()
+
+        if self.volumeShape is not None:
+            self.setupSliceControls()
+
+        if self.imageVolume is not None:
+            self.setupWindowControls('image')
         self.ui.doubleSpinBoxImageAlpha.setValue(self.imageAlpha)
 
-        uncertMin, uncertMax = 0., np.percentile(self.uncertVolume, 99)
-        self.ui.doubleSpinBoxUncertWindow.setValue(uncertMax - uncertMin)
-        self.ui.doubleSpinBoxUncertWindow.setSingleStep(0.05 * self.uncertStd)
-        self.ui.doubleSpinBoxUncertLevel.setValue((uncertMax - uncertMin)/2.)
-        self.ui.doubleSpinBoxUncertLevel.setSingleStep(0.05 * self.uncertStd)
+        if self.uncertVolume is not None:
+            self.setupWindowControls('uncert')
         self.ui.doubleSpinBoxUncertAlpha.setValue(self.uncertAlpha)
 
-        self.update()
+        self.scheduler.request()
 
     def setSliceAxis(self, value):
+        if value == 'Oblique':
+            value = ObliquePlane(self.obliqueBase, *self.obliqueAngles)
+        elif not isinstance(value, ObliquePlane):
+            self.obliqueBase = value
         self.sliceAxis = value
-        nSlices = self.imageVolume.shape[mapSliceAxis[value]]
 
-        self.ui.spinBoxSliceIndex.setValue(nSlices//2)
-        self.ui.spinBoxSliceIndex.setMinimum(0)
-        self.ui.spinBoxSliceIndex.setMaximum(nSlices-1)
+        if self.volumeShape is None:
+            return
 
-        self.ui.sliderSliceIndex.setValue(nSlices//2)
-        self.ui.sliderSliceIndex.setRange(0, nSlices-1)
-        self.ui.sliderSliceIndex.setTracking(True)
+        self.setupSliceControls()
+        self.prepareLayouts()
+        self.refit()
+
+    def setObliqueAngle(self, i, value):
+        """ Set the pitch (0) or yaw (1) of the oblique plane, turning it about the center of the view. """
+        self.obliqueAngles[i] = value
+        if not isinstance(self.sliceAxis, ObliquePlane) or self.volumeShape is None:
+            return
+
+        rows, cols = self.renderer.slice_shape(self.sliceAxis)
+        center = self.renderer.oblique_geometry(self.sliceAxis).voxel(self.sliceIndex, rows / 2., cols / 2.)
+        self.sliceAxis = ObliquePlane(self.obliqueBase, *self.obliqueAngles)
+        index = self.renderer.oblique_geometry(self.sliceAxis).position(center)[0]
+        nSlices = self.renderer.slice_count(self.sliceAxis)
 
-        self.update()
+        self.setupSliceControls(int(np.clip(np.rint(index), 0, nSlices - 1)))
+        self.prepareLayouts()
+        self.refit()
+
+    def refit(self):
+
+        self.scheduler.request()
+        self.scheduler.flush()
 
         # re-fit
         self.viewImage.fitInView()
@@ -230,17 +710,82 @@ class AnatomyViewerApp(QtWidgets.QMainWindow):
         self.viewUncert.fitInView()
         self.viewUncertOverlay.fitInView()
 
+    def setProjection(self, mode):
+        """ Show the maximum (`max`), mean (`mean`) or minimum (`min`) intensity over a slab, or slices for None. """
+        self.projectionMode = mode
+        self.ui.comboBoxProjection.blockSignals(True)
+        self.ui.comboBoxProjection.setCurrentIndex(list(mapProjectionModes.values()).index(mode))
+        self.ui.comboBoxProjection.blockSignals(False)
+        if self.volumeShape is not None:
+            self.renderer.prepare_projections(self.sliceAxis, self.renderState().projection)
+        self.scheduler.request()
+
+    def setSlabThickness(self, value):
+        """ Number of slices, centered on the current one, that projections are taken over. """
+        # NOTE: at most the slices along the axis, which the spin box is limited to
+        self.slabThickness = int(np.clip(value, 1, self.ui.spinBoxSlabThickness.maximum()))
+        self.ui.spinBoxSlabThickness.blockSignals(True)
+        self.ui.spinBoxSlabThickness.setValue(self.slabThickness)
+        self.ui.spinBoxSlabThickness.blockSignals(False)
+        if self.projectionMode is not None:
+            self.scheduler.request()
+
+    def setTriPlanar(self, enabled):
+        """ Show or hide the axial, coronal and sagittal planes through the cursor below the panels. """
+        self.ui.checkBoxTriPlanar.blockSignals(True)
+        self.ui.checkBoxTriPlanar.setChecked(enabled)
+        self.ui.checkBoxTriPlanar.blockSignals(False)
+
+        self.triPlanarView.setVisible(enabled)
+        if enabled:
+            # NOTE: inputs that changed while hidden were not tracked
+            self.triPlanar.invalidate()
+            self.scheduler.request()
+
+    def setTriPlanarPanel(self, panel):
+        """ Panel shown in the planes of the tri-planar view, e.g. `labelOverlay`. """
+        self.triPlanar.set_panel(panel)
+        self.triPlanarView.setPanel(panel)
+        self.scheduler.request()
+
+    def setCursorPosition(self, axis, row, col):
+        """ Move the cursor to pixel `(row, col)` of the tri-planar plane along `axis`. """
+        if self.volumeShape is None:
+            return
+        index = self.cursorVoxel[mapSliceAxis[axis]] + 0.5
+        point = get_slice_voxel((row, col), index, self.volumeShape, axis)
+        self.cursorVoxel = [int(np.clip(np.floor(p), 0, n - 1)) for p, n in zip(point, self.volumeShape)]
+
+        self.followCursor()
+
+    def addCursorIndex(self, axis, value):
+        """ Move the cursor by `value` slices along `axis`, scrolling through the plane along it. """
+        if self.volumeShape is None:
+            return
+        i = mapSliceAxis[axis]
+        self.cursorVoxel[i] = int(np.clip(self.cursorVoxel[i] + int(value), 0, self.volumeShape[i] - 1))
+        self.markInteraction()
+        self.followCursor()
+
+    def followCursor(self):
+        # NOTE: the panels follow the cursor along an orthogonal axis
+        if self.sliceAxis in mapSliceAxis:
+            self.ui.spinBoxSliceIndex.setValue(self.cursorVoxel[mapSliceAxis[self.sliceAxis]])
+        self.scheduler.request()
+
     def setImageWindow(self, value):
+        self.dropAdaptivePreset('image')
         self.imageWindowLevel[0] = value
-        self.update()
+        self.scheduler.request()
 
     def setImageLevel(self, value):
+        self.dropAdaptivePreset('image')
         self.imageWindowLevel[1] = value
-        self.update()
+        self.scheduler.request()
 
     def setImageAlpha(self, value):
         self.imageAlpha = value
-        self.update()
+        self.scheduler.request()
 
     def addImageWindow(self, value):
         self.imageWindowLevel[0] += value * 0.05 * self.imageStd
@@ -251,12 +796,14 @@ class AnatomyViewerApp(QtWidgets.QMainWindow):
         self.ui.doubleSpinBoxImageLevel.setValue(self.imageWindowLevel[1])
 
     def setUncertWindow(self, value):
+        self.dropAdaptivePreset('uncert')
         self.uncertWindowLevel[0] = value
-        self.update()
+        self.scheduler.request()
 
     def setUncertLevel(self, value):
+        self.dropAdaptivePreset('uncert')
         self.uncertWindowLevel[1] = value
-        self.update()
+        self.scheduler.request()
 
     def addUncertWindow(self, value):
         self.uncertWindowLevel[0] += value * 0.05 * self.uncertStd
@@ -268,63 +815,235 @@ class AnatomyViewerApp(QtWidgets.QMainWindow):
 
     def setUncertAlpha(self, value):
         self.uncertAlpha = value
-        self.update()
+        self.scheduler.request()
+
+    def setLabelColorMap(self, cmap):
+        self.labelColorMap = cmap
+        self.invalidateColorMap('label_cmap', self.renderer.set_label_cmap, cmap)
+        self.labelColorTable = color_table(self.renderer.label_table)
+
+    def setUncertColorMap(self, cmap):
+        self.uncertColorMap = cmap
+        self.invalidateColorMap('uncert_cmap', self.renderer.set_uncert_cmap, cmap)
+
+    def invalidateColorMap(self, name, setter, cmap):
+        self.prefetcher.cancel()
+        setter(cmap)
+        panels = invalidated_panels(set([name]))
+        if self.renderer.indexed_labels:
+            # NOTE: indexed label slices are colored by the view and stay valid
+            panels = tuple(p for p in panels if p != 'label')
+        self.sliceCache.evict(lambda key: key[0] in panels)
+        self.dirtyInputs.add(name)
+        self.scheduler.request()
 
     def setSliceIndex(self, value):
         self.sliceIndex = value
         self.ui.sliderSliceIndex.setValue(value)
-        self.update()
+        self.scheduler.request()
 
     def addSliceIndex(self, value):
-        nSlices = self.imageVolume.shape[mapSliceAxis[self.sliceAxis]]
-        self.sliceIndex = np.clip(self.sliceIndex + int(value), 0, nSlices - 1)
+        if self.volumeShape is None:
+            return
+        nSlices = self.renderer.slice_count(self.sliceAxis)
+        self.sliceDirection = 1 if value >= 0 else -1
+        index = np.clip(self.sliceIndex + int(value), 0, nSlices - 1)
+
+        if self.skipEmptySlices and self.labelIndex is not None and int(value) != 0 and \
+                self.sliceAxis in mapSliceAxis:
+            axis = mapSliceAxis[self.sliceAxis]
+            if not self.labelIndex.nonempty[axis][index]:
+                index = self.labelIndex.next_nonempty(axis, index - self.sliceDirection, self.sliceDirection)
+                if index is None:
+                    index = self.sliceIndex
+
+        self.sliceIndex = index
+        self.markInteraction()
         self.ui.sliderSliceIndex.setValue(self.sliceIndex)
         self.ui.spinBoxSliceIndex.setValue(self.sliceIndex)
-        self.update()
+        self.scheduler.request()
+
+    def setSkipEmptySlices(self, value):
+        self.skipEmptySlices = value
+
+    def selectStructure(self, item):
+        label = self.ui.comboBoxStructure.itemData(item)
+        if label is not None:
+            self.jumpToLabel(label)
+
+    def jumpToLabel(self, label):
+        """ Show the middle slice of `label` along the current axis and center the views on it. """
+        if self.labelIndex is None:
+            return
+        box = self.labelIndex.bounding_box(label)
+        if box is None:
+            return
+
+        center = [(lo + hi) / 2. for lo, hi in box]
+        if isinstance(self.sliceAxis, ObliquePlane):
+            geometry = self.renderer.oblique_geometry(self.sliceAxis)
+            index, row, col = geometry.position(center)
+            self.ui.spinBoxSliceIndex.setValue(int(np.clip(np.rint(index), 0, geometry.n_slices - 1)))
+        else:
+            lo, hi = box[mapSliceAxis[self.sliceAxis]]
+            self.ui.spinBoxSliceIndex.setValue((lo + hi - 1) // 2)
+            row, col = get_slice_position(center, self.volumeShape, self.sliceAxis)
+
+        spacing = self.renderer.slice_spacing(self.sliceAxis) or (1., 1.)
+        for view in self.panelViews.values():
+            view.centerOn(col * spacing[1], row * spacing[0])
 
     def slideSliceIndex(self, value):
         self.sliceIndex = value
+        self.markInteraction()
         self.ui.spinBoxSliceIndex.setValue(value)
-        self.update()
+        self.scheduler.request()
+
+    def markInteraction(self):
+        if self.pyramidLevels > 0:
+            self.interacting = True
+            self.refineTimer.start()
+
+    def refine(self):
+        """ Re-render the panels that were drawn from a coarse level at full resolution. """
+        self.interacting = False
+        if any(self.panelLevels.values()):
+            self.scheduler.request()
+
+    def renderLevel(self):
+        """ Pyramid level to draw from: coarse while scrolling, coarser when zoomed out on a small view. """
+        if not self.interacting or self.pyramidLevels == 0:
+            return 0
+
+        level = 1
+        view = self.viewImage
+        if view.zoom == 0:
+            rows, cols = self.renderer.slice_shape(self.sliceAxis)
+            viewport = view.viewport().rect()
+            ratio = min(rows / max(1, viewport.height()), cols / max(1, viewport.width()))
+            while level < self.pyramidLevels and ratio >= 2 ** (level + 1):
+                level += 1
+        return level
+
+    def renderState(self):
+        projection = None if self.projectionMode is None else (self.projectionMode, self.slabThickness)
+        return RenderState(self.sliceAxis, int(self.sliceIndex),
+                           tuple(self.imageWindowLevel), tuple(self.uncertWindowLevel),
+                           self.imageAlpha, self.uncertAlpha, projection)
+
+    def renderPanels(self, state, panels=panelNames, level=0):
+        """ Panels from the cache or rendered, with their spacings and pyramid levels.
+
+        Coarse panels rendered with `level` > 0 are not cached; cached full
+        resolution panels are used whenever they are available.
+        """
+        images = {}
+        spacings = {}
+        levels = {}
+        missing = []
+
+        spacing = self.renderer.slice_spacing(state.axis)
+
+        for name in panels:
+            image = self.sliceCache.get(panel_key(name, state))
+            if image is None:
+                missing.append(name)
+            else:
+                images[name], spacings[name], levels[name] = image, spacing, 0
+
+        if missing and level > 0:
+            rendered, coarseSpacing, level = self.renderer.render_coarse(state, missing, level)
+            if level > 0:
+                for name in missing:
+                    images[name], spacings[name], levels[name] = rendered[name], coarseSpacing, level
+                return images, spacings, levels
+
+        if missing:
+            rendered, _ = self.renderer.render(state, missing)
+            with self.profiler.stage('cache.put'):
+                for name in missing:
+                    if self.sliceCache.max_bytes > 0:
+                        images[name] = rendered[name].copy()
+                        self.sliceCache.put(panel_key(name, state), images[name])
+                    else:
+                        images[name] = rendered[name]
+                    spacings[name], levels[name] = spacing, 0
+
+        return images, spacings, levels
 
     def update(self):
 
-        # slicing
-        if self.sliceAxis == 'Axial':
-            imageSlice = self.imageVolume[:,:,self.sliceIndex].T
-            labelSlice = self.labelVolume[:,:,self.sliceIndex].T
-            uncertSlice = self.uncertVolume[:,:,self.sliceIndex].T
-            spacing = (self.volumeSpacing[1], self.volumeSpacing[0])
-        elif self.sliceAxis == 'Coronal':
-            imageSlice = self.imageVolume[:,self.sliceIndex,::-1].T
-            labelSlice = self.labelVolume[:,self.sliceIndex,::-1].T
-            uncertSlice = self.uncertVolume[:,self.sliceIndex,::-1].T
-            spacing = (self.volumeSpacing[2], self.volumeSpacing[0])
-        elif self.sliceAxis == 'Sagittal':
-            imageSlice = self.imageVolume[self.sliceIndex,:,::-1].T
-            labelSlice = self.labelVolume[self.sliceIndex,:,::-1].T
-            uncertSlice = self.uncertVolume[self.sliceIndex,:,::-1].T
-            spacing = (self.volumeSpacing[2], self.volumeSpacing[1])
-
-        # image
-        imageWindow, imageLevel = self.imageWindowLevel
-        imageSlice = clim(imageSlice, (imageLevel - imageWindow/2., imageLevel + imageWindow/2.)).astype(np.uint8)
-        imageSlice = cv2.cvtColor(imageSlice, cv2.COLOR_GRAY2BGR)
-
-        # label
-        labelSlice = lut(labelSlice.astype(np.uint8), self.labelColorMap)
-        labelOverlaySlice = cv2.addWeighted(imageSlice, 1.0 - self.imageAlpha, labelSlice, self.imageAlpha, 0)
-
-        # uncertainty
-        uncertWindow, uncertLevel = self.uncertWindowLevel
-        uncertSlice = clim(uncertSlice, (uncertLevel - uncertWindow/2., uncertLevel + uncertWindow/2.)).astype(np.uint8)
-        uncertSlice = lut(uncertSlice, self.uncertColorMap)
-
-        uncertOverlaySlice = cv2.addWeighted(imageSlice, 1.0 - self.uncertAlpha, uncertSlice, self.uncertAlpha, 0)
-
-        # send to view
-        self.viewImage.setImage(imageSlice, spacing)
-        self.viewLabel.setImage(labelSlice, spacing)
-        self.viewLabelOverlay.setImage(labelOverlaySlice, spacing)
-        self.viewUncert.setImage(uncertSlice, spacing)
-        self.viewUncertOverlay.setImage(uncertOverlaySlice, spacing)
+        if self.volumeShape is None:
+            return
+
+        with self.profiler.stage('presets'):
+            for name in ('image', 'uncert'):
+                if self.windowPresets[name] in adaptiveWindowPresets:
+                    self.applyWindowPreset(name, request=False)
+
+        state = self.renderState()
+        dirtyInputs = self.dirtyInputs
+        panels = invalidated_panels(changed_inputs(self.renderedState, state) | dirtyInputs)
+        level = self.renderLevel()
+        if level == 0:
+            # NOTE: refine whatever is still shown from a coarse level
+            panels = tuple(set(panels) | set(n for n, l in self.panelLevels.items() if l > 0))
+        panels = tuple(name for name in panelNames
+                       if name in panels and name in self.renderer.available_panels())
+        self.renderedState = state
+        self.dirtyInputs = set()
+
+        planes = {}
+        if self.triPlanarView.isVisible():
+            if self.sliceAxis in mapSliceAxis:
+                self.cursorVoxel[mapSliceAxis[self.sliceAxis]] = state.index
+            planes = plane_states(state, self.cursorVoxel)
+
+        if not panels and not planes:
+            return
+
+        profiler = self.profiler
+        with profiler.frame():
+            if panels:
+                with profiler.stage('renderPanels'):
+                    images, spacings, levels = self.renderPanels(state, panels, level)
+                self.panelLevels.update(levels)
+
+                # send to view
+                with profiler.stage('setImage', 'qt'):
+                    for name in panels:
+                        if name == 'label' and self.renderer.indexed_labels:
+                            self.panelViews[name].setImage(images[name], spacings[name], self.labelColorTable)
+                        else:
+                            self.panelViews[name].setImage(images[name], spacings[name])
+
+            if planes:
+                self.updateTriPlanar(planes, dirtyInputs)
+
+            # prefetch the neighbours
+            if panels:
+                with profiler.stage('prefetch'):
+                    nSlices = self.renderer.slice_count(state.axis)
+                    self.prefetcher.prefetch(state, self.sliceDirection, nSlices)
+
+        if profiler.enabled:
+            self.showFrameTime()
+
+    def updateTriPlanar(self, planes, dirtyInputs):
+        """ Re-render the planes of the tri-planar view whose slice or inputs changed, and move the crosshairs. """
+        profiler = self.profiler
+        panel = self.triPlanar.panel
+
+        with profiler.stage('renderPlanes'):
+            images = self.triPlanar.render(planes, dirtyInputs)
+
+        with profiler.stage('setImage', 'qt'):
+            for axis, view in six.iteritems(self.triPlanarView.views):
+                if axis in images:
+                    spacing = self.renderer.slice_spacing(axis)
+                    if panel == 'label' and self.renderer.indexed_labels:
+                        view.setImage(images[axis], spacing, self.labelColorTable)
+                    else:
+                        view.setImage(images[axis], spacing)
+                point = [c + 0.5 for c in self.cursorVoxel]
+                view.setCrosshair(get_slice_position(point, self.volumeShape, axis))
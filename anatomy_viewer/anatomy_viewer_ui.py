@@ -2,9 +2,10 @@
 
 # Form implementation generated from reading ui file 'anatomy_viewer.ui'
 #
-# Created by: PyQt5 UI code generator 5.13.2
+# Created by: PyQt5 UI code generator 5.15.11
 #
-# WARNING! All changes made in this file will be lost!
+# WARNING: Any manual changes made to this file will be lost when pyuic5 is
+# run again.  Do not edit this file unless you know what you are doing.
 
 
 from PyQt5 import QtCore, QtGui, QtWidgets
@@ -110,6 +111,50 @@ class Ui_AnatomyViewer(object):
         self.comboBoxSliceAxis.addItem("")
         self.comboBoxSliceAxis.addItem("")
         self.comboBoxSliceAxis.addItem("")
+        self.comboBoxSliceAxis.addItem("")
+        self.comboBoxImagePreset = QtWidgets.QComboBox(self.centralWidget)
+        self.comboBoxImagePreset.setGeometry(QtCore.QRect(246, 614, 123, 22))
+        self.comboBoxImagePreset.setObjectName("comboBoxImagePreset")
+        self.comboBoxUncertPreset = QtWidgets.QComboBox(self.centralWidget)
+        self.comboBoxUncertPreset.setGeometry(QtCore.QRect(389, 614, 123, 22))
+        self.comboBoxUncertPreset.setObjectName("comboBoxUncertPreset")
+        self.comboBoxStructure = QtWidgets.QComboBox(self.centralWidget)
+        self.comboBoxStructure.setGeometry(QtCore.QRect(10, 614, 213, 22))
+        self.comboBoxStructure.setObjectName("comboBoxStructure")
+        self.comboBoxStructure.addItem("")
+        self.checkBoxSkipEmpty = QtWidgets.QCheckBox(self.centralWidget)
+        self.checkBoxSkipEmpty.setGeometry(QtCore.QRect(10, 642, 213, 20))
+        self.checkBoxSkipEmpty.setObjectName("checkBoxSkipEmpty")
+        self.doubleSpinBoxPitch = QtWidgets.QDoubleSpinBox(self.centralWidget)
+        self.doubleSpinBoxPitch.setGeometry(QtCore.QRect(10, 668, 103, 22))
+        self.doubleSpinBoxPitch.setDecimals(1)
+        self.doubleSpinBoxPitch.setMinimum(-90.0)
+        self.doubleSpinBoxPitch.setMaximum(90.0)
+        self.doubleSpinBoxPitch.setSingleStep(5.0)
+        self.doubleSpinBoxPitch.setObjectName("doubleSpinBoxPitch")
+        self.doubleSpinBoxYaw = QtWidgets.QDoubleSpinBox(self.centralWidget)
+        self.doubleSpinBoxYaw.setGeometry(QtCore.QRect(120, 668, 103, 22))
+        self.doubleSpinBoxYaw.setDecimals(1)
+        self.doubleSpinBoxYaw.setMinimum(-90.0)
+        self.doubleSpinBoxYaw.setMaximum(90.0)
+        self.doubleSpinBoxYaw.setSingleStep(5.0)
+        self.doubleSpinBoxYaw.setObjectName("doubleSpinBoxYaw")
+        self.checkBoxTriPlanar = QtWidgets.QCheckBox(self.centralWidget)
+        self.checkBoxTriPlanar.setGeometry(QtCore.QRect(246, 642, 123, 20))
+        self.checkBoxTriPlanar.setObjectName("checkBoxTriPlanar")
+        self.comboBoxProjection = QtWidgets.QComboBox(self.centralWidget)
+        self.comboBoxProjection.setGeometry(QtCore.QRect(246, 668, 123, 22))
+        self.comboBoxProjection.setObjectName("comboBoxProjection")
+        self.comboBoxProjection.addItem("")
+        self.comboBoxProjection.addItem("")
+        self.comboBoxProjection.addItem("")
+        self.comboBoxProjection.addItem("")
+        self.spinBoxSlabThickness = QtWidgets.QSpinBox(self.centralWidget)
+        self.spinBoxSlabThickness.setGeometry(QtCore.QRect(389, 668, 123, 22))
+        self.spinBoxSlabThickness.setMinimum(1)
+        self.spinBoxSlabThickness.setMaximum(9999)
+        self.spinBoxSlabThickness.setProperty("value", 9)
+        self.spinBoxSlabThickness.setObjectName("spinBoxSlabThickness")
         self.textBrowserShape = QtWidgets.QTextBrowser(self.centralWidget)
         self.textBrowserShape.setGeometry(QtCore.QRect(8, 738, 251, 61))
         self.textBrowserShape.setAutoFillBackground(True)
@@ -152,5 +197,18 @@ class Ui_AnatomyViewer(object):
         self.comboBoxSliceAxis.setItemText(0, _translate("AnatomyViewer", "Axial"))
         self.comboBoxSliceAxis.setItemText(1, _translate("AnatomyViewer", "Sagittal"))
         self.comboBoxSliceAxis.setItemText(2, _translate("AnatomyViewer", "Coronal"))
+        self.comboBoxSliceAxis.setItemText(3, _translate("AnatomyViewer", "Oblique"))
+        self.comboBoxStructure.setItemText(0, _translate("AnatomyViewer", "Structure"))
+        self.checkBoxSkipEmpty.setText(_translate("AnatomyViewer", "Skip empty slices"))
+        self.doubleSpinBoxPitch.setPrefix(_translate("AnatomyViewer", "pitch "))
+        self.doubleSpinBoxPitch.setSuffix(_translate("AnatomyViewer", "°"))
+        self.doubleSpinBoxYaw.setPrefix(_translate("AnatomyViewer", "yaw "))
+        self.doubleSpinBoxYaw.setSuffix(_translate("AnatomyViewer", "°"))
+        self.checkBoxTriPlanar.setText(_translate("AnatomyViewer", "Tri-planar"))
+        self.comboBoxProjection.setItemText(0, _translate("AnatomyViewer", "Slice"))
+        self.comboBoxProjection.setItemText(1, _translate("AnatomyViewer", "MIP"))
+        self.comboBoxProjection.setItemText(2, _translate("AnatomyViewer", "Mean"))
+        self.comboBoxProjection.setItemText(3, _translate("AnatomyViewer", "MinIP"))
+        self.spinBoxSlabThickness.setPrefix(_translate("AnatomyViewer", "slab "))
         self.labelShape.setText(_translate("AnatomyViewer", "Shape:"))
         self.labelScalar.setText(_translate("AnatomyViewer", "Scalar:"))
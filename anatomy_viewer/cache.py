@@ -0,0 +1,63 @@
+from __future__ import absolute_import
+
+import collections
+import threading
+
+
+class LRUCache(object):
+    """ Least recently used cache bounded by the total `nbytes` of its values.
+
+    The cache is safe to share between the GUI thread and prefetch workers.
+    """
+
+    def __init__(self, max_bytes):
+        assert max_bytes >= 0, '`max_bytes` should be >= 0..'
+        self.max_bytes = max_bytes
+        self._data = collections.OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, None)
+            if value is None:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        nbytes = value.nbytes
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._nbytes -= old.nbytes
+
+            self._data[key] = value
+            self._nbytes += nbytes
+
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+
+    def evict(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                self._nbytes -= self._data.pop(key).nbytes
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._nbytes = 0
@@ -0,0 +1,68 @@
+from __future__ import absolute_import
+
+import os
+import csv
+
+from .chunked import is_chunked
+
+_roles = ('image', 'label', 'uncert')
+_extensions = ('.nii.gz', '.mhd.gz', '.mhd', '.mha', '.nii', '.nrrd', '.npy', '.chunks')
+
+
+def case_name(filename):
+    """ File name of a volume without its extension. """
+    name = os.path.basename(filename)
+    for ext in _extensions:
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return os.path.splitext(name)[0]
+
+
+def find_cases(directory):
+    """ Cases of a dataset directory as a sorted list of `(name, [image, label, uncert])`.
+
+    Volumes are matched by the words `image`, `label` and `uncert` in their
+    file names; the rest of the path names the case, so that both one
+    directory per case and `<case>_image.mhd` style flat layouts work.
+    Chunked volumes written by `muscle_convert` are found as well.
+    """
+    cases = {}
+    for root, dirs, files in os.walk(directory):
+        # NOTE: chunked volumes are directories, see `write_chunked`
+        chunked = [d for d in dirs if is_chunked(os.path.join(root, d))]
+        dirs[:] = [d for d in dirs if d not in chunked]
+        for filename in files + chunked:
+            if not filename.lower().endswith(_extensions):
+                continue
+            stem = case_name(filename)
+            for role in _roles:
+                position = stem.lower().find(role)
+                if position < 0:
+                    continue
+                rest = (stem[:position] + stem[position + len(role):]).strip('_-. ')
+                name = os.path.normpath(os.path.relpath(os.path.join(root, rest), directory))
+                if name == os.curdir:
+                    name = os.path.basename(os.path.abspath(directory))
+                cases.setdefault(name, {})[role] = os.path.join(root, filename)
+                break
+
+    return [(name, [files[role] for role in _roles]) for name, files in sorted(cases.items())
+            if all(role in files for role in _roles)]
+
+
+def read_manifest(filename):
+    """ Cases from a CSV file with the columns `image`, `label`, `uncertainty` and optionally `name`. """
+    root = os.path.dirname(os.path.abspath(filename))
+    cases = []
+    with open(filename) as f:
+        for row in csv.DictReader(f):
+            files = [os.path.join(root, row[key]) for key in ('image', 'label', 'uncertainty')]
+            cases.append((row.get('name') or case_name(files[0]), files))
+    return cases
+
+
+def load_cases(path):
+    """ Cases of a dataset directory or a CSV manifest. """
+    if os.path.isdir(path):
+        return find_cases(path)
+    return read_manifest(path)
@@ -0,0 +1,214 @@
+from __future__ import absolute_import
+
+import os
+import re
+import json
+import zlib
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .cache import LRUCache
+
+_format = 'anatomy_viewer.chunked'
+_version = 1
+_header = 'header.json'
+_chunk_pattern = re.compile(r'^\d+\.\d+\.\d+$')
+
+
+def is_chunked(path):
+    """ Whether `path` is a directory written by `write_chunked`. """
+    return os.path.isfile(os.path.join(path, _header))
+
+
+def _chunk_name(index):
+    return '%d.%d.%d' % index
+
+
+def write_chunked(volume, path, spacing=None, origin=None, direction=None,
+                  chunks=(64, 64, 64), level=1, max_workers=None):
+    """ Write an (x, y, z) volume as a directory of zlib-compressed chunks with a JSON header.
+
+    `volume` is read one band of chunks along the last axis at a time, so
+    memory-mapped volumes do not have to fit in memory. Chunks of zeros are
+    not written at all and read back as zeros. A volume already written to
+    `path` is removed first.
+    """
+    assert volume.ndim == 3, '`volume` should be 3D..'
+    chunks = tuple(int(min(c, n)) for c, n in zip(chunks, volume.shape))
+    assert all(c > 0 for c in chunks), '`chunks` should be > 0..'
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    # NOTE: chunks left by an earlier volume would read back in place of the zeros that are not written
+    if is_chunked(path):
+        os.remove(os.path.join(path, _header))
+    for name in os.listdir(path):
+        if _chunk_pattern.match(name):
+            os.remove(os.path.join(path, name))
+
+    header = {
+        'format': _format,
+        'version': _version,
+        'shape': [int(n) for n in volume.shape],
+        'dtype': np.dtype(volume.dtype).str,
+        'chunks': list(chunks),
+        'compression': 'zlib',
+        'spacing': [float(s) for s in (spacing if spacing is not None else np.ones(3))],
+        'origin': [float(o) for o in (origin if origin is not None else np.zeros(3))],
+        'direction': [float(d) for d in (direction if direction is not None else np.eye(3).ravel())],
+    }
+
+    def write(item):
+        index, chunk = item
+        if not chunk.any():
+            return
+        with open(os.path.join(path, _chunk_name(index)), 'wb') as f:
+            f.write(zlib.compress(np.ascontiguousarray(chunk).tobytes(), level))
+
+    cx, cy, cz = chunks
+    nx, ny, nz = volume.shape
+    # NOTE: zlib releases the GIL, so chunks of a band are compressed in parallel
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for k in range(0, -(-nz // cz)):
+            band = np.asarray(volume[:,:,k*cz:(k+1)*cz])
+            items = [((i, j, k), band[i*cx:(i+1)*cx, j*cy:(j+1)*cy])
+                     for i in range(-(-nx // cx)) for j in range(-(-ny // cy))]
+            list(executor.map(write, items))
+
+    # NOTE: the header goes last, so that an interrupted conversion is not mistaken for a volume
+    with open(os.path.join(path, _header), 'w') as f:
+        json.dump(header, f, indent=2)
+
+
+def _axis_index(key, n):
+    """ `(lo, hi, local key)` of one axis: the range to read and how to index into it. """
+    if isinstance(key, slice):
+        start, stop, step = key.indices(n)
+        count = len(range(start, stop, step))
+        if count == 0:
+            return 0, 0, slice(0, 0)
+        last = start + (count - 1) * step
+        lo, hi = min(start, last), max(start, last) + 1
+        stop = last - lo - 1 if step < 0 else last - lo + 1
+        return lo, hi, slice(start - lo, stop if stop >= 0 else None, step)
+
+    index = int(key)
+    if index < 0:
+        index += n
+    if not 0 <= index < n:
+        raise IndexError('index %d is out of bounds for axis with size %d' % (key, n))
+    return index, index + 1, 0
+
+
+class ChunkedVolume(object):
+    """ Lazily indexed volume stored by `write_chunked`.
+
+    Indexing with integers and slices reads and decompresses only the chunks
+    that intersect the requested region and returns an `np.ndarray`.
+    Decompressed chunks are kept in an LRU cache of `cache_bytes`, shared by
+    all threads reading from the volume, so scrolling through neighbouring
+    slices mostly hits the cache.
+    """
+
+    ndim = 3
+
+    def __init__(self, path, cache_bytes=256*1024**2):
+
+        with open(os.path.join(path, _header)) as f:
+            header = json.load(f)
+        if header.get('format') != _format or header.get('version', 0) > _version:
+            raise ValueError('%s is not a chunked volume of a supported version' % path)
+
+        self.path = path
+        self.shape = tuple(header['shape'])
+        self.dtype = np.dtype(header['dtype'])
+        self.chunks = tuple(header['chunks'])
+        self.spacing = np.array(header['spacing'])
+        self.origin = np.array(header['origin'])
+        self.direction = np.array(header['direction']).reshape(3, 3)
+        self.cache = LRUCache(cache_bytes)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        """ Size of the decompressed volume, as for `np.ndarray`. """
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return 'ChunkedVolume(%r, shape=%s, dtype=%s)' % (self.path, self.shape, self.dtype)
+
+    def chunk(self, index):
+        """ Decompressed chunk `(i, j, k)` as a read-only array. """
+        chunk = self.cache.get(index)
+        if chunk is not None:
+            return chunk
+
+        shape = tuple(min(c, n - i * c) for i, c, n in zip(index, self.chunks, self.shape))
+        filename = os.path.join(self.path, _chunk_name(index))
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                chunk = np.frombuffer(zlib.decompress(f.read()), self.dtype).reshape(shape)
+        else:
+            chunk = np.zeros(shape, self.dtype)
+            chunk.flags.writeable = False
+
+        self.cache.put(index, chunk)
+        return chunk
+
+    def read(self, lo, hi):
+        """ Box `[lo, hi)` of the volume, assembled from the chunks that intersect it. """
+        out = np.empty(tuple(h - l for l, h in zip(lo, hi)), self.dtype)
+        if out.size == 0:
+            return out
+
+        ranges = [range(l // c, (h - 1) // c + 1) for l, h, c in zip(lo, hi, self.chunks)]
+        for index in itertools.product(*ranges):
+            start = [i * c for i, c in zip(index, self.chunks)]
+            a = [max(l, s) for l, s in zip(lo, start)]
+            b = [min(h, s + c) for h, s, c in zip(hi, start, self.chunks)]
+            src = tuple(slice(x - s, y - s) for x, y, s in zip(a, b, start))
+            dst = tuple(slice(x - l, y - l) for x, y, l in zip(a, b, lo))
+            out[dst] = self.chunk(index)[src]
+        return out
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i+1:]
+        if len(key) > self.ndim:
+            raise IndexError('too many indices for a %dD volume' % self.ndim)
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        lo, hi, local = zip(*[_axis_index(k, n) for k, n in zip(key, self.shape)])
+        return self.read(lo, hi)[local]
+
+    def __array__(self, dtype=None, copy=None):
+        volume = self[...]
+        return volume if dtype is None else volume.astype(dtype)
+
+    def _reduce(self, function):
+        # NOTE: bands along the last axis, so every chunk is read once
+        step = self.chunks[2]
+        return function([function(self[:,:,z0:z0+step]) for z0 in range(0, self.shape[2], step)])
+
+    def min(self):
+        return self._reduce(np.min)
+
+    def max(self):
+        return self._reduce(np.max)
+
+
+def read_chunked(path, cache_bytes=256*1024**2):
+    """ Open a chunked volume as `(ChunkedVolume, spacing)`, like `load_volume`. """
+    volume = ChunkedVolume(path, cache_bytes)
+    return volume, volume.spacing
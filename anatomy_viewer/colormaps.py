@@ -0,0 +1,26 @@
+from __future__ import absolute_import
+
+import numpy as np
+
+# NOTE: the control points of matplotlib's `jet`, as (x, value) per channel
+_jet_segments = (
+    ((0., 0.), (0.35, 0.), (0.66, 1.), (0.89, 1.), (1., 0.5)),
+    ((0., 0.), (0.125, 0.), (0.375, 1.), (0.64, 1.), (0.91, 0.), (1., 0.)),
+    ((0., 0.5), (0.11, 1.), (0.34, 1.), (0.65, 0.), (1., 0.)),
+)
+
+
+def jet(n=256):
+    """ (n, 3) RGB table of the `jet` colormap, without matplotlib. """
+    x = np.linspace(0., 1., n)
+    return np.stack([np.interp(x, *zip(*segments)) for segments in _jet_segments], axis=1)
+
+
+default_label_cmap = np.array([
+    [0,0,0], [1,1,1], [1,1,1], [0,1,1], [0.75,1,0.25],
+    [1,1,0], [0,1,0], [1,0.5,0.5], [1,0.5,0.5], [0.5,0,0.5],
+    [0,0,1], [1,0,0], [1,0,1], [1,0.5,0], [0,1,1],
+    [1,0,0], [1,1,0], [1,0.5,0], [1,0,1], [0,0,1],
+    [0.5,0,0.5], [0,1,0], [0.5,0.5,0.5]])
+
+default_uncert_cmap = jet(256)
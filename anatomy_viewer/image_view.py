@@ -4,15 +4,16 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtCore import pyqtSignal
 
 import numpy as np
-import cv2
 
-from .utils import numpy_to_qpixmap
+from .utils import numpy_to_qimage
+from .profiling import nullProfiler
 
 class ImageView(QtWidgets.QGraphicsView):
 
     windowSignal = pyqtSignal(float)
     levelSignal  = pyqtSignal(float)
     sliceSignal  = pyqtSignal(float)
+    clickSignal  = pyqtSignal(float, float)  # (row, col) in pixels of a left click without a drag
 
     def __init__(self, *argv, **keywords):
         super().__init__(*argv, **keywords)
@@ -49,38 +50,76 @@ class ImageView(QtWidgets.QGraphicsView):
 
         self.pressedMousePosition = None
         self.syncCenterViewList = []
+        self.profiler = nullProfiler
+        self.crosshair = None
 
     def hasImage(self):
         return not self.image.pixmap().isNull()
 
-    def setImage(self, image, spacing=None):
+    def setImage(self, image, spacing=None, colorTable=None):
 
-        if isinstance(image, np.ndarray):
-            qpixmap = numpy_to_qpixmap(image)
+        profiler = self.profiler
+
+        with profiler.stage('setImage.qimage', 'qt'):
+            if isinstance(image, np.ndarray):
+                image = numpy_to_qimage(image, colorTable=colorTable)
+
+        with profiler.stage('setImage.pixmap', 'qt'):
+            qpixmap = None
+            if isinstance(image, QtGui.QImage):
+                qpixmap = QtGui.QPixmap.fromImage(image)
+            elif isinstance(image, QtGui.QPixmap):
+                qpixmap = image
 
         if spacing is None:
             spacing = (1, 1)
         self.spacing = spacing
 
-        if qpixmap and not qpixmap.isNull():
-            self.setDragMode(QtWidgets.QGraphicsView.ScrollHandDrag)
-            self.image.setPixmap(qpixmap.scaled(qpixmap.width()  * self.spacing[1],
-                                                qpixmap.height() * self.spacing[0],
-                                                QtCore.Qt.IgnoreAspectRatio,
-                                                QtCore.Qt.FastTransformation))
-        else:
-            self.setDragMode(QtWidgets.QGraphicsView.NoDrag)
-            self.image.setPixmap(QtGui.QPixmap())
+        with profiler.stage('setImage.item', 'qt'):
+            if qpixmap and not qpixmap.isNull():
+                self.setDragMode(QtWidgets.QGraphicsView.ScrollHandDrag)
+                self.image.setPixmap(qpixmap)
+                # NOTE: voxel spacing is applied by the item, not by resampling the pixels
+                self.image.setTransform(QtGui.QTransform.fromScale(float(self.spacing[1]),
+                                                                   float(self.spacing[0])))
+            else:
+                self.setDragMode(QtWidgets.QGraphicsView.NoDrag)
+                self.image.setPixmap(QtGui.QPixmap())
 
         if self.zoom is None:
             self.fitInView()
 
+    def setCrosshair(self, position):
+        """ Mark the pixel position `(row, col)` with lines across the image, or remove them with None. """
+        if position is None:
+            if self.crosshair is not None:
+                for line in self.crosshair:
+                    line.hide()
+            return
+
+        if self.crosshair is None:
+            pen = QtGui.QPen(QtGui.QColor(255, 255, 0, 160))
+            pen.setCosmetic(True)
+            self.crosshair = [self.scene.addLine(QtCore.QLineF(), pen) for _ in range(2)]
+
+        spacing = self.spacing if self.spacing is not None else (1, 1)
+        rect = self.image.sceneBoundingRect()
+        y, x = position[0] * spacing[0], position[1] * spacing[1]
+        self.crosshair[0].setLine(rect.left(), y, rect.right(), y)
+        self.crosshair[1].setLine(x, rect.top(), x, rect.bottom())
+        for line in self.crosshair:
+            line.show()
+
+    def paintEvent(self, event):
+        with self.profiler.stage('repaint', 'qt'):
+            super().paintEvent(event)
+
     def fitInView(self):
 
         if not self.hasImage():
             return
 
-        rect = self.image.boundingRect()
+        rect = self.image.sceneBoundingRect()
         if rect.isNull():
             return
 
@@ -116,6 +155,13 @@ class ImageView(QtWidgets.QGraphicsView):
     def mouseReleaseEvent(self, event):
         QtWidgets.QGraphicsView.mouseReleaseEvent(self, event)
 
+        if event.button() == QtCore.Qt.LeftButton and self.pressedMousePosition is not None and self.hasImage():
+            moved = (event.pos() - self.pressedMousePosition).manhattanLength()
+            if moved < QtWidgets.QApplication.startDragDistance():
+                point = self.mapToScene(event.pos())
+                spacing = self.spacing if self.spacing is not None else (1, 1)
+                self.clickSignal.emit(point.y() / spacing[0], point.x() / spacing[1])
+
     def mouseMoveEvent(self, event):
         QtWidgets.QGraphicsView.mouseMoveEvent(self, event)
 
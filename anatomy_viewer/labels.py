@@ -0,0 +1,292 @@
+from __future__ import absolute_import
+
+import csv
+
+import numpy as np
+
+from .stats import cached_per_volume
+
+
+def _empty_like(volume, dtype):
+    if isinstance(volume, np.ndarray):
+        return np.empty_like(volume, dtype=dtype, subok=False)
+    # NOTE: lazily read volumes are (x, y, z) views of (z, y, x) files, as from `load_volume`
+    return np.empty(volume.shape, dtype, order='F')
+
+
+def compact_labels(volume, chunk_voxels=1<<22):
+    """ Store a label volume in the narrowest unsigned type that holds its labels.
+
+    Labels below 256 are stored as uint8 and labels below 65536 as uint16.
+    Volumes that are already compact, or that hold negative or non-integer
+    labels, are returned as they are. The compact volume keeps the memory
+    order of `volume`, and is filled in the same chunked sweep that finds
+    the label range.
+    """
+    if volume.dtype == np.uint8 or volume.dtype.kind not in 'iu':
+        return volume
+
+    compact = None
+    step = max(1, chunk_voxels // max(1, volume.shape[0] * volume.shape[1]))
+    for i in range(0, volume.shape[2], step):
+        chunk = np.asarray(volume[:,:,i:i+step])
+        lo, hi = chunk.min(), chunk.max()
+        if lo < 0 or hi >= 1 << 16:
+            return volume
+
+        # NOTE: start with uint8 and widen the chunks done so far once a label needs it
+        target = np.uint8 if hi < 256 and (compact is None or compact.dtype == np.uint8) else np.uint16
+        if target == volume.dtype:
+            return volume
+        if compact is None:
+            compact = _empty_like(volume, target)
+        elif compact.dtype != target:
+            wide = _empty_like(volume, target)
+            wide[:,:,:i] = compact[:,:,:i]
+            compact = wide
+        compact[:,:,i:i+step] = chunk
+    return compact
+
+
+def _extent(mask):
+    """ Half-open range `(start, stop)` of the True entries of a 1D `mask`, or None. """
+    where = np.flatnonzero(mask)
+    if len(where) == 0:
+        return None
+    return int(where[0]), int(where[-1]) + 1
+
+
+class LabelIndex(object):
+    """ Which labels occur where in a label volume, gathered in one chunked sweep.
+
+    `present` holds the labels found in the volume, including the background,
+    in increasing order. For every axis, `counts[axis]` is a (n_slices,
+    n_present) array with the number of voxels of each of them in each slice
+    along that axis. The occupancy maps `occupied_xy`, `occupied_xz` and
+    `occupied_yz` are the projections of the foreground (labels > 0) onto
+    pairs of axes, from which the bounding box of the foreground within any
+    slice is read off directly.
+
+    Axes are numbered as in the volume, i.e. 0, 1 and 2 are the Sagittal,
+    Coronal and Axial slice axes.
+    """
+
+    def __init__(self, volume, chunk_voxels=1<<22):
+
+        assert volume.ndim == 3, '`volume` should be 3D..'
+        assert volume.dtype.kind in 'iu', '`volume` should hold integer labels..'
+
+        nx, ny, nz = volume.shape
+        self.shape = volume.shape
+
+        # NOTE: columns are added as labels turn up, in that order, and sorted by label at the end
+        found = []
+        counts = [np.zeros((n, 0), np.int64) for n in volume.shape]
+        self.occupied_xy = np.zeros((nx, ny), bool)
+        self.occupied_xz = np.zeros((nx, nz), bool)
+        self.occupied_yz = np.zeros((ny, nz), bool)
+
+        # NOTE: compact labels are mapped to columns by a table over their whole range, others one by one
+        compact = volume.dtype.kind == 'u' and volume.dtype.itemsize <= 2
+        lookup = np.full(1 << 8 * volume.dtype.itemsize, -1, np.intp) if compact else {}
+
+        step = max(1, chunk_voxels // max(1, nx * ny))
+        for z0 in range(0, nz, step):
+            chunk = np.asarray(volume[:,:,z0:z0+step])
+            dz = chunk.shape[2]
+
+            if compact:
+                labels = lookup[chunk]
+                missing = labels < 0
+                if missing.any():
+                    new = np.unique(chunk[missing])
+                    lookup[new] = np.arange(len(found), len(found) + len(new))
+                    found.extend(new)
+                    labels = lookup[chunk]
+            else:
+                present, inverse = np.unique(chunk, return_inverse=True)
+                for label in present:
+                    if label not in lookup:
+                        lookup[label] = len(found)
+                        found.append(label)
+                labels = np.array([lookup[label] for label in present], np.intp)[inverse].reshape(chunk.shape)
+
+            n_labels = len(found)
+            if counts[0].shape[1] < n_labels:
+                counts = [np.pad(c, ((0, 0), (0, n_labels - c.shape[1]))) for c in counts]
+
+            x_offset = (np.arange(nx, dtype=np.intp) * n_labels)[:, None, None]
+            y_offset = (np.arange(ny, dtype=np.intp) * n_labels)[None, :, None]
+            z_offset = (np.arange(dz, dtype=np.intp) * n_labels)[None, None, :]
+            counts[0] += np.bincount((labels + x_offset).ravel(),
+                                     minlength=nx*n_labels).reshape(nx, n_labels)
+            counts[1] += np.bincount((labels + y_offset).ravel(),
+                                     minlength=ny*n_labels).reshape(ny, n_labels)
+            counts[2][z0:z0+dz] = np.bincount((labels + z_offset).ravel(),
+                                              minlength=dz*n_labels).reshape(dz, n_labels)
+
+            foreground = chunk > 0
+            self.occupied_xy |= foreground.any(axis=2)
+            self.occupied_xz[:, z0:z0+dz] = foreground.any(axis=1)
+            self.occupied_yz[:, z0:z0+dz] = foreground.any(axis=0)
+
+        order = np.argsort(found, kind='stable')
+        self.present = np.array(found, volume.dtype)[order]
+        self.counts = [c[:, order] for c in counts]
+        self.voxels = self.counts[2].sum(axis=0)
+        self.labels = self.present[self.present > 0]
+
+        self.nonempty = [np.any(c[:, self.present > 0] > 0, axis=1) for c in self.counts]
+
+    def _column(self, label):
+        i = int(np.searchsorted(self.present, label))
+        return i if i < len(self.present) and self.present[i] == label else None
+
+    def bounding_box(self, label):
+        """ Half-open `((x0, x1), (y0, y1), (z0, z1))` extent of `label`, or None if absent. """
+        i = self._column(label)
+        if i is None:
+            return None
+        return tuple(_extent(c[:, i] > 0) for c in self.counts)
+
+    def slice_labels(self, axis, index):
+        """ Labels (> 0) present in slice `index` along volume axis `axis`. """
+        labels = self.present[np.flatnonzero(self.counts[axis][index])]
+        return labels[labels > 0]
+
+    def next_nonempty(self, axis, index, step):
+        """ Nearest slice after `index` in the direction of `step` holding any label, or None. """
+        nonempty = self.nonempty[axis]
+        if step > 0:
+            where = np.flatnonzero(nonempty[index+1:])
+            return int(index + 1 + where[0]) if len(where) else None
+        where = np.flatnonzero(nonempty[:max(index, 0)])
+        return int(where[-1]) if len(where) else None
+
+    def slice_extent(self, axis, index):
+        """ Half-open `(row0, row1, col0, col1)` box of the foreground in a slice taken by `get_slice`.
+
+        `axis` is one of 'Axial', 'Coronal' and 'Sagittal'. Returns None for
+        slices without any label.
+        """
+        if axis == 'Axial':
+            rows = _extent(self.occupied_yz[:, index])
+            cols = _extent(self.occupied_xz[:, index])
+        elif axis == 'Coronal':
+            rows = _extent(self.occupied_yz[index, ::-1])
+            cols = _extent(self.occupied_xy[:, index])
+        elif axis == 'Sagittal':
+            rows = _extent(self.occupied_xz[index, ::-1])
+            cols = _extent(self.occupied_xy[index, :])
+        else:
+            raise ValueError('unknown slice axis: %s' % axis)
+
+        if rows is None or cols is None:
+            return None
+        return rows + cols
+
+
+class LabelReport(object):
+    """ Per-label voxel count, physical volume and uncertainty statistics.
+
+    All attributes are arrays aligned with `labels`, which holds the labels
+    (> 0) present in the volume. `volume_mm3` is None without a spacing and
+    the uncertainty columns are None without an uncertainty volume.
+    """
+
+    columns = ('labels', 'voxels', 'volume_mm3', 'uncert_mean', 'uncert_std', 'uncert_max')
+
+    def __init__(self, labels, voxels, volume_mm3, uncert_mean=None, uncert_std=None, uncert_max=None):
+        self.labels = labels
+        self.voxels = voxels
+        self.volume_mm3 = volume_mm3
+        self.uncert_mean = uncert_mean
+        self.uncert_std = uncert_std
+        self.uncert_max = uncert_max
+
+    def __len__(self):
+        return len(self.labels)
+
+    def with_spacing(self, spacing):
+        """ The same report with `volume_mm3` for voxels of `spacing`, or without it for None. """
+        volume_mm3 = self.voxels * float(np.prod(spacing)) if spacing is not None else None
+        return LabelReport(self.labels, self.voxels, volume_mm3, self.uncert_mean, self.uncert_std, self.uncert_max)
+
+    def rows(self):
+        """ One tuple per label in the order of `columns`; missing values are None. """
+        for i in range(len(self.labels)):
+            yield tuple(None if getattr(self, name) is None else getattr(self, name)[i].item()
+                        for name in self.columns)
+
+    def to_csv(self, filename):
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('label',) + self.columns[1:])
+            for row in self.rows():
+                writer.writerow(['' if value is None else value for value in row])
+
+
+def _run_starts(values):
+    return np.concatenate([[0], np.flatnonzero(values[1:] != values[:-1]) + 1])
+
+
+def _label_maxima(labels, values):
+    """ Labels present in the 1D `labels` and the maximum of `values` over each of them. """
+    # NOTE: maxima of the runs of a label first, which are long in segmentations, then of the runs sorted by
+    # label; unlike the unbuffered `np.maximum.at` of older numpy, neither grows with the number of labels
+    starts = _run_starts(labels)
+    run_labels, run_maxima = labels[starts], np.maximum.reduceat(values, starts)
+    order = np.argsort(run_labels, kind='stable')
+    run_labels, run_maxima = run_labels[order], run_maxima[order]
+    starts = _run_starts(run_labels)
+    return run_labels[starts], np.maximum.reduceat(run_maxima, starts)
+
+
+def compute_label_report(label, uncert=None, spacing=None, chunk_voxels=1<<22):
+    """ Gather a `LabelReport` for all labels in one chunked sweep over `label` and `uncert`.
+
+    Counts and uncertainty sums come from `np.bincount` over the labels of
+    each chunk, and maxima from `np.maximum.reduceat` over the runs of each
+    label, sorted by label, so the cost does not grow with the number of
+    labels.
+    """
+    assert label.dtype.kind in 'iu', '`label` should hold integer labels..'
+    if uncert is not None:
+        assert uncert.shape == label.shape, '`uncert.shape` should be equal to `label.shape`..'
+
+    n_labels = int(label.max()) + 1
+    voxels = np.zeros(n_labels, np.int64)
+    if uncert is not None:
+        total = np.zeros(n_labels, np.float64)
+        squares = np.zeros(n_labels, np.float64)
+        maxima = np.full(n_labels, -np.inf, np.float64)
+
+    step = max(1, chunk_voxels // max(1, label.shape[0] * label.shape[1]))
+    for z0 in range(0, label.shape[2], step):
+        # NOTE: in the memory order of (x, y, z) views of (z, y, x) arrays, where runs of a label are longest
+        labels = np.ravel(label[:,:,z0:z0+step], order='F')
+        voxels += np.bincount(labels, minlength=n_labels)
+        if uncert is None:
+            continue
+
+        values = np.ravel(np.asarray(uncert[:,:,z0:z0+step], np.float64), order='F')
+        total += np.bincount(labels, weights=values, minlength=n_labels)
+        squares += np.bincount(labels, weights=np.square(values), minlength=n_labels)
+        present, chunk_maxima = _label_maxima(labels, values)
+        maxima[present] = np.maximum(maxima[present], chunk_maxima)
+
+    present = np.flatnonzero(voxels[1:]) + 1
+    count = voxels[present]
+
+    if uncert is None:
+        return LabelReport(present, count, None).with_spacing(spacing)
+
+    mean = total[present] / count
+    std = np.sqrt(np.maximum(squares[present] / count - np.square(mean), 0.))
+    return LabelReport(present, count, None, mean, std, maxima[present]).with_spacing(spacing)
+
+
+@cached_per_volume
+def get_label_index(volume):
+    """ Cached `LabelIndex`; the result lives as long as `volume`. """
+    return LabelIndex(volume)
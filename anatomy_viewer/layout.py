@@ -0,0 +1,150 @@
+from __future__ import absolute_import
+
+import collections
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .render import get_slice, slice_view
+
+
+def is_slice_contiguous(volume, axis):
+    """ Whether every slice along `axis` is already one C-contiguous block of memory. """
+    view = slice_view(volume, axis)
+    itemsize = view.dtype.itemsize
+    return view.strides[2] == itemsize and view.strides[1] == itemsize * view.shape[2]
+
+
+class AxisLayouts(object):
+    """ Slice-contiguous copies of volumes for the active slice axis, within a memory budget.
+
+    `load_volume` returns (x, y, z) views of (z, y, x) arrays, so axial slices
+    are contiguous while coronal and sagittal slices gather scattered rows or
+    single elements. `prepare` builds, on a background thread, copies laid out
+    as (slice, row, col) for the axis being viewed, and `get_slice` reads from
+    such a copy once it is ready, or from the volume itself until then.
+
+    Volumes are taken in the order given until `max_bytes` is used up; copies
+    for other axes are only kept while they fit next to them. Volumes that are
+    not `np.ndarray`, e.g. chunked volumes read out of core, are not copied.
+    """
+
+    def __init__(self, max_bytes, chunk_bytes=64*1024**2):
+        assert max_bytes >= 0, '`max_bytes` should be >= 0..'
+
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+
+        self._copies = collections.OrderedDict()  # (id(volume), axis) -> copy
+        self._building = {}                        # (id(volume), axis) -> (future, cancelled event)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    @property
+    def nbytes(self):
+        return sum(copy.nbytes for copy in list(self._copies.values()))
+
+    def is_ready(self, volume, axis):
+        if not isinstance(volume, np.ndarray):
+            return True
+        return is_slice_contiguous(volume, axis) or (id(volume), axis) in self._copies
+
+    def source(self, volume, axis):
+        """ Array whose `i`-th item is the slice `i` along `axis`, contiguous if possible. """
+        copy = self._copies.get((id(volume), axis))
+        return copy if copy is not None else slice_view(volume, axis)
+
+    def get_slice(self, volume, axis, index):
+        copy = self._copies.get((id(volume), axis))
+        if copy is not None:
+            return copy[index]
+        return get_slice(volume, axis, index)
+
+    def prepare(self, volumes, axis):
+        """ Build copies of `volumes` for `axis` and drop the copies that no longer fit. """
+
+        volumes = [v for v in volumes if isinstance(v, np.ndarray)]
+        ids = set(id(v) for v in volumes)
+
+        wanted, total = [], 0
+        for volume in volumes:
+            if is_slice_contiguous(volume, axis) or total + volume.nbytes > self.max_bytes:
+                continue
+            wanted.append(volume)
+            total += volume.nbytes
+        keys = set((id(v), axis) for v in wanted)
+
+        with self._lock:
+            # NOTE: copies of replaced volumes go first, then the oldest ones of other axes
+            for key in list(self._copies.keys()):
+                if key[0] not in ids:
+                    del self._copies[key]
+            # NOTE: builds that already started stop at their next chunk
+            for key in list(self._building.keys()):
+                if key not in keys:
+                    self._cancel(key)
+
+            kept = sum(copy.nbytes for key, copy in self._copies.items() if key not in keys)
+            for key in list(self._copies.keys()):
+                if kept + total <= self.max_bytes:
+                    break
+                if key not in keys:
+                    kept -= self._copies.pop(key).nbytes
+
+            for volume in wanted:
+                key = (id(volume), axis)
+                if key in self._copies:
+                    self._copies.move_to_end(key)
+                elif key not in self._building:
+                    cancelled = threading.Event()
+                    future = self._executor.submit(self._build, key, volume, axis, cancelled)
+                    self._building[key] = (future, cancelled)
+                    weakref.finalize(volume, self._discard, key[0])
+
+    def _cancel(self, key):
+        future, cancelled = self._building.pop(key)
+        cancelled.set()
+        future.cancel()
+
+    def _build(self, key, volume, axis, cancelled):
+
+        view = slice_view(volume, axis)
+        copy = np.empty(view.shape, view.dtype)
+
+        step = max(1, self.chunk_bytes // max(1, copy[0].nbytes))
+        for i in range(0, len(view), step):
+            if cancelled.is_set():
+                return
+            copy[i:i+step] = view[i:i+step]
+
+        with self._lock:
+            if not cancelled.is_set():
+                self._building.pop(key, None)
+                self._copies[key] = copy
+
+    def _discard(self, volume_id):
+        with self._lock:
+            for key in [key for key in self._copies if key[0] == volume_id]:
+                del self._copies[key]
+            for key in [key for key in self._building if key[0] == volume_id]:
+                self._cancel(key)
+
+    def wait(self):
+        """ Block until the queued copies are built. """
+        for future, _ in list(self._building.values()):
+            try:
+                future.result()
+            except Exception:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._building.keys()):
+                self._cancel(key)
+            self._copies.clear()
+
+    def shutdown(self):
+        self.clear()
+        self._executor.shutdown(wait=False)
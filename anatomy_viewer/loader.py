@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import six
+
+from .utils import load_volume
+from .stats import get_statistics
+from .labels import compact_labels, get_label_index, compute_label_report
+
+
+class VolumeLoader(QtCore.QObject):
+    """ Load volumes on worker threads and hand them to the GUI thread.
+
+    Signals are emitted from the workers and delivered through queued
+    connections, so the connected slots run on the GUI thread. After
+    `shutdown`, nothing more is delivered, not even what was already queued.
+
+    Once the label volume and the uncertainty volume, if any, are in, the
+    per-label report is gathered on the worker that finished last and
+    emitted by `reported`, after the volumes themselves. It is computed
+    without a spacing, which the viewer applies.
+    """
+
+    loaded   = pyqtSignal(str, object, object, object)  # name, volume, spacing, statistics
+    progress = pyqtSignal(str, float)
+    failed   = pyqtSignal(str, str)
+    reported = pyqtSignal(object)  # LabelReport
+
+    def __init__(self, filenames, max_workers=None, parent=None):
+        super().__init__(parent)
+
+        self.filenames = filenames
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or len(filenames))
+        self.cancelled = False
+        self._finished = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        for name, filename in six.iteritems(self.filenames):
+            self.executor.submit(self._load, name, filename)
+
+    def _load(self, name, filename):
+        if self.cancelled:
+            return
+        try:
+            volume, spacing = load_volume(filename, progress=lambda p: self.progress.emit(name, p))
+            if name == 'label':
+                volume = compact_labels(volume)
+                if volume.dtype.kind in 'iu':
+                    get_label_index(volume)
+            statistics = get_statistics(volume)
+        except Exception as e:
+            self.failed.emit(name, '%s: %s' % (filename, e))
+            self._finish(name, None)
+            return
+
+        self.loaded.emit(name, volume, spacing, statistics)
+        self._finish(name, volume)
+
+    def _finish(self, name, volume):
+        # NOTE: only the worker that completes the label and uncertainty pair gathers the report
+        with self._lock:
+            self._finished[name] = volume
+            ready = 'label' in self.filenames and \
+                all(n in self._finished for n in ('label', 'uncert') if n in self.filenames) and \
+                name in ('label', 'uncert')
+        label, uncert = self._finished.get('label'), self._finished.get('uncert')
+        if not ready or self.cancelled or label is None or label.dtype.kind not in 'iu':
+            return
+        if uncert is not None and uncert.shape != label.shape:
+            uncert = None
+        self.reported.emit(compute_label_report(label, uncert))
+
+    def shutdown(self):
+        self.cancelled = True
+        # NOTE: disconnecting also drops the emissions queued but not yet delivered
+        for signal in (self.loaded, self.progress, self.failed, self.reported):
+            try:
+                signal.disconnect()
+            except TypeError:
+                pass
+        self.executor.shutdown(wait=False)
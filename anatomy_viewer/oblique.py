@@ -0,0 +1,215 @@
+from __future__ import absolute_import
+
+import collections
+import functools
+
+import numpy as np
+import cv2
+
+# NOTE: an oblique plane is one of the axis-aligned planes rotated by `pitch` degrees about its
+# horizontal (column) axis and then by `yaw` degrees about its vertical (row) axis
+ObliquePlane = collections.namedtuple('ObliquePlane', ['base', 'pitch', 'yaw'])
+
+_x, _y, _z = np.eye(3)
+
+# (column, row, normal) directions of the slices taken by `get_slice`, in (x, y, z)
+_base_frames = {
+    'Axial':    (_x,  _y, _z),
+    'Coronal':  (_x, -_z, _y),
+    'Sagittal': (_y, -_z, _x),
+}
+
+# (slice, row, col) of the slices along each axis as an affine map of the voxel position (x, y, z),
+# i.e. `get_slice(volume, axis, k)[row, col]` is the voxel at `matrix . (x, y, z) + offset * (Z - 1)`
+_slice_coordinates = {
+    'Axial':    (np.array([[0, 0, 1], [0, 1, 0], [1, 0, 0]], np.float64), np.array([0, 0, 0])),
+    'Coronal':  (np.array([[0, 1, 0], [0, 0, -1], [1, 0, 0]], np.float64), np.array([0, 1, 0])),
+    'Sagittal': (np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]], np.float64), np.array([0, 1, 0])),
+}
+
+_axis_names = ('Sagittal', 'Coronal', 'Axial')
+
+_remap_dtypes = (np.uint8, np.uint16, np.int16, np.float32, np.float64)
+_max_remap = (1 << 15) - 2
+
+
+def _remap(src, cols, rows, interpolation, width=1024):
+    """ `src` sampled at the points `(rows, cols)` given as 1D arrays, 0 outside. """
+    # NOTE: maps are folded into rows of `width`, as `cv2.remap` takes maps of less than SHRT_MAX
+    # columns and splits the work among threads by rows
+    out = np.empty(len(cols), src.dtype)
+    n = len(cols) - len(cols) % width
+    for a, b, shape in ((0, n, (-1, width)), (n, len(cols), (1, -1))):
+        if a < b:
+            cv2.remap(src, cols[a:b].reshape(shape), rows[a:b].reshape(shape), interpolation,
+                      dst=out[a:b].reshape(shape), borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    return out
+
+
+def _rotation(axis, degrees):
+    """ Matrix rotating by `degrees` about the unit vector `axis` (Rodrigues' formula). """
+    theta = np.deg2rad(degrees)
+    k = np.array([[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]])
+    return np.eye(3) + np.sin(theta) * k + (1 - np.cos(theta)) * k.dot(k)
+
+
+def _step(direction, spacing):
+    """ Distance [mm] along a unit `direction` that crosses one voxel, e.g. the spacing for axis directions. """
+    return 1. / np.linalg.norm(direction / spacing)
+
+
+class ObliqueGeometry(object):
+    """ Sampling grid of an `ObliquePlane` through a volume of `shape` and `spacing`.
+
+    Slices are spaced along the plane normal and their pixels in the plane
+    by the voxel size in those directions, so that a plane without rotation
+    samples exactly the voxels of its base slices. The grid covers the
+    projection of the whole volume.
+
+    Samples are read with `cv2.remap` from the slices along the volume axis
+    closest to the normal (`axis`): sorted by their position along that axis,
+    the pixels fall into bands lying between two neighbouring slices, and
+    each band is interpolated in both slices and blended. The sort order only
+    depends on the orientation, so moving along the normal just shifts the
+    coordinates and the band boundaries by constants. Pixels beyond the
+    outermost voxel centers are 0.
+    """
+
+    def __init__(self, shape, spacing, plane):
+
+        spacing = np.asarray(spacing if spacing is not None else np.ones(3), np.float64)
+        shape = np.asarray(shape)
+        self.plane = plane
+
+        u, v, n = _base_frames[plane.base]
+        rotation = _rotation(v, plane.yaw).dot(_rotation(u, plane.pitch))
+        self.u, self.v, self.n = (rotation.dot(d) for d in (u, v, n))
+
+        # pixel spacing (rows, cols) and the spacing of slices along the normal, in mm
+        self.pixel = (_step(self.v, spacing), _step(self.u, spacing))
+        self.step = _step(self.n, spacing)
+
+        # NOTE: the extent of the volume along each direction, from the projections of its corners
+        center = (shape - 1) / 2. * spacing
+        corners = np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)]) * (shape - 1) * spacing
+        counts = []
+        for direction, step in zip((self.v, self.u, self.n), self.pixel + (self.step,)):
+            extent = np.max(np.abs((corners - center).dot(direction))) / step
+            counts.append(int(np.floor(2 * extent + 1e-6)) + 1)
+        lo = [-(count - 1) / 2. for count in counts]
+
+        self.shape = (counts[0], counts[1])
+        self.n_slices = counts[2]
+
+        # voxel position of pixel (row, col) of slice `index` is `origin + row * dr + col * dc + index * dk`
+        self.spacing = spacing
+        self.dr = self.v * self.pixel[0] / spacing
+        self.dc = self.u * self.pixel[1] / spacing
+        self.dk = self.n * self.step / spacing
+        self.origin = center / spacing + lo[0] * self.dr + lo[1] * self.dc + lo[2] * self.dk
+
+        # NOTE: slices are read along the volume axis that the plane crosses fastest
+        self.axis = _axis_names[int(np.argmax(np.abs(self.dk)))]
+        self._prepare(shape)
+
+    def _prepare(self, shape):
+
+        matrix, offset = _slice_coordinates[self.axis]
+        offset = offset * (shape[2] - 1)
+        # number of slices along the axis and their (rows, cols)
+        counts = [int(shape[np.argmax(np.abs(m))]) for m in matrix]
+        self.n_source, self.source_shape = counts[0], (counts[1], counts[2])
+
+        # (slice, row, col) coordinates of the grid of slice 0, and their shift per slice
+        rows, cols = np.mgrid[0:self.shape[0], 0:self.shape[1]]
+        origin = matrix.dot(self.origin) + offset
+        dr, dc = matrix.dot(self.dr), matrix.dot(self.dc)
+        self._shift = matrix.dot(self.dk)
+
+        k = origin[0] + dr[0] * rows + dc[0] * cols
+        self._order = np.argsort(k, axis=None, kind='stable')
+        self._k = k.ravel()[self._order].astype(np.float32)
+        self._rows = (origin[1] + dr[1] * rows + dc[1] * cols).ravel()[self._order].astype(np.float32)
+        self._cols = (origin[2] + dr[2] * rows + dc[2] * cols).ravel()[self._order].astype(np.float32)
+
+    def voxel(self, index, row, col):
+        """ Continuous voxel position (x, y, z) of pixel `(row, col)` of slice `index`. """
+        return self.origin + row * self.dr + col * self.dc + index * self.dk
+
+    def position(self, voxel):
+        """ `(index, row, col)` of the continuous voxel position `voxel`, inverse of `voxel`. """
+        basis = np.stack([self.dk, self.dr, self.dc], axis=1)
+        return tuple(np.linalg.solve(basis, np.asarray(voxel, np.float64) - self.origin))
+
+    def sample(self, get_slab, index, dtype, linear=True):
+        """ Slice `index` of the plane as `dtype`, read from the slabs `get_slab(axis, start, stop)` of a volume.
+
+        `get_slab` returns the slices `start:stop` along `axis` as one
+        (slice, row, col) array. Linear sampling interpolates trilinearly;
+        otherwise the nearest voxel is taken, as for labels. Pixels outside of
+        the volume are 0.
+        """
+        dk, drow, dcol = self._shift * index
+        n, (rows, cols) = self.n_source, self.source_shape
+
+        # NOTE: pixels are sorted along the axis, so those within the volume are one range
+        k = self._k + np.float32(dk)
+        lo, hi = np.searchsorted(k, np.float32(0), 'left'), np.searchsorted(k, np.float32(n - 1), 'right')
+        out = np.zeros(len(k), np.float32 if linear else dtype)
+
+        if lo < hi:
+            k = k[lo:hi]
+            mapRows = self._rows[lo:hi] + np.float32(drow)
+            mapCols = self._cols[lo:hi] + np.float32(dcol)
+            # NOTE: slices are stacked into one image below, so rows must not reach into the next slice
+            outside = (mapRows < 0) | (mapRows > rows - 1) | (mapCols < 0) | (mapCols > cols - 1)
+            mapCols[outside] = -2
+
+            # NOTE: pixel `i` lies between slices `j[i]` and `j[i] + 1`, or is nearest to slice `j[i]`
+            if linear:
+                j = np.minimum(np.floor(k), max(n - 2, 0))
+                weight = k - j
+            else:
+                j = np.floor(k + 0.5)
+
+            # NOTE: `cv2.remap` is 2D, so consecutive slices are read as one image of stacked rows, in
+            # groups of up to SHRT_MAX rows; linear groups overlap by one slice
+            depth = max(2, _max_remap // rows)
+            start, bound = int(j[0]), 0
+            while bound < len(k):
+                stop = min(start + depth, n)
+                last = stop - 1 if linear and stop < n else stop
+                end = len(k) if stop >= n else int(np.searchsorted(j, np.float32(last)))
+                if bound < end:
+                    slab = np.ascontiguousarray(get_slab(self.axis, start, stop))
+                    if slab.dtype not in _remap_dtypes:
+                        slab = slab.astype(np.float32)
+                    slab = slab.reshape(-1, cols)
+
+                    stacked = mapRows[bound:end] + (j[bound:end] - start) * rows
+                    if linear:
+                        a = _remap(slab, mapCols[bound:end], stacked, cv2.INTER_LINEAR)
+                        b = _remap(slab, mapCols[bound:end], stacked + rows, cv2.INTER_LINEAR)
+                        w = weight[bound:end]
+                        out[lo+bound:lo+end] = a * (1 - w) + b * w
+                    else:
+                        out[lo+bound:lo+end] = _remap(slab, mapCols[bound:end], stacked, cv2.INTER_NEAREST)
+                    bound = end
+                start = last
+
+        if linear and np.dtype(dtype).kind in 'iu':
+            np.rint(out, out=out)
+        result = np.empty(len(out), dtype)
+        result[self._order] = out
+        return result.reshape(self.shape)
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_geometry(shape, spacing, plane):
+    return ObliqueGeometry(shape, spacing, plane)
+
+
+def get_oblique_geometry(shape, spacing, plane):
+    """ `ObliqueGeometry`, cached for the few orientations last asked for. """
+    spacing = tuple(float(s) for s in spacing) if spacing is not None else None
+    return _cached_geometry(tuple(int(n) for n in shape), spacing, plane)
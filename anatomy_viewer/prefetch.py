@@ -0,0 +1,105 @@
+from __future__ import absolute_import
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .render import panel_key
+
+
+class SlicePrefetcher(object):
+    """ Render neighbouring slices into a shared cache on a thread pool.
+
+    Slices ahead of the current scroll direction are queued first. Every
+    call to `prefetch` cancels queued work that is no longer wanted, and
+    a change of anything but the slice index (axis, window/level, alpha)
+    discards results that are still in flight.
+    """
+
+    def __init__(self, renderer, cache, depth=4, max_workers=None):
+        assert depth >= 0, '`depth` should be >= 0..'
+
+        self.renderer = renderer
+        self.cache = cache
+        self.depth = depth
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._generation = 0
+        self._last_state = None
+
+    def _thread_renderer(self, generation):
+        # NOTE: clones copy the spacing, so they are renewed whenever previous work was cancelled
+        if getattr(self._local, 'generation', None) != generation:
+            self._local.renderer = self.renderer.clone()
+            self._local.generation = generation
+        return self._local.renderer
+
+    def _is_cached(self, state):
+        return all(panel_key(name, state) in self.cache for name in self.renderer.available_panels())
+
+    def _render(self, generation, state):
+        if generation != self._generation or self._is_cached(state):
+            return
+
+        panels = self.renderer.available_panels()
+        images, _ = self._thread_renderer(generation).render(state, panels)
+
+        images = dict((name, images[name].copy()) for name in panels)
+        # NOTE: under the lock that `cancel` takes, so a volume swapped in after the check evicts what is put here
+        with self._lock:
+            if generation != self._generation:
+                return
+            for name in panels:
+                self.cache.put(panel_key(name, state), images[name])
+
+    def _done(self, index, future):
+        with self._lock:
+            if self._pending.get(index) is future:
+                del self._pending[index]
+
+    def prefetch(self, state, direction, n_slices):
+
+        if self.depth == 0 or self.cache.max_bytes == 0:
+            return
+
+        direction = 1 if direction >= 0 else -1
+        targets = [state.index + direction * i for i in range(1, self.depth + 1)] + \
+                  [state.index - direction * i for i in range(1, self.depth + 1)]
+        targets = [i for i in targets if 0 <= i < n_slices]
+
+        with self._lock:
+            if self._last_state is None or \
+                    self._last_state._replace(index=0) != state._replace(index=0):
+                self._cancel()
+            self._last_state = state
+
+            # drop queued slices that moved out of the prefetch window
+            for index in list(self._pending.keys()):
+                if index not in targets and self._pending[index].cancel():
+                    self._pending.pop(index, None)
+
+            for index in targets:
+                if index in self._pending:
+                    continue
+                target = state._replace(index=index)
+                if self._is_cached(target):
+                    continue
+                future = self._executor.submit(self._render, self._generation, target)
+                self._pending[index] = future
+                future.add_done_callback(lambda f, index=index: self._done(index, f))
+
+    def _cancel(self):
+        self._generation += 1
+        for future in list(self._pending.values()):
+            future.cancel()
+        self._pending.clear()
+
+    def cancel(self):
+        with self._lock:
+            self._cancel()
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
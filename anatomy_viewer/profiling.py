@@ -0,0 +1,114 @@
+from __future__ import absolute_import
+
+import collections
+import json
+import os
+import threading
+import time
+
+
+class _NullStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_nullStage = _NullStage()
+
+
+class _Stage(object):
+
+    __slots__ = ('profiler', 'name', 'category', 'start')
+
+    def __init__(self, profiler, name, category):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.category, self.start, time.perf_counter())
+        return False
+
+
+class Profiler(object):
+    """ Opt-in wall-clock timing of named stages, exported as Chrome trace events.
+
+    `stage(name)` is a context manager. While the profiler is disabled it
+    returns a shared no-op object, so instrumented code only pays for one
+    attribute lookup and call per stage. Frames, i.e. stages of the 'frame'
+    category, are also kept in a rolling window for a frame time/FPS readout.
+    Stages may be recorded from any thread.
+    """
+
+    def __init__(self, enabled=False, history=60, max_events=1<<20):
+        self.enabled = enabled
+        self.max_events = max_events
+        self.events = collections.deque(maxlen=max_events)
+        self.frameTimes = collections.deque(maxlen=history)
+        self.origin = time.perf_counter()
+
+    def stage(self, name, category='render'):
+        if not self.enabled:
+            return _nullStage
+        return _Stage(self, name, category)
+
+    def frame(self, name='frame'):
+        return self.stage(name, 'frame')
+
+    def record(self, name, category, start, end):
+        # NOTE: deque.append is atomic, so no lock is needed for worker threads
+        self.events.append((name, category, start, end, threading.get_ident()))
+        if category == 'frame':
+            self.frameTimes.append(end - start)
+
+    def clear(self):
+        self.events.clear()
+        self.frameTimes.clear()
+        self.origin = time.perf_counter()
+
+    def frame_time(self):
+        """ Mean wall time of the recent frames in seconds, or None before the first frame. """
+        if not self.frameTimes:
+            return None
+        return sum(self.frameTimes) / len(self.frameTimes)
+
+    def fps(self):
+        frame_time = self.frame_time()
+        return 1. / frame_time if frame_time else None
+
+    def summary(self):
+        """ `{name: (count, total seconds)}` of the recorded stages. """
+        totals = collections.OrderedDict()
+        for name, _, start, end, _ in list(self.events):
+            count, total = totals.get(name, (0, 0.))
+            totals[name] = (count + 1, total + end - start)
+        return totals
+
+    def trace_events(self):
+        """ Recorded stages as complete ('X') events of the Chrome trace event format. """
+        pid = os.getpid()
+        return [{
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': 1e6 * (start - self.origin),
+            'dur': 1e6 * (end - start),
+            'pid': pid,
+            'tid': tid,
+        } for name, category, start, end, tid in list(self.events)]
+
+    def save_trace(self, filename):
+        """ Write a JSON file to be opened in chrome://tracing or Perfetto. """
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+
+
+# NOTE: shared default for code that is not being profiled
+nullProfiler = Profiler(enabled=False)
@@ -0,0 +1,282 @@
+from __future__ import absolute_import
+
+import collections
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+projectionModes = ('max', 'mean', 'min')
+
+_reducers = {'max': np.maximum, 'min': np.minimum}
+
+
+def slab_bounds(index, thickness, n_slices):
+    """ `[lo, hi)` of the slab of `thickness` slices around slice `index`, clipped to `n_slices`. """
+    lo = index - (thickness - 1) // 2
+    return max(lo, 0), min(lo + thickness, n_slices)
+
+
+def _sum_dtype(dtype):
+    # NOTE: sums of up to 2**15 slices of 8- and 16-bit voxels fit in int32; float sums are kept in float32,
+    # whose rounding stays far below a gray level of the window
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'iub':
+        return np.int32 if dtype.itemsize <= 2 else np.int64
+    return np.float32
+
+
+def project_slab(slab, mode, dtype):
+    """ Projection of the (slice, row, col) array `slab` by scanning it; integer means are rounded to `dtype`. """
+    if mode == 'mean':
+        mean = slab.mean(axis=0, dtype=np.float32)
+        if np.dtype(dtype).kind in 'iu':
+            return np.rint(mean, out=mean).astype(dtype)
+        return mean.astype(dtype)
+    return _reducers[mode].reduce(slab, axis=0)
+
+
+def table_bytes(n_slices, shape, dtype, mode, block=16):
+    """ Bytes of the table of `mode` for `n_slices` slices of `shape` and `dtype`. """
+    pixels = int(np.prod(shape))
+    if mode == 'mean':
+        return (n_slices + 1) * pixels * np.dtype(_sum_dtype(dtype)).itemsize
+    n_blocks = -(-n_slices // block)
+    levels = sum(n_blocks - 2 ** j + 1 for j in range(int(np.log2(max(1, n_blocks))) + 1))
+    return (2 * n_slices + levels) * pixels * np.dtype(dtype).itemsize
+
+
+class PrefixSums(object):
+    """ Mean projections from cumulative sums along the axis: `S[k]` is the sum of slices `[0, k)`. """
+
+    def __init__(self, get_slab, n_slices, dtype, cancelled):
+
+        self.dtype = np.dtype(dtype)
+        first = get_slab(0, 1)[0]
+        self.sums = np.empty((n_slices + 1,) + first.shape, _sum_dtype(dtype))
+        self.sums[0] = 0
+
+        for k in range(n_slices):
+            if cancelled.is_set():
+                return
+            np.add(self.sums[k], get_slab(k, k + 1)[0], out=self.sums[k + 1], casting='unsafe')
+
+    @property
+    def nbytes(self):
+        return self.sums.nbytes
+
+    def project(self, lo, hi, get_slab):
+        mean = np.subtract(self.sums[hi], self.sums[lo], dtype=np.float32)
+        mean *= 1. / (hi - lo)
+        if self.dtype.kind in 'iu':
+            return np.rint(mean, out=mean).astype(self.dtype)
+        return mean.astype(self.dtype)
+
+
+class BlockExtrema(object):
+    """ Maximum or minimum projections from a block decomposition along the axis.
+
+    Slices are split into blocks of `block` slices. For every slice, the
+    running extremum from the start of its block (`prefix`) and to the end of
+    its block (`suffix`) is kept, and a sparse table holds the extrema of
+    every power-of-two run of whole blocks. A slab spanning blocks is then the
+    extremum of the suffix at its first slice, two entries of the sparse
+    table and the prefix at its last slice, whatever its thickness; only
+    slabs inside one block are scanned, over less than `block` slices.
+    """
+
+    def __init__(self, get_slab, n_slices, mode, cancelled, block=16):
+
+        self.mode = mode
+        self.block = block
+        reduce = _reducers[mode]
+
+        first = get_slab(0, 1)[0]
+        self.prefix = np.empty((n_slices,) + first.shape, first.dtype)
+        self.suffix = np.empty_like(self.prefix)
+        self.table = []
+
+        for b0 in range(0, n_slices, block):
+            if cancelled.is_set():
+                return
+            b1 = min(b0 + block, n_slices)
+            chunk = get_slab(b0, b1)
+            # NOTE: slice by slice, as `accumulate` along the first axis is an order of magnitude slower
+            self.prefix[b0] = chunk[0]
+            self.suffix[b1-1] = chunk[-1]
+            for k in range(1, b1 - b0):
+                reduce(self.prefix[b0+k-1], chunk[k], out=self.prefix[b0+k])
+                reduce(self.suffix[b1-k], chunk[-1-k], out=self.suffix[b1-1-k])
+
+        # NOTE: level `j` holds the extrema of the runs of 2**j blocks starting at every block
+        self.table = [self.prefix[block-1::block].copy()]
+        if n_slices % block:
+            self.table[0] = np.concatenate([self.table[0], self.prefix[-1:]])
+        while 2 ** len(self.table) <= len(self.table[0]):
+            level, half = self.table[-1], 2 ** (len(self.table) - 1)
+            self.table.append(reduce(level[:-half], level[half:]))
+
+    @property
+    def nbytes(self):
+        return self.prefix.nbytes + self.suffix.nbytes + sum(level.nbytes for level in self.table)
+
+    def project(self, lo, hi, get_slab):
+        reduce = _reducers[self.mode]
+        first, last = lo // self.block, (hi - 1) // self.block
+
+        if first == last:
+            if lo % self.block == 0:
+                return self.prefix[hi - 1]
+            if hi == len(self.prefix) or hi % self.block == 0:
+                return self.suffix[lo]
+            return project_slab(get_slab(lo, hi), self.mode, self.prefix.dtype)
+
+        out = reduce(self.suffix[lo], self.prefix[hi - 1])
+        if last - first > 1:
+            a, b = first + 1, last
+            j = int(np.log2(b - a))
+            reduce(out, self.table[j][a], out=out)
+            reduce(out, self.table[j][b - 2 ** j], out=out)
+        return out
+
+
+class SlabTables(object):
+    """ Tables answering slab projections of volumes, within a memory budget.
+
+    A table covers one volume along one axis for one mode, and is built on a
+    background thread. `prepare` builds the tables of the volumes for the axis
+    and mode being viewed, in the order given until `max_bytes` is used up,
+    and drops the oldest other tables to make room for them. `get` returns a
+    ready table, or starts building one if it fits next to the others, e.g.
+    for the planes of the tri-planar view, and returns None until then.
+    Tables of different axes do not replace one another.
+    """
+
+    def __init__(self, max_bytes):
+        assert max_bytes >= 0, '`max_bytes` should be >= 0..'
+
+        self.max_bytes = max_bytes
+
+        self._tables = collections.OrderedDict()  # (id(volume), axis) -> (mode, table)
+        self._building = collections.OrderedDict()  # (id(volume), axis) -> (mode, nbytes, future, cancelled)
+        self._finalizers = {}                       # id(volume) -> finalizer dropping its tables
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    @property
+    def nbytes(self):
+        return sum(table.nbytes for _, table in list(self._tables.values()))
+
+    def _reserved(self, exclude=()):
+        return sum(table.nbytes for key, (_, table) in self._tables.items() if key not in exclude) + \
+            sum(nbytes for key, (_, nbytes, _, _) in self._building.items() if key not in exclude)
+
+    def get(self, volume, axis, mode, get_slab, n_slices, shape):
+        """ Table of `volume` along `axis` for `mode`, or None while it is being built or does not fit. """
+        key = (id(volume), axis)
+        with self._lock:
+            entry = self._tables.get(key)
+            if entry is not None and entry[0] == mode:
+                self._tables.move_to_end(key)
+                return entry[1]
+            building = self._building.get(key)
+            if building is not None and building[0] == mode:
+                return None
+            nbytes = table_bytes(n_slices, shape, volume.dtype, mode)
+            if self._reserved(exclude=(key,)) + nbytes <= self.max_bytes:
+                self._start(key, volume, mode, nbytes, get_slab, n_slices)
+        return None
+
+    def prepare(self, requests, axis, mode):
+        """ Build the tables of `(volume, get_slab, n_slices, shape)` in `requests`, dropping others as needed. """
+
+        wanted, total = {}, 0
+        for volume, get_slab, n_slices, shape in requests:
+            nbytes = table_bytes(n_slices, shape, volume.dtype, mode)
+            if total + nbytes > self.max_bytes:
+                continue
+            wanted[(id(volume), axis)] = (volume, get_slab, n_slices, nbytes)
+            total += nbytes
+
+        with self._lock:
+            # NOTE: builds for another mode are stale, other tables go oldest first while they do not fit
+            for key in list(self._building.keys()):
+                if self._building[key][0] != mode and key not in wanted:
+                    self._cancel(key)
+            kept = self._reserved(exclude=wanted)
+            for store in (self._building, self._tables):
+                for key in list(store.keys()):
+                    if kept + total <= self.max_bytes:
+                        break
+                    if key in wanted:
+                        continue
+                    kept -= store[key][1] if store is self._building else store[key][1].nbytes
+                    if store is self._building:
+                        self._cancel(key)
+                    else:
+                        del self._tables[key]
+
+            for key, (volume, get_slab, n_slices, nbytes) in wanted.items():
+                entry, building = self._tables.get(key), self._building.get(key)
+                if entry is not None and entry[0] == mode:
+                    self._tables.move_to_end(key)
+                elif building is None or building[0] != mode:
+                    self._start(key, volume, mode, nbytes, get_slab, n_slices)
+
+    def _start(self, key, volume, mode, nbytes, get_slab, n_slices):
+        if key in self._building:
+            self._cancel(key)
+        # NOTE: a table for another mode makes room for this one
+        self._tables.pop(key, None)
+        cancelled = threading.Event()
+        future = self._executor.submit(self._build, key, mode, volume.dtype, get_slab, n_slices, cancelled)
+        self._building[key] = (mode, nbytes, future, cancelled)
+        if key[0] not in self._finalizers:
+            self._finalizers[key[0]] = weakref.finalize(volume, self._discard, key[0])
+
+    def _cancel(self, key):
+        _, _, future, cancelled = self._building.pop(key)
+        cancelled.set()
+        future.cancel()
+
+    def _build(self, key, mode, dtype, get_slab, n_slices, cancelled):
+        table = None
+        try:
+            if mode == 'mean':
+                table = PrefixSums(get_slab, n_slices, dtype, cancelled)
+            else:
+                table = BlockExtrema(get_slab, n_slices, mode, cancelled)
+        finally:
+            # NOTE: a build that failed, e.g. on a read error, is dropped, so that the table is asked for again
+            with self._lock:
+                if not cancelled.is_set():
+                    self._building.pop(key, None)
+                    if table is not None:
+                        self._tables[key] = (mode, table)
+
+    def _discard(self, volume_id):
+        with self._lock:
+            self._finalizers.pop(volume_id, None)
+            for key in [key for key in self._tables if key[0] == volume_id]:
+                del self._tables[key]
+            for key in [key for key in self._building if key[0] == volume_id]:
+                self._cancel(key)
+
+    def wait(self):
+        """ Block until the queued tables are built. """
+        for _, _, future, _ in list(self._building.values()):
+            try:
+                future.result()
+            except Exception:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._building.keys()):
+                self._cancel(key)
+            self._tables.clear()
+
+    def shutdown(self):
+        self.clear()
+        self._executor.shutdown(wait=False)
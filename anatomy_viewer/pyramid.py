@@ -0,0 +1,130 @@
+from __future__ import absolute_import
+
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .stats import cached_per_volume
+
+
+def _pad_chunk(chunk, factor):
+    """ Pad `chunk` by repeating its last voxels to a multiple of `factor` along every axis. """
+    pad = [(0, -n % factor) for n in chunk.shape]
+    if any(p for _, p in pad):
+        chunk = np.pad(chunk, pad, mode='edge')
+    return chunk
+
+
+def _blocks(chunk, factor):
+    """ (X, Y, Z, factor**3) view of the `factor`-sized blocks of a padded chunk. """
+    x, y, z = (n // factor for n in chunk.shape)
+    blocks = chunk.reshape(x, factor, y, factor, z, factor).transpose(0, 2, 4, 1, 3, 5)
+    return blocks.reshape(x, y, z, factor**3)
+
+
+def _downsample(volume, factor, reduce, chunk_voxels):
+
+    shape = tuple(-(-n // factor) for n in volume.shape)
+    # NOTE: levels keep the memory order of the volume, so the same slices stay contiguous
+    order = 'F' if getattr(volume, 'flags', None) is not None and volume.flags.f_contiguous else 'C'
+    out = np.empty(shape, volume.dtype, order=order)
+
+    # NOTE: chunks span whole blocks along the last axis
+    step = factor * max(1, chunk_voxels // max(1, volume.shape[0] * volume.shape[1] * factor))
+    for z0 in range(0, volume.shape[2], step):
+        chunk = _pad_chunk(np.asarray(volume[:,:,z0:z0+step]), factor)
+        out[:,:,z0//factor:(z0+chunk.shape[2])//factor] = reduce(_blocks(chunk, factor))
+    return out
+
+
+def _mean(blocks, dtype):
+    mean = blocks.mean(axis=-1, dtype=np.float32)
+    if np.dtype(dtype).kind in 'iu':
+        return np.rint(mean, out=mean).astype(dtype)
+    return mean.astype(dtype)
+
+
+def _mode(blocks):
+    # NOTE: for every voxel of a block, count the voxels of the block with the same label
+    counts = np.zeros(blocks.shape, np.uint8)
+    for j in range(blocks.shape[-1]):
+        counts += blocks == blocks[..., j:j+1]
+    first = np.argmax(counts, axis=-1)
+    return np.take_along_axis(blocks, first[..., None], axis=-1)[..., 0]
+
+
+def downsample_mean(volume, factor=2, chunk_voxels=1<<22):
+    """ Average `factor`**3 blocks of `volume`; integer volumes keep their dtype. """
+    return _downsample(volume, factor, lambda b: _mean(b, volume.dtype), chunk_voxels)
+
+
+def downsample_mode(volume, factor=2, chunk_voxels=1<<22):
+    """ Most frequent label of `factor`**3 blocks of a label `volume`, ties going to the first one. """
+    return _downsample(volume, factor, _mode, chunk_voxels)
+
+
+class VolumePyramid(object):
+    """ Lazily built 2x, 4x, .. downsampled levels of a volume.
+
+    Level `k` is downsampled by `2**k` along every axis, from level `k-1`,
+    by averaging or, for label volumes, by taking the most frequent label.
+    Levels are built on a background thread when first asked for; `level`
+    returns None until then, so callers fall back to a finer level.
+
+    Level 0, the volume itself, is only weakly referenced, so that a cached
+    pyramid does not keep its volume alive.
+    """
+
+    _executor = ThreadPoolExecutor(max_workers=1)
+
+    def __init__(self, volume, labels=False, max_level=2):
+        self._volume = weakref.ref(volume)
+        self.volumes = []
+        self.labels = labels
+        self.max_level = max_level
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def level(self, k):
+        """ Volume of level `k`, or None while it is being built. """
+        assert 0 <= k <= self.max_level, '`k` should be in [0, %d]..' % self.max_level
+        if k == 0:
+            return self._volume()
+        with self._lock:
+            if k <= len(self.volumes):
+                return self.volumes[k-1]
+            if self._pending is None:
+                self._pending = self._executor.submit(self._build, k)
+        return None
+
+    def _build(self, k):
+        downsample = downsample_mode if self.labels else downsample_mean
+        while len(self.volumes) < k:
+            finer = self.volumes[-1] if self.volumes else self._volume()
+            if finer is None:
+                break
+            coarse = downsample(finer, 2)
+            del finer
+            with self._lock:
+                self.volumes.append(coarse)
+        with self._lock:
+            self._pending = None
+
+    def wait(self):
+        future = self._pending
+        if future is not None:
+            future.result()
+
+
+@cached_per_volume
+def get_image_pyramid(volume):
+    """ Cached `VolumePyramid` of an image or uncertainty volume. """
+    return VolumePyramid(volume)
+
+
+@cached_per_volume
+def get_label_pyramid(volume):
+    """ Cached mode-downsampled `VolumePyramid` of a label volume. """
+    return VolumePyramid(volume, labels=True)
@@ -0,0 +1,580 @@
+from __future__ import absolute_import
+
+import collections
+import copy
+
+import numpy as np
+import cv2
+
+from .labels import get_label_index
+from .oblique import ObliquePlane, get_oblique_geometry
+from .projection import project_slab, slab_bounds
+from .pyramid import get_image_pyramid, get_label_pyramid
+from .profiling import nullProfiler
+
+panelNames = ('image', 'label', 'labelOverlay', 'uncert', 'uncertOverlay')
+
+# inputs each panel depends on, where `slice` stands for the axis and index
+panelDependencies = {
+    'image':         ('image_volume', 'slice', 'projection', 'image_window_level'),
+    'label':         ('label_volume', 'slice', 'label_cmap'),
+    'labelOverlay':  ('image_volume', 'label_volume', 'slice', 'projection', 'image_window_level', 'image_alpha',
+                      'label_cmap'),
+    'uncert':        ('uncert_volume', 'slice', 'projection', 'uncert_window_level', 'uncert_cmap'),
+    'uncertOverlay': ('image_volume', 'uncert_volume', 'slice', 'projection', 'image_window_level',
+                      'uncert_window_level', 'uncert_alpha', 'uncert_cmap'),
+}
+
+# volumes each panel is composited from
+panelVolumes = {
+    'image':         ('image',),
+    'label':         ('label',),
+    'labelOverlay':  ('image', 'label'),
+    'uncert':        ('uncert',),
+    'uncertOverlay': ('image', 'uncert'),
+}
+
+# NOTE: `projection` is None for plain slices, or `(mode, thickness)` for a slab projection of the image and
+# uncertainty, with `mode` one of `projectionModes`; labels are always sliced
+RenderState = collections.namedtuple('RenderState', [
+    'axis', 'index',
+    'image_window_level', 'uncert_window_level',
+    'image_alpha', 'uncert_alpha',
+    'projection'], defaults=(None,))
+
+
+def get_slice(volume, axis, index):
+
+    if axis == 'Axial':
+        return volume[:,:,index].T
+    elif axis == 'Coronal':
+        return volume[:,index,::-1].T
+    elif axis == 'Sagittal':
+        return volume[index,:,::-1].T
+    else:
+        raise ValueError('unknown slice axis: %s' % axis)
+
+
+def slice_view(volume, axis):
+    """ View of `volume` whose `i`-th item is `get_slice(volume, axis, i)`. """
+
+    if axis == 'Axial':
+        return volume.transpose(2,1,0)
+    elif axis == 'Coronal':
+        return volume[:,:,::-1].transpose(1,2,0)
+    elif axis == 'Sagittal':
+        return volume[:,:,::-1].transpose(0,2,1)
+    else:
+        raise ValueError('unknown slice axis: %s' % axis)
+
+
+def get_slice_shape(shape, axis):
+
+    if axis == 'Axial':
+        return (shape[1], shape[0])
+    elif axis == 'Coronal':
+        return (shape[2], shape[0])
+    elif axis == 'Sagittal':
+        return (shape[2], shape[1])
+    else:
+        raise ValueError('unknown slice axis: %s' % axis)
+
+
+def get_slice_spacing(spacing, axis):
+
+    if axis == 'Axial':
+        return (spacing[1], spacing[0])
+    elif axis == 'Coronal':
+        return (spacing[2], spacing[0])
+    elif axis == 'Sagittal':
+        return (spacing[2], spacing[1])
+    else:
+        raise ValueError('unknown slice axis: %s' % axis)
+
+
+def get_slice_position(point, shape, axis):
+    """ `(row, col)` in slices taken by `get_slice` of the continuous voxel position `point`. """
+
+    if axis == 'Axial':
+        return (point[1], point[0])
+    elif axis == 'Coronal':
+        return (shape[2] - point[2], point[0])
+    elif axis == 'Sagittal':
+        return (shape[2] - point[2], point[1])
+    else:
+        raise ValueError('unknown slice axis: %s' % axis)
+
+
+def get_slice_voxel(position, index, shape, axis):
+    """ Continuous voxel position of `(row, col)` at the continuous slice `index`, inverse of `get_slice_position`. """
+    row, col = position
+
+    if axis == 'Axial':
+        return (col, row, index)
+    elif axis == 'Coronal':
+        return (col, index, shape[2] - row)
+    elif axis == 'Sagittal':
+        return (index, col, shape[2] - row)
+    else:
+        raise ValueError('unknown slice axis: %s' % axis)
+
+
+def panel_key(panel, state):
+    """ Cache key of `panel` rendered with `state`, ignoring parameters the panel does not use. """
+    return (panel, state.axis, state.index) + \
+        tuple(getattr(state, name) for name in panelDependencies[panel] if name in RenderState._fields)
+
+
+def changed_inputs(old, new):
+    """ Names of the inputs that differ between two `RenderState`s. """
+    if old is None:
+        return set(['slice']) | set(RenderState._fields[2:])
+
+    changed = set(name for name in RenderState._fields[2:] if getattr(old, name) != getattr(new, name))
+    if (old.axis, old.index) != (new.axis, new.index):
+        changed.add('slice')
+    return changed
+
+
+def invalidated_panels(changed):
+    """ Panels that have to be re-rendered when the inputs in `changed` change. """
+    return tuple(name for name in panelNames if changed.intersection(panelDependencies[name]))
+
+
+def bgra_table(cmap):
+    """ Build a 256-entry BGRA lookup table packed as uint32 from a (N, 3) RGB colormap in [0, 1]. """
+    cmap = np.asarray(cmap)
+    assert cmap.ndim == 2 and cmap.shape[1] >= 3, '`cmap` should be (N, 3)..'
+    assert len(cmap) <= 256, '`len(cmap)` should be <= 256..'
+
+    table = np.zeros((256, 4), np.uint8)
+    table[:len(cmap), :3] = (255.*cmap[:, 2::-1]).astype(np.uint8)  # NOTE: opencv's BGR format
+    table[:, 3] = 255
+    return table.view(np.uint32).ravel()
+
+
+def gray_table():
+    """ Identity gray ramp as a packed BGRA uint32 table. """
+    table = np.repeat(np.arange(256, dtype=np.uint8)[:, None], 4, axis=1)
+    table[:, 3] = 255
+    return table.view(np.uint32).ravel()
+
+
+def blend_table(gray, color, alpha):
+    """ Packed BGRA table of `(1 - alpha) * gray + alpha * color`, indexed by `color_index << 8 | gray_index`. """
+    gray = gray.view(np.uint8).reshape(-1, 4).astype(np.float32)
+    color = color.view(np.uint8).reshape(-1, 4).astype(np.float32)
+    table = (1.0 - alpha) * gray[None, :, :] + alpha * color[:, None, :]
+    return np.rint(table).astype(np.uint8).view(np.uint32).ravel()
+
+
+def window(x, window_level, out, scratch):
+    """ Window `x` into the uint8 buffer `out`, using the float32 buffer `scratch` for intermediates. """
+    w, l = window_level
+    lo = l - w/2.
+    scale = 255. / max(w, np.finfo(np.float32).eps)
+
+    np.subtract(x, lo, out=scratch, dtype=np.float32)
+    np.multiply(scratch, scale, out=scratch)
+    np.clip(scratch, 0., 255., out=scratch)
+    np.copyto(out, scratch, casting='unsafe')
+    return out
+
+
+class SliceWindower(object):
+    """ Window slices of one volume with a transform precomputed per window/level.
+
+    8-bit volumes go through a 256-entry uint8 table with `cv2.LUT`. Wider
+    integer and float volumes are clamped at the lower window edge into a
+    float32 buffer and then scaled and saturated to uint8 by
+    `cv2.convertScaleAbs` in a single pass.
+    """
+
+    def __init__(self, volume):
+
+        self.volume = volume
+        dtype = volume.dtype
+
+        self.lut = dtype.itemsize == 1 and dtype.kind in 'iu'
+        if self.lut:
+            self.values = np.arange(256).astype(np.uint8).view(dtype).astype(np.float32)
+            self.table = np.empty(256, np.uint8)
+
+        self._key = None
+        self._scratch = None
+
+    def _prepare(self, window_level):
+
+        if self._key == window_level:
+            return
+        self._key = window_level
+
+        w, l = window_level
+        if self.lut:
+            window(self.values, window_level, self.table, np.empty(256, np.float32))
+            return
+
+        self.lo = l - w/2.
+        self.alpha = 255. / max(w, np.finfo(np.float32).eps)
+        self.beta = -self.lo * self.alpha - (0.5 - 1e-3)  # NOTE: truncate like `window` instead of rounding
+
+    def __call__(self, x, window_level, out):
+
+        self._prepare(tuple(window_level))
+
+        if self.lut:
+            return cv2.LUT(x.view(np.uint8), self.table, dst=out)
+
+        # NOTE: clamping at the exact lower edge keeps the argument of the abs non-negative
+        if self._scratch is None or self._scratch.shape != x.shape:
+            self._scratch = np.empty(x.shape, np.float32)
+        if x.dtype == np.float32 and x.flags.c_contiguous:
+            cv2.max(x, self.lo, dst=self._scratch)
+        else:
+            np.maximum(x, self.lo, out=self._scratch, dtype=np.float32, casting='unsafe')
+        return cv2.convertScaleAbs(self._scratch, out, self.alpha, self.beta)
+
+
+class SliceRenderer(object):
+    """ Qt independent compositing engine for the five viewer panels.
+
+    All panels are written as BGRA images into buffers owned by the renderer,
+    which are reused across calls and only reallocated when the slice shape or
+    axis changes. The returned arrays are therefore only valid until the next
+    call to `render`.
+
+    Volumes may be `None` until they are available; panels composited from a
+    missing volume are not rendered.
+
+    With `indexed_labels`, the label panel is returned as the uint8 label
+    slice itself, to be colored by the consumer with `label_table` (e.g. as a
+    QImage color table), and the label overlay is looked up in a blend table
+    cached per alpha and colormap.
+    """
+
+    def __init__(self,
+                 image,
+                 label, label_cmap,
+                 uncert, uncert_cmap,
+                 spacing,
+                 indexed_labels=False):
+
+        # NOTE: clones take a copy, so that a volume set while they render is not mixed with the ones before it
+        self.volumes = {'image': image, 'label': label, 'uncert': uncert}
+        self.spacing = spacing
+
+        # NOTE: tables are updated in place so that clones see colormap changes
+        self.gray_table = gray_table()
+        self.label_table = bgra_table(label_cmap)
+        self.uncert_table = bgra_table(uncert_cmap)
+        self.indexed_labels = indexed_labels
+        self.profiler = nullProfiler
+        self.layouts = None
+        self.projections = None
+        self.label_extents = True
+        self._levels = {}
+
+        self._blend_key = None
+        self._blend_table = None
+        self._blend_index = None
+        self._layout = None
+        self._buffers = None
+        self._gray = None
+        self._windowers = {}
+
+    def set_volume(self, name, volume):
+        assert name in self.volumes, 'unknown volume: %s' % name
+        self.volumes[name] = volume
+        self._levels.clear()
+
+    def available_panels(self):
+        return tuple(name for name in panelNames
+                     if all(self.volumes[v] is not None for v in panelVolumes[name]))
+
+    @property
+    def shape(self):
+        for volume in self.volumes.values():
+            if volume is not None:
+                return volume.shape
+        return None
+
+    def set_label_cmap(self, cmap):
+        self.label_table[:] = bgra_table(cmap)
+
+    def set_uncert_cmap(self, cmap):
+        self.uncert_table[:] = bgra_table(cmap)
+
+    def clone(self):
+        """ Renderer sharing the volume arrays and tables of this one but with its own buffers.
+
+        The clone keeps the volumes set so far; `set_volume` on either one
+        does not affect the other.
+        """
+        renderer = copy.copy(self)
+        renderer.volumes = dict(self.volumes)
+        renderer._layout = None
+        renderer._buffers = None
+        renderer._gray = None
+        renderer._windowers = {}
+        renderer._blend_key = None
+        renderer._blend_index = None
+        renderer._levels = {}
+        return renderer
+
+    def oblique_geometry(self, plane):
+        return get_oblique_geometry(self.shape, self.spacing, plane)
+
+    def slice_shape(self, axis):
+        """ (rows, cols) of the slices along `axis`, an axis name or an `ObliquePlane`. """
+        if isinstance(axis, ObliquePlane):
+            return self.oblique_geometry(axis).shape
+        return get_slice_shape(self.shape, axis)
+
+    def slice_spacing(self, axis):
+        """ (rows, cols) pixel spacing of the slices along `axis`, or None without a spacing. """
+        if isinstance(axis, ObliquePlane):
+            return self.oblique_geometry(axis).pixel
+        if self.spacing is None:
+            return None
+        return get_slice_spacing(self.spacing, axis)
+
+    def slice_count(self, axis):
+        if isinstance(axis, ObliquePlane):
+            return self.oblique_geometry(axis).n_slices
+        return self.shape[{'Axial': 2, 'Coronal': 1, 'Sagittal': 0}[axis]]
+
+    def _axis_slice(self, volume, axis, index):
+        if self.layouts is not None:
+            return self.layouts.get_slice(volume, axis, index)
+        return get_slice(volume, axis, index)
+
+    def _axis_slab(self, volume, axis, start, stop):
+        if not isinstance(volume, np.ndarray):
+            return np.stack([get_slice(volume, axis, k) for k in range(start, stop)])
+        if self.layouts is not None:
+            return self.layouts.source(volume, axis)[start:stop]
+        return slice_view(volume, axis)[start:stop]
+
+    def get_slice(self, name, axis, index):
+        """ Slice of volume `name`, read from a slice-contiguous copy if `layouts` has one.
+
+        Slices of an `ObliquePlane` are resampled, with the nearest voxel for labels.
+        """
+        volume = self.volumes[name]
+        if isinstance(axis, ObliquePlane):
+            return self.oblique_geometry(axis).sample(lambda a, i, j: self._axis_slab(volume, a, i, j),
+                                                      index, volume.dtype, linear=name != 'label')
+        return self._axis_slice(volume, axis, index)
+
+    def get_projection(self, name, axis, index, projection):
+        """ Slab projection `(mode, thickness)` of volume `name` around slice `index`, or the slice for None.
+
+        Projections are answered from the tables in `projections` once they
+        are built, so moving or resizing the slab does not rescan it, and by
+        scanning the slab until then. Oblique planes are not projected.
+        """
+        if projection is None or isinstance(axis, ObliquePlane):
+            return self.get_slice(name, axis, index)
+        mode, thickness = projection
+        volume = self.volumes[name]
+        n_slices = self.slice_count(axis)
+        lo, hi = slab_bounds(index, thickness, n_slices)
+
+        get_slab = lambda i, j: self._axis_slab(volume, axis, i, j)
+        table = None
+        if self.projections is not None:
+            table = self.projections.get(volume, axis, mode, get_slab, n_slices, self.slice_shape(axis))
+        if table is None:
+            return project_slab(get_slab(lo, hi), mode, volume.dtype)
+        return table.project(lo, hi, get_slab)
+
+    def _window(self, name, x, window_level):
+        windower = self._windowers.get(name)
+        if windower is None or windower.volume is not self.volumes[name]:
+            windower = SliceWindower(self.volumes[name])
+            self._windowers[name] = windower
+        return windower(x, window_level, self._gray)
+
+    def _allocate(self, axis, shape):
+
+        if self._layout == (axis, shape):
+            return
+
+        self._buffers = {name: np.empty(shape + (4,), np.uint8) for name in panelNames}
+        self._gray = np.empty(shape, np.uint8)
+        if self.indexed_labels:
+            self._buffers['label'] = np.empty(shape, np.uint8)
+            self._blend_index = np.empty(shape, np.uint16)
+        self._layout = (axis, shape)
+
+    def _colorize(self, x, table, out):
+        if x.dtype.kind not in 'iu':
+            x = x.astype(np.uint8)
+        np.take(table, x, out=out.view(np.uint32)[..., 0], mode='wrap')
+        return out
+
+    def _label_extent(self, axis, index, shape):
+        """ Box of the slice holding any label, the whole slice if unknown, or None if empty. """
+        volume = self.volumes['label']
+        if not self.label_extents or volume.dtype.kind not in 'iu' or isinstance(axis, ObliquePlane):
+            return (0, shape[0], 0, shape[1])
+        return get_label_index(volume).slice_extent(axis, index)
+
+    def _blend_labels(self, alpha, extent, out):
+
+        key = (alpha, self.label_table.tobytes())
+        if self._blend_key != key:
+            self._blend_table = blend_table(self.gray_table, self.label_table, alpha)
+            self._blend_key = key
+
+        # NOTE: outside of `extent` the label is 0, which only needs the first 256 entries
+        np.take(self._blend_table[:256], self._gray, out=out.view(np.uint32)[..., 0])
+        if extent is None:
+            return out
+
+        r0, r1, c0, c1 = extent
+        index = self._blend_index[r0:r1, c0:c1]
+        np.left_shift(self._buffers['label'][r0:r1, c0:c1], 8, out=index, dtype=np.uint16)
+        np.bitwise_or(index, self._gray[r0:r1, c0:c1], out=index)
+        np.take(self._blend_table, index, out=out[r0:r1, c0:c1].view(np.uint32)[..., 0])
+        return out
+
+    def render(self, state, panels=panelNames):
+
+        axis = state.axis
+        needImage  = any(name in panels for name in ('image', 'labelOverlay', 'uncertOverlay'))
+        needLabel  = any(name in panels for name in ('label', 'labelOverlay'))
+        needUncert = any(name in panels for name in ('uncert', 'uncertOverlay'))
+
+        self._allocate(axis, self.slice_shape(axis))
+        buffers = self._buffers
+
+        profiler = self.profiler
+
+        # image
+        if needImage:
+            with profiler.stage('image.window'):
+                imageSlice = self.get_projection('image', axis, state.index, state.projection)
+                self._window('image', imageSlice, state.image_window_level)
+            with profiler.stage('image.colorize'):
+                self._colorize(self._gray, self.gray_table, buffers['image'])
+
+        # label
+        # NOTE: only the box of the slice occupied by labels is drawn, the rest is background
+        if needLabel:
+            with profiler.stage('label.colorize'):
+                labelSlice = self.get_slice('label', axis, state.index)
+                extent = self._label_extent(axis, state.index, labelSlice.shape)
+                label = buffers['label']
+                if self.indexed_labels:
+                    label.fill(0)
+                else:
+                    label.view(np.uint32).fill(self.label_table[0])
+                if extent is not None:
+                    r0, r1, c0, c1 = extent
+                    if self.indexed_labels:
+                        np.copyto(label[r0:r1, c0:c1], labelSlice[r0:r1, c0:c1], casting='unsafe')
+                    else:
+                        self._colorize(labelSlice[r0:r1, c0:c1], self.label_table, label[r0:r1, c0:c1])
+        if 'labelOverlay' in panels:
+            with profiler.stage('label.overlay'):
+                if self.indexed_labels:
+                    self._blend_labels(state.image_alpha, extent, buffers['labelOverlay'])
+                else:
+                    cv2.addWeighted(buffers['image'], 1.0 - state.image_alpha,
+                                    buffers['label'], state.image_alpha, 0, dst=buffers['labelOverlay'])
+
+        # uncertainty
+        if needUncert:
+            with profiler.stage('uncert.window'):
+                uncertSlice = self.get_projection('uncert', axis, state.index, state.projection)
+                self._window('uncert', uncertSlice, state.uncert_window_level)
+            with profiler.stage('uncert.colorize'):
+                self._colorize(self._gray, self.uncert_table, buffers['uncert'])
+        if 'uncertOverlay' in panels:
+            with profiler.stage('uncert.overlay'):
+                cv2.addWeighted(buffers['image'], 1.0 - state.uncert_alpha,
+                                buffers['uncert'], state.uncert_alpha, 0, dst=buffers['uncertOverlay'])
+
+        images = {name: buffers[name] for name in panels}
+        return images, self.slice_spacing(axis)
+
+    def _level_renderer(self, level):
+        """ Renderer over pyramid level `level` of the volumes, or None while a level is being built. """
+
+        volumes = {}
+        for name, volume in self.volumes.items():
+            if volume is None:
+                volumes[name] = None
+                continue
+            pyramid = get_label_pyramid(volume) if name == 'label' else get_image_pyramid(volume)
+            volumes[name] = pyramid.level(level)
+        if any(volumes[name] is None for name in volumes if self.volumes[name] is not None):
+            return None
+
+        renderer = self._levels.get(level)
+        if renderer is None or any(renderer.volumes[name] is not volumes[name] for name in volumes):
+            renderer = self.clone()
+            renderer.volumes = volumes
+            # NOTE: stretch the padded coarse voxels so that every level spans the same extent
+            spacing = np.asarray(self.spacing if self.spacing is not None else np.ones(3), np.float64)
+            renderer.spacing = spacing * np.asarray(self.shape, np.float64) / np.asarray(renderer.shape)
+            # NOTE: coarse volumes have no label index of their own
+            renderer.label_extents = False
+            self._levels[level] = renderer
+        return renderer
+
+    def prepare_layouts(self, axis):
+        """ Start building slice-contiguous copies of the volumes for `axis`, if there are `layouts`. """
+        if self.layouts is None:
+            return
+        if isinstance(axis, ObliquePlane):
+            # NOTE: oblique slices are resampled from the slices along the axis closest to their normal
+            axis = self.oblique_geometry(axis).axis
+        # NOTE: the coarse levels come after, so they only take what is left of the budget
+        self.layouts.prepare(list(self.volumes.values()) + self.level_volumes(), axis)
+
+    def prepare_projections(self, axis, projection):
+        """ Start building the tables for `projection` of the image and uncertainty along `axis`, if any. """
+        if self.projections is None or projection is None or isinstance(axis, ObliquePlane):
+            return
+        requests = []
+        for name in ('image', 'uncert'):
+            volume = self.volumes[name]
+            if volume is not None:
+                get_slab = lambda i, j, volume=volume: self._axis_slab(volume, axis, i, j)
+                requests.append((volume, get_slab, self.slice_count(axis), self.slice_shape(axis)))
+        self.projections.prepare(requests, axis, projection[0])
+
+    def level_volumes(self):
+        """ Volumes of the pyramid levels rendered from so far, finest first. """
+        return [volume for level in sorted(self._levels)
+                for volume in self._levels[level].volumes.values() if volume is not None]
+
+    def render_coarse(self, state, panels=panelNames, level=1):
+        """ Render from the `2**level` times downsampled pyramid level, as soon as it is built.
+
+        Returns `(images, spacing, level)` with the level actually used, which
+        is 0, i.e. full resolution, until the pyramid level is available.
+        """
+        # NOTE: projections take constant time at full resolution and would need tables for every level
+        if state.projection is not None and not isinstance(state.axis, ObliquePlane):
+            level = 0
+        previous = self._levels.get(level)
+        renderer = self._level_renderer(level) if level > 0 else None
+        if renderer is not None and renderer is not previous:
+            self.prepare_layouts(state.axis)
+        if renderer is None:
+            images, spacing = self.render(state, panels)
+            return images, spacing, 0
+
+        if isinstance(state.axis, ObliquePlane):
+            # NOTE: the coarse slice through the center of the full resolution one
+            fine, coarse = self.oblique_geometry(state.axis), renderer.oblique_geometry(state.axis)
+            scale = np.asarray(renderer.shape, np.float64) / np.asarray(self.shape)
+            center = (fine.voxel(state.index, fine.shape[0] / 2., fine.shape[1] / 2.) + 0.5) * scale - 0.5
+            index = int(np.clip(np.rint(coarse.position(center)[0]), 0, coarse.n_slices - 1))
+        else:
+            index = min(state.index >> level, renderer.slice_count(state.axis) - 1)
+        images, spacing = renderer.render(state._replace(index=index), panels)
+        return images, spacing, level
@@ -0,0 +1,37 @@
+from __future__ import absolute_import
+
+from PyQt5 import QtCore
+
+
+class RenderScheduler(QtCore.QObject):
+    """ Coalesce render requests into at most one render per event loop turn.
+
+    `request` only marks the state dirty; the render itself runs when control
+    returns to the event loop, or after `interval` milliseconds to pace it to
+    the display frame rate. `flush` renders immediately if anything is pending.
+    """
+
+    def __init__(self, callback, interval=0, parent=None):
+        super().__init__(parent)
+
+        self.callback = callback
+        self.dirty = False
+        self.renderCount = 0
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.flush)
+
+    def request(self):
+        self.dirty = True
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        self.timer.stop()
+        if not self.dirty:
+            return
+        self.dirty = False
+        self.renderCount += 1
+        self.callback()
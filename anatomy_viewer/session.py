@@ -0,0 +1,170 @@
+from __future__ import absolute_import
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5.QtCore import pyqtSignal
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import LRUCache
+from .labels import compact_labels, get_label_index, compute_label_report
+from .stats import get_statistics
+from .utils import load_volumes
+
+class CaseVolumes(object):
+    """ The loaded volumes of one case with their spacing, statistics and per-label report. """
+
+    def __init__(self, volumes, spacing, statistics, report=None):
+        self.volumes = volumes
+        self.spacing = spacing
+        self.statistics = statistics
+        self.report = report
+
+    @property
+    def nbytes(self):
+        return sum(volume.nbytes for volume in self.volumes.values())
+
+
+def load_case(files):
+    """ Load the volumes of a case and prepare what the viewer computes on arrival. """
+    (image, label, uncert), spacing = load_volumes(files)
+    label = compact_labels(label)
+    report = None
+    if label.dtype.kind in 'iu':
+        get_label_index(label)
+        report = compute_label_report(label, uncert)
+
+    volumes = {'image': image, 'label': label, 'uncert': uncert}
+    statistics = {name: get_statistics(volume) for name, volume in volumes.items()}
+    return CaseVolumes(volumes, spacing, statistics, report)
+
+
+class SessionController(QtCore.QObject):
+    """ Browse the cases of a study in one `AnatomyViewerApp`.
+
+    Loaded cases are kept in an LRU cache bounded by `cache_bytes`, and the
+    `preload` cases before and after the current one are loaded into it on
+    worker threads, so that stepping through the list swaps volumes that are
+    already in memory.
+    """
+
+    caseLoaded  = pyqtSignal(str, object)  # name, CaseVolumes
+    caseFailed  = pyqtSignal(str, str)
+    caseChanged = pyqtSignal(int)
+
+    def __init__(self, viewer, cases, cache_bytes=4*1024**3, preload=1, max_workers=2, parent=None):
+        super().__init__(parent)
+
+        self.viewer = viewer
+        self.cases = list(cases)
+        self.preload = preload
+        self.cache = LRUCache(cache_bytes)
+        self.current = None
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        self.caseLoaded.connect(self.onCaseLoaded)
+        self.caseFailed.connect(self.onCaseFailed)
+
+    def names(self):
+        return [name for name, _ in self.cases]
+
+    def open(self, index):
+        if not 0 <= index < len(self.cases):
+            return
+        self.current = index
+        name, _ = self.cases[index]
+        self.caseChanged.emit(index)
+
+        case = self.cache.get(name)
+        if case is not None:
+            self.show(name, case)
+        else:
+            self.viewer.ui.statusBar.showMessage('loading %s..' % name)
+            self.request(index)
+
+        for offset in range(1, self.preload + 1):
+            self.request(index + offset)
+            self.request(index - offset)
+
+    def next(self):
+        if self.current is not None:
+            self.open(self.current + 1)
+
+    def previous(self):
+        if self.current is not None:
+            self.open(self.current - 1)
+
+    def request(self, index):
+        """ Start loading case `index` unless it is cached or already on its way. """
+        if not 0 <= index < len(self.cases):
+            return
+        name, files = self.cases[index]
+        with self._lock:
+            if name in self.cache or name in self._pending:
+                return
+            self._pending[name] = self._executor.submit(self._load, name, files)
+
+    def _load(self, name, files):
+        try:
+            case = load_case(files)
+        except Exception as e:
+            self.caseFailed.emit(name, str(e))
+            return
+        self.cache.put(name, case)
+        self.caseLoaded.emit(name, case)
+
+    def onCaseLoaded(self, name, case):
+        with self._lock:
+            self._pending.pop(name, None)
+        if self.current is not None and self.cases[self.current][0] == name:
+            self.show(name, case)
+
+    def onCaseFailed(self, name, message):
+        with self._lock:
+            self._pending.pop(name, None)
+        if self.current is not None and self.cases[self.current][0] == name:
+            self.viewer.ui.statusBar.showMessage('failed to load %s: %s' % (name, message))
+
+    def show(self, name, case):
+        self.viewer.setCase(case.volumes, case.spacing, case.statistics, case.report)
+        self.viewer.setWindowTitle('Anatomy Viewer - %s' % name)
+        self.viewer.ui.statusBar.showMessage('%s (%d/%d)' % (name, self.current + 1, len(self.cases)), 3000)
+
+    def shutdown(self):
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+        self._executor.shutdown(wait=False)
+
+
+class SessionBrowser(QtWidgets.QDockWidget):
+    """ Case list docked next to the viewer; PgUp/PgDown step through the cases. """
+
+    def __init__(self, controller, parent=None):
+        super().__init__('Cases', parent)
+
+        self.controller = controller
+        self.listWidget = QtWidgets.QListWidget(self)
+        self.listWidget.addItems(controller.names())
+        self.setWidget(self.listWidget)
+
+        self.listWidget.currentRowChanged[int].connect(self.onRowChanged)
+        controller.caseChanged[int].connect(self.onCaseChanged)
+
+        window = parent if parent is not None else controller.viewer
+        QtWidgets.QShortcut(QtGui.QKeySequence(QtCore.Qt.Key_PageDown), window, controller.next)
+        QtWidgets.QShortcut(QtGui.QKeySequence(QtCore.Qt.Key_PageUp), window, controller.previous)
+
+    def onRowChanged(self, row):
+        if row != self.controller.current:
+            self.controller.open(row)
+
+    def onCaseChanged(self, index):
+        if self.listWidget.currentRow() != index:
+            self.listWidget.blockSignals(True)
+            self.listWidget.setCurrentRow(index)
+            self.listWidget.blockSignals(False)
@@ -0,0 +1,169 @@
+from __future__ import absolute_import
+
+import threading
+import weakref
+
+import numpy as np
+
+class VolumeStatistics(object):
+    """ Count, mean, variance, min, max and histogram of a volume, gathered in one sweep.
+
+    Integer volumes of up to 16 bits get an exact histogram with one bin per
+    value. Other volumes get `bins` uniform bins whose range is doubled
+    whenever a chunk falls outside of it, so the bin width stays within a
+    factor of two of (max - min) / bins.
+    """
+
+    def __init__(self, bins=4096):
+        assert bins % 2 == 0, '`bins` should be even..'
+        self.bins = bins
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.min = np.inf
+        self.max = -np.inf
+
+        self.histogram = None
+        self.lo = None      # lower edge of the first bin
+        self.width = None   # width of the whole histogram
+        self.offset = None  # value of bin 0 for exact integer histograms
+
+    @property
+    def var(self):
+        return self.m2 / self.count if self.count else 0.
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def edges(self):
+        if self.offset is not None:
+            return np.arange(len(self.histogram) + 1) + self.offset - 0.5
+        return self.lo + np.linspace(0., self.width, len(self.histogram) + 1)
+
+    def update(self, chunk):
+
+        n = chunk.size
+        if n == 0:
+            return
+
+        # moments, merged with Chan et al.'s pairwise update
+        x = chunk.astype(np.float64)
+        mean = x.sum() / n
+        x -= mean
+        m2 = np.square(x, out=x).sum()
+
+        delta = mean - self.mean
+        total = self.count + n
+        self.mean += delta * n / total
+        self.m2 += m2 + delta**2 * self.count * n / total
+        self.count = total
+
+        cmin, cmax = chunk.min(), chunk.max()
+        self.min = min(self.min, cmin)
+        self.max = max(self.max, cmax)
+
+        # histogram
+        if chunk.dtype.kind in 'iu' and chunk.dtype.itemsize <= 2:
+            self._update_exact(chunk)
+        else:
+            self._update_binned(chunk, float(cmin), float(cmax))
+
+    def _update_exact(self, chunk):
+        bits = 8 * chunk.dtype.itemsize
+        unsigned = np.dtype('u%d' % chunk.dtype.itemsize)
+
+        if chunk.dtype.kind == 'i':
+            # flip the sign bit so that the values sort as unsigned
+            chunk = chunk.view(unsigned) ^ unsigned.type(1 << (bits - 1))
+            self.offset = -(1 << (bits - 1))
+        else:
+            self.offset = 0
+
+        counts = np.bincount(chunk.ravel(), minlength=1 << bits)
+        if self.histogram is None:
+            self.histogram = counts
+        else:
+            self.histogram += counts
+
+    def _update_binned(self, chunk, cmin, cmax):
+
+        if self.histogram is None:
+            self.lo = cmin
+            self.width = (cmax - cmin) * (1. + 1e-6) or 1.
+            self.histogram = np.zeros(self.bins, np.int64)
+
+        while cmin < self.lo or cmax > self.lo + self.width:
+            merged = self.histogram.reshape(-1, 2).sum(axis=1)
+            self.histogram = np.zeros_like(self.histogram)
+            if cmin < self.lo:
+                self.histogram[self.bins//2:] = merged
+                self.lo -= self.width
+            else:
+                self.histogram[:self.bins//2] = merged
+            self.width *= 2.
+
+        counts, _ = np.histogram(chunk, self.bins, range=(self.lo, self.lo + self.width))
+        self.histogram += counts
+
+    def percentile(self, q):
+        """ Approximate `q`-th percentile, accurate to one histogram bin. """
+        assert 0. <= q <= 100., '`q` should be in [0, 100]..'
+
+        cdf = np.cumsum(self.histogram)
+        target = q / 100. * cdf[-1]
+        i = min(np.searchsorted(cdf, target), len(cdf) - 1)
+
+        below = cdf[i-1] if i > 0 else 0
+        fraction = (target - below) / self.histogram[i] if self.histogram[i] else 0.
+
+        edges = self.edges
+        value = edges[i] + fraction * (edges[i+1] - edges[i])
+        return float(np.clip(value, self.min, self.max))
+
+
+def compute_statistics(volume, bins=4096, chunk_voxels=1<<22):
+    """ Gather `VolumeStatistics` of `volume` in one chunked sweep along the last axis.
+
+    Chunks follow the slowest axis of volumes returned by `load_volume`, so
+    memory-mapped volumes are read page by page.
+    """
+    statistics = VolumeStatistics(bins)
+    step = max(1, chunk_voxels // max(1, volume.shape[0] * volume.shape[1]))
+
+    for i in range(0, volume.shape[2], step):
+        statistics.update(np.asarray(volume[:,:,i:i+step]))
+
+    return statistics
+
+
+def cached_per_volume(function):
+    """ Cache `function(volume)` for as long as `volume` is alive. """
+    cache = {}
+    lock = threading.Lock()
+
+    def wrapper(volume):
+        key = id(volume)
+
+        with lock:
+            entry = cache.get(key)
+            if entry is not None and entry[0]() is volume:
+                return entry[1]
+
+        result = function(volume)
+
+        with lock:
+            cache[key] = (weakref.ref(volume), result)
+        weakref.finalize(volume, cache.pop, key, None)
+        return result
+
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+@cached_per_volume
+def get_statistics(volume):
+    """ Cached `compute_statistics`; the result lives as long as `volume`. """
+    return compute_statistics(volume)
@@ -0,0 +1,129 @@
+from __future__ import absolute_import
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import pyqtSignal
+
+from .image_view import ImageView
+from .render import panelNames, panel_key, changed_inputs, invalidated_panels
+
+orthogonalAxes = ('Axial', 'Coronal', 'Sagittal')
+
+_slice_axis = {'Axial': 2, 'Coronal': 1, 'Sagittal': 0}
+
+
+def plane_states(state, cursor):
+    """ `{axis: RenderState}` of the three orthogonal planes through voxel `cursor`, with the settings of `state`. """
+    return dict((axis, state._replace(axis=axis, index=int(cursor[_slice_axis[axis]])))
+                for axis in orthogonalAxes)
+
+
+class TriPlanarRenderer(object):
+    """ Render one panel of the three orthogonal planes on a thread pool.
+
+    Every plane has its own clone of the viewer's renderer, so the planes
+    share its volumes, color tables and slice-contiguous copies but not its
+    buffers. `render` only renders the planes whose slice, or an input of the
+    panel, changed since they were last rendered; planes are looked up in and
+    added to the viewer's slice cache, under the same keys as its panels.
+    """
+
+    def __init__(self, renderer, cache, panel='labelOverlay'):
+        assert panel in panelNames, 'unknown panel: %s' % panel
+
+        self.renderer = renderer
+        self.cache = cache
+        self.panel = panel
+
+        self._renderers = {}
+        self._rendered = {}
+        self._executor = ThreadPoolExecutor(max_workers=len(orthogonalAxes))
+
+    def set_panel(self, panel):
+        assert panel in panelNames, 'unknown panel: %s' % panel
+        self.panel = panel
+        self.invalidate()
+
+    def invalidate(self):
+        """ Render every plane on the next call, with fresh clones of the renderer. """
+        self._renderers = {}
+        self._rendered = {}
+
+    def _render(self, axis, state):
+        key = panel_key(self.panel, state)
+        image = self.cache.get(key)
+        if image is not None:
+            return image
+
+        images, _ = self._renderers[axis].render(state, (self.panel,))
+        image = images[self.panel]
+        if self.cache.max_bytes > 0:
+            image = image.copy()
+            self.cache.put(key, image)
+        return image
+
+    def render(self, states, dirty=()):
+        """ `{axis: image}` of the planes of `states` that changed, rendered in parallel. """
+        if self.panel not in self.renderer.available_panels():
+            return {}
+
+        dirty = set(dirty)
+        changed = [axis for axis, state in states.items()
+                   if self.panel in invalidated_panels(changed_inputs(self._rendered.get(axis), state) | dirty)]
+        for axis in changed:
+            if axis not in self._renderers:
+                self._renderers[axis] = self.renderer.clone()
+
+        futures = dict((axis, self._executor.submit(self._render, axis, states[axis])) for axis in changed)
+        images = dict((axis, future.result()) for axis, future in futures.items())
+        self._rendered.update((axis, states[axis]) for axis in changed)
+        return images
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class TriPlanarView(QtWidgets.QDockWidget):
+    """ Axial, coronal and sagittal planes side by side, docked below the viewer.
+
+    Every plane marks the cursor voxel with a crosshair. Clicking a plane
+    emits `planeClicked(axis, row, col)` and scrolling it horizontally
+    `planeScrolled(axis, step)`, for the viewer to move the cursor.
+    """
+
+    planeClicked = pyqtSignal(str, float, float)
+    planeScrolled = pyqtSignal(str, float)
+
+    def __init__(self, parent=None):
+        super().__init__('Planes', parent)
+        self.setFeatures(QtWidgets.QDockWidget.DockWidgetMovable | QtWidgets.QDockWidget.DockWidgetFloatable)
+
+        widget = QtWidgets.QWidget(self)
+        self.comboBoxPanel = QtWidgets.QComboBox(widget)
+        self.comboBoxPanel.addItems(list(panelNames))
+
+        self.views = {}
+        viewLayout = QtWidgets.QHBoxLayout()
+        for axis in orthogonalAxes:
+            view = ImageView(widget)
+            view.setMinimumSize(200, 200)
+            view.clickSignal.connect(lambda row, col, axis=axis: self.planeClicked.emit(axis, row, col))
+            view.sliceSignal.connect(lambda step, axis=axis: self.planeScrolled.emit(axis, step))
+            viewLayout.addWidget(view)
+            self.views[axis] = view
+
+        layout = QtWidgets.QVBoxLayout(widget)
+        layout.addWidget(self.comboBoxPanel)
+        layout.addLayout(viewLayout)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setWidget(widget)
+
+    def setPanel(self, panel):
+        self.comboBoxPanel.blockSignals(True)
+        self.comboBoxPanel.setCurrentText(panel)
+        self.comboBoxPanel.blockSignals(False)
+
+    def fitInView(self):
+        for view in self.views.values():
+            view.fitInView()
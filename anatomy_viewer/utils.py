@@ -1,14 +1,138 @@
 from __future__ import absolute_import
 
-from PyQt5 import QtCore, QtGui, QtWidgets
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import numpy as np
 import cv2
 import SimpleITK as sitk
 
-def load_volume(filename):
+from .chunked import is_chunked, read_chunked
+
+_met_types = {
+    'MET_CHAR': 'i1',
+    'MET_UCHAR': 'u1',
+    'MET_SHORT': 'i2',
+    'MET_USHORT': 'u2',
+    'MET_INT': 'i4',
+    'MET_UINT': 'u4',
+    'MET_LONG_LONG': 'i8',
+    'MET_ULONG_LONG': 'u8',
+    'MET_FLOAT': 'f4',
+    'MET_DOUBLE': 'f8',
+}
+
+
+def _read_mhd_header(filename):
+
+    header = {}
+    offset = 0
+    with open(filename, 'rb') as f:
+        for line in f:
+            offset += len(line)
+            key, sep, value = line.decode('latin-1').partition('=')
+            if not sep:
+                continue
+            header[key.strip()] = value.strip()
+            if key.strip() == 'ElementDataFile':
+                break
+
+    return header, offset
+
+
+def memmap_volume(filename):
+    """ Memory-map an uncompressed MetaImage or NumPy file.
+
+    Returns `None` when the file cannot be mapped (e.g. compressed or
+    multi-file MetaImage), in which case it has to be decoded as usual.
+    NumPy files are expected in SimpleITK's (z, y, x) order and have unit spacing.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+
+    if ext == '.npy':
+        volume = np.load(filename, mmap_mode='r')
+        if volume.ndim != 3:
+            raise ValueError('`volume.ndim` should be 3..')
+        return volume.transpose(2,1,0), np.ones(3)
+
+    if ext not in ('.mhd', '.mha'):
+        return None
+
+    header, offset = _read_mhd_header(filename)
+
+    if header.get('CompressedData', 'False').lower() == 'true':
+        return None
+    if int(header.get('ElementNumberOfChannels', 1)) != 1:
+        return None
+    if header.get('ElementType') not in _met_types:
+        return None
+
+    datafile = header.get('ElementDataFile')
+    if datafile is None or datafile.upper() == 'LIST' or '%' in datafile:
+        return None
+
+    if datafile.upper() == 'LOCAL':
+        datafile = filename
+    else:
+        datafile = os.path.join(os.path.dirname(filename), datafile)
+        offset = 0
+
+    dims = [int(x) for x in header['DimSize'].split()]
+    if len(dims) != 3:
+        raise ValueError('`volume.ndim` should be 3..')
+
+    spacing = header.get('ElementSpacing', header.get('ElementSize', '1 1 1'))
+    spacing = np.array([float(x) for x in spacing.split()])
+
+    msb = header.get('BinaryDataByteOrderMSB', header.get('ElementByteOrderMSB', 'False'))
+    dtype = np.dtype(('>' if msb.lower() == 'true' else '<') + _met_types[header['ElementType']])
+
+    headersize = int(header.get('HeaderSize', 0))
+    if headersize == -1:
+        offset = os.path.getsize(datafile) - dtype.itemsize * int(np.prod(dims))
+    elif headersize > 0:
+        offset += headersize
+
+    volume = np.memmap(datafile, dtype=dtype, mode='r', offset=offset, shape=tuple(dims[::-1]))
+    return volume.transpose(2,1,0), spacing
+
+
+def open_volume(filename):
+    """ Open a volume without reading it: chunked volumes lazily, uncompressed files memory-mapped.
+
+    Returns `None` for files that have to be decoded.
+    """
+    if is_chunked(filename):
+        return read_chunked(filename)
+    return memmap_volume(filename)
+
+
+def load_volume(filename, mmap=True, progress=None):
+    """ Load a volume in (x, y, z) order with its spacing.
+
+    With `mmap`, chunked volumes are opened lazily and uncompressed files are
+    memory-mapped. `progress`, if given, is called with the fraction read so far.
+    """
+    if mmap:
+        opened = open_volume(filename)
+        if opened is not None:
+            if progress is not None:
+                progress(1.0)
+            return opened
+    elif is_chunked(filename):
+        volume, spacing = read_chunked(filename)
+        return np.asarray(volume), spacing
+
+    if progress is None:
+        itkimage = sitk.ReadImage(filename)
+    else:
+        reader = sitk.ImageFileReader()
+        reader.SetFileName(filename)
+        reader.AddCommand(sitk.sitkProgressEvent, lambda: progress(reader.GetProgress()))
+        itkimage = reader.Execute()
+        progress(1.0)
 
-    itkimage = sitk.ReadImage(filename)
     volume = sitk.GetArrayFromImage(itkimage)
     spacing = np.array(itkimage.GetSpacing())
 
@@ -18,27 +142,92 @@ def load_volume(filename):
         raise ValueError('`volume.ndim` should be 3..')
 
 
-def numpy_to_qpixmap(image):
+
+def load_volumes(filenames, mmap=True, max_workers=None, processes=False):
+    """ Load several volumes concurrently and check that they share one grid.
+
+    Chunked and memory-mappable files are opened in place; the others are
+    decoded on a thread pool, or on a process pool if `processes` is set.
+    Returns the list of volumes and the spacing of the first one.
+    """
+    results = [open_volume(f) if mmap else None for f in filenames]
+    pending = [f for f, r in zip(filenames, results) if r is None]
+
+    if pending:
+        if max_workers is None:
+            max_workers = len(pending)
+        executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        with executor_class(max_workers=max_workers) as executor:
+            decoded = iter(executor.map(load_volume, pending, [False] * len(pending)))
+        results = [r if r is not None else next(decoded) for r in results]
+
+    volumes = [volume for volume, _ in results]
+    spacing = results[0][1]
+
+    for filename, (volume, s) in zip(filenames, results):
+        if volume.shape != volumes[0].shape:
+            raise ValueError('shape of %s %s != %s' % (filename, volume.shape, volumes[0].shape))
+        if not np.allclose(s, spacing, rtol=1e-3):
+            warnings.warn('spacing of %s %s != %s' % (filename, s, spacing))
+
+    return volumes, spacing
+
+def color_table(table):
+    """ QImage color table (list of QRgb) from a packed BGRA uint32 table. """
+    bgra = np.asarray(table).view(np.uint8).reshape(-1, 4).astype(np.uint32)
+    return ((bgra[:, 3] << 24) | (bgra[:, 2] << 16) | (bgra[:, 1] << 8) | bgra[:, 0]).tolist()
+
+
+def numpy_to_qimage(image, rgb=False, colorTable=None):
+    """ Wrap a uint8 numpy image in a QImage without copying the pixels.
+
+    2D images become `Format_Grayscale8`, or `Format_Indexed8` if a
+    `colorTable` is given; 3- and 4-channel images are taken as opencv's
+    BGR(A) order, or as RGB(A) if `rgb` is set. The QImage keeps a reference
+    to the array, so the buffer outlives every use of the image.
+    """
+    # NOTE: imported here, so that volumes can be loaded without Qt, e.g. by `muscle_render`
+    from PyQt5 import QtGui
+
     assert isinstance(image, np.ndarray), '`image` should be `np.ndarray`..'
+    assert image.dtype == np.uint8, '`image.dtype` should be uint8..'
+
+    if image.ndim == 3 and image.shape[-1] == 1:
+        image = image[..., 0]
+
+    # NOTE: rows may be padded, but pixels have to be packed
+    if image.strides[-1] != 1 or (image.ndim == 3 and image.strides[1] != image.shape[2]) \
+            or image.strides[0] < 0:
+        image = np.ascontiguousarray(image)
 
     if image.ndim == 2:
-        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
-    if image.ndim == 3:
-        ch = image.shape[-1]
-        if ch == 1:
-            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
-        elif ch == 3:
+        fmt = QtGui.QImage.Format_Grayscale8 if colorTable is None else QtGui.QImage.Format_Indexed8
+    elif image.shape[-1] == 4:
+        fmt = QtGui.QImage.Format_RGBA8888 if rgb else QtGui.QImage.Format_ARGB32_Premultiplied
+    elif image.shape[-1] == 3:
+        if rgb:
+            fmt = QtGui.QImage.Format_RGB888
+        elif hasattr(QtGui.QImage, 'Format_BGR888'):
+            fmt = QtGui.QImage.Format_BGR888
+        else:
             image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
-
-    assert image.ndim == 3, '`image.ndim` should be 3..'
-    assert image.shape[-1] == 4, '`image.shape[-1]` should be 4..'
+            fmt = QtGui.QImage.Format_ARGB32_Premultiplied
+    else:
+        raise ValueError('`image.shape[-1]` should be 1, 3 or 4..')
 
     qimage = QtGui.QImage(image.data,
                           image.shape[1], image.shape[0],
-                          image.shape[1] * 4,
-                          QtGui.QImage.Format_ARGB32_Premultiplied)
-    qpixmap = QtGui.QPixmap.fromImage(qimage)
-    return qpixmap
+                          image.strides[0],
+                          fmt)
+    if fmt == QtGui.QImage.Format_Indexed8:
+        qimage.setColorTable(colorTable)
+    qimage.ndarray = image
+    return qimage
+
+
+def numpy_to_qpixmap(image):
+    from PyQt5 import QtGui
+    return QtGui.QPixmap.fromImage(numpy_to_qimage(image))
 
 
 def lut(label, cmap):
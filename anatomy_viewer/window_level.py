@@ -0,0 +1,42 @@
+from __future__ import absolute_import
+
+import collections
+
+import numpy as np
+
+
+def percentile_window(statistics, lower, upper):
+    """ Window/level spanning the `lower`-`upper` percentiles of a `VolumeStatistics`. """
+    lo, hi = statistics.percentile(lower), statistics.percentile(upper)
+    return hi - lo, (hi + lo) / 2.
+
+
+def slice_window(x, lower, upper, step=4):
+    """ Window/level spanning the `lower`-`upper` percentiles of a (subsampled) slice. """
+    lo, hi = np.percentile(x[::step, ::step], (lower, upper))
+    return float(hi - lo), float(hi + lo) / 2.
+
+
+# window/level presets, evaluated on the cached statistics of the volume and the current slice
+imageWindowPresets = collections.OrderedDict([
+    ('Mean +/- 1.5 SD', lambda s, x: (3.0 * s.std, s.mean)),
+    ('Percentile 1-99', lambda s, x: percentile_window(s, 1., 99.)),
+    ('Percentile 5-95', lambda s, x: percentile_window(s, 5., 95.)),
+    ('Min-Max', lambda s, x: (s.max - s.min, (s.max + s.min) / 2.)),
+    ('CT Soft tissue', lambda s, x: (400., 40.)),
+    ('CT Abdomen', lambda s, x: (350., 50.)),
+    ('CT Bone', lambda s, x: (1800., 400.)),
+    ('CT Lung', lambda s, x: (1500., -600.)),
+    ('CT Brain', lambda s, x: (80., 40.)),
+    ('Slice adaptive', lambda s, x: slice_window(x, 1., 99.)),
+])
+
+uncertWindowPresets = collections.OrderedDict([
+    ('Zero-Percentile 99', lambda s, x: (s.percentile(99.), s.percentile(99.) / 2.)),
+    ('Percentile 1-99', lambda s, x: percentile_window(s, 1., 99.)),
+    ('Min-Max', lambda s, x: (s.max - s.min, (s.max + s.min) / 2.)),
+    ('Slice adaptive', lambda s, x: slice_window(x, 1., 99.)),
+])
+
+# presets that follow the current slice
+adaptiveWindowPresets = ('Slice adaptive',)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Benchmarks of the rendering and loading hot paths on synthetic volumes.
+
+    python benchmarks/bench_viewer.py --shape 256 256 256 --dtype int16 -o results.json
+
+Runs under Qt's offscreen platform unless QT_QPA_PLATFORM is set, and writes
+the timings of every benchmark, plus a frame time summary per slice axis, as
+JSON so that runs can be compared.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import shutil
+import tempfile
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+import cv2
+import SimpleITK as sitk
+from PyQt5 import QtWidgets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from anatomy_viewer import AnatomyViewerApp
+from anatomy_viewer.colormaps import default_label_cmap, default_uncert_cmap
+from anatomy_viewer.image_view import ImageView
+from anatomy_viewer.labels import compute_label_report
+from anatomy_viewer.render import get_slice
+from anatomy_viewer.stats import compute_statistics
+from anatomy_viewer.utils import clim, lut, numpy_to_qpixmap, load_volume
+
+_axes = ('Axial', 'Coronal', 'Sagittal')
+_slice_axis = {'Axial': 2, 'Coronal': 1, 'Sagittal': 0}
+
+
+def synthetic_volumes(shape, dtype, seed=0):
+    """ Image of `dtype`, a blocky label volume and a uniform uncertainty volume of `shape`. """
+    rng = np.random.RandomState(seed)
+    dtype = np.dtype(dtype)
+
+    if dtype.kind == 'f':
+        image = rng.standard_normal(shape).astype(dtype)
+    else:
+        info = np.iinfo(dtype)
+        lo, hi = max(info.min, -1024), min(info.max, 3071)
+        image = rng.randint(lo, hi + 1, shape).astype(dtype)
+
+    label = blocky_labels(shape, len(default_label_cmap), rng)
+    uncert = rng.random_sample(shape).astype(np.float32)
+    return image, label, uncert
+
+
+def blocky_labels(shape, n_labels, rng, block=16):
+    """ Label volume of `shape` made of blocks of up to `n_labels` labels, as the structures of segmentations. """
+    dtype = np.uint8 if n_labels <= 256 else np.uint16
+    coarse = rng.randint(0, n_labels, [(s + block - 1) // block for s in shape]).astype(dtype)
+    label = coarse.repeat(block, 0).repeat(block, 1).repeat(block, 2)[:shape[0], :shape[1], :shape[2]]
+    return np.ascontiguousarray(label)
+
+
+def measure(function, repeat, warmup=1):
+    """ Wall times of `repeat` calls of `function` in milliseconds. """
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(1e3 * (time.perf_counter() - start))
+    return times
+
+
+def summarize(times):
+    times = np.asarray(times)
+    return {
+        'n': int(len(times)),
+        'mean_ms': float(times.mean()),
+        'median_ms': float(np.median(times)),
+        'min_ms': float(times.min()),
+        'p95_ms': float(np.percentile(times, 95)),
+        'max_ms': float(times.max()),
+    }
+
+
+def bench_utils(image, label, axis, repeat):
+
+    index = image.shape[_slice_axis[axis]] // 2
+    imageSlice = get_slice(image, axis, index)
+    labelSlice = np.ascontiguousarray(get_slice(label, axis, index))
+    param = (float(image.min()), float(image.max()))
+
+    gray = clim(imageSlice, param).astype(np.uint8)
+    bgra = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGRA)
+
+    return {
+        'clim': measure(lambda: clim(imageSlice, param), repeat),
+        'lut': measure(lambda: lut(labelSlice, default_label_cmap), repeat),
+        'numpy_to_qpixmap': measure(lambda: numpy_to_qpixmap(bgra), repeat),
+        'slice': measure(lambda: np.ascontiguousarray(get_slice(image, axis, index)), repeat),
+    }
+
+
+def bench_label_report(uncert, repeat, counts=(8, 256, 4096)):
+    """ Label reports of volumes with more and more labels, whose times should stay about the same. """
+    rng = np.random.RandomState(0)
+    results = {}
+    for n_labels in counts:
+        label = blocky_labels(uncert.shape, n_labels, rng)
+        results['compute_label_report/%d labels' % n_labels] = \
+            measure(lambda: compute_label_report(label, uncert), repeat, 0)
+    return results
+
+
+def bench_load(image, repeat):
+
+    results = {}
+    directory = tempfile.mkdtemp()
+    itkimage = sitk.GetImageFromArray(image.transpose(2,1,0))
+
+    for name, compress in (('raw', False), ('compressed', True)):
+        filename = os.path.join(directory, '%s.mhd' % name)
+        sitk.WriteImage(itkimage, filename, compress)
+        results['load_volume_%s' % name] = measure(lambda: load_volume(filename, mmap=False), repeat, 0)
+        if not compress:
+            results['load_volume_mmap'] = measure(
+                lambda: np.asarray(load_volume(filename)[0][:,:,::16]), repeat, 0)
+
+    shutil.rmtree(directory)
+    return results
+
+
+def bench_set_image(image, axis, repeat):
+
+    view = ImageView()
+    view.resize(512, 512)
+    view.show()
+
+    n = image.shape[_slice_axis[axis]]
+    gray = clim(get_slice(image, axis, n // 2), (float(image.min()), float(image.max()))).astype(np.uint8)
+    bgra = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGRA)
+
+    times = measure(lambda: view.setImage(bgra, (1., 1.)), repeat)
+    view.close()
+    return times
+
+
+def bench_update(app, window, axis, repeat):
+    """ Frame times of scrolling through new slices, each one rendered and pushed to the views. """
+    window.setSliceAxis(axis)
+    app.processEvents()
+
+    n = window.renderer.slice_count(window.sliceAxis)
+    window.ui.spinBoxSliceIndex.setValue(0)
+    window.scheduler.flush()
+
+    times = []
+    for i in range(repeat):
+        window.addSliceIndex(1 if (i // (n - 1)) % 2 == 0 else -1)
+        start = time.perf_counter()
+        window.scheduler.flush()
+        app.processEvents()
+        times.append(1e3 * (time.perf_counter() - start))
+    return times
+
+
+def compare(report, baseline):
+    """ Lines with the median time of each benchmark relative to a previous report. """
+    lines = []
+    for name, summary in sorted(report['results'].items()):
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['median_ms']
+        lines.append('%-40s %9.3f -> %9.3f ms  x%.2f' %
+                     (name, before, summary['median_ms'], summary['median_ms'] / max(before, 1e-9)))
+    return lines
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Anatomy Viewer: benchmarks',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--shape', type=int, nargs=3, default=[256, 256, 256], help='Volume shape (x, y, z)')
+    parser.add_argument('--dtype', type=str, default='int16', help='Image dtype, e.g. int16, uint8 or float32')
+    parser.add_argument('--repeat', type=int, default=50, help='Calls per benchmark')
+    parser.add_argument('--load-repeat', type=int, default=3, help='Calls per loading benchmark')
+    parser.add_argument('--cache-bytes', type=int, default=0, help='Slice cache of the viewer (0: disabled)')
+    parser.add_argument('--prefetch', type=int, default=0, help='Prefetch depth of the viewer')
+    parser.add_argument('--pyramid-levels', type=int, default=0,
+                        help='Coarse levels the viewer may draw from while scrolling (0: always full resolution)')
+    parser.add_argument('--oblique', type=float, nargs=2, default=[30., 20.], metavar=('PITCH', 'YAW'),
+                        help='Tilt of the oblique plane whose frame times are measured, in degrees')
+    parser.add_argument('--skip-load', action='store_true', help='Skip the loading benchmarks')
+    parser.add_argument('--out', '-o', type=str, default=None, help='JSON output (default: stdout)')
+    parser.add_argument('--baseline', type=str, default=None, help='Previous JSON output to compare with')
+    args = parser.parse_args()
+
+    shape = tuple(args.shape)
+    image, label, uncert = synthetic_volumes(shape, args.dtype)
+    spacing = np.array([0.8, 0.8, 2.0])
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+    results = {}
+
+    for axis in _axes:
+        for name, times in bench_utils(image, label, axis, args.repeat).items():
+            results['%s/%s' % (name, axis)] = summarize(times)
+        results['ImageView.setImage/%s' % axis] = summarize(bench_set_image(image, axis, args.repeat))
+
+    if not args.skip_load:
+        for name, times in bench_load(image, args.load_repeat).items():
+            results[name] = summarize(times)
+
+    results['compute_statistics/image'] = summarize(measure(lambda: compute_statistics(image), 3, 0))
+    results['compute_statistics/uncert'] = summarize(measure(lambda: compute_statistics(uncert), 3, 0))
+    for name, times in bench_label_report(uncert, 3).items():
+        results[name] = summarize(times)
+
+    window = AnatomyViewerApp(image,
+                              label, default_label_cmap,
+                              uncert, default_uncert_cmap,
+                              spacing,
+                              cache_bytes=args.cache_bytes,
+                              prefetch_depth=args.prefetch,
+                              pyramid_levels=args.pyramid_levels)
+    window.show()
+    app.processEvents()
+
+    window.ui.doubleSpinBoxPitch.setValue(args.oblique[0])
+    window.ui.doubleSpinBoxYaw.setValue(args.oblique[1])
+
+    frame_time = {}
+    for axis in _axes + ('Oblique',):
+        times = bench_update(app, window, axis, args.repeat)
+        results['AnatomyViewerApp.update/%s' % axis] = summarize(times)
+        frame_time[axis] = {
+            'median_ms': float(np.median(times)),
+            'p95_ms': float(np.percentile(times, 95)),
+            'fps': float(1e3 / np.median(times)),
+        }
+    window.close()
+
+    report = {
+        'config': {
+            'shape': list(shape),
+            'dtype': args.dtype,
+            'repeat': args.repeat,
+            'cache_bytes': args.cache_bytes,
+            'prefetch': args.prefetch,
+            'pyramid_levels': args.pyramid_levels,
+            'oblique': list(args.oblique),
+            'qt_platform': os.environ.get('QT_QPA_PLATFORM'),
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+        'frame_time': frame_time,
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out is None:
+        print(text)
+    else:
+        with open(args.out, 'w') as f:
+            f.write(text)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            for line in compare(report, json.load(f)):
+                sys.stderr.write(line + '\n')
+
+    for axis, summary in frame_time.items():
+        sys.stderr.write('%-8s median %.2f ms, p95 %.2f ms, %.1f fps\n' %
+                         (axis, summary['median_ms'], summary['p95_ms'], summary['fps']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import SimpleITK as sitk
+
+from anatomy_viewer.chunked import write_chunked
+from anatomy_viewer.labels import compact_labels
+from anatomy_viewer.cases import case_name
+from anatomy_viewer.utils import load_volume
+
+
+def geometry(filename):
+    """ Origin and direction of a volume, read from its header; identity for NumPy files. """
+    if filename.lower().endswith('.npy'):
+        return np.zeros(3), np.eye(3).ravel()
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(filename)
+    reader.ReadImageInformation()
+    return np.array(reader.GetOrigin()), np.array(reader.GetDirection())
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Anatomy Viewer: convert volumes to the chunked format',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('volumes', type=str, nargs='*', help='Paths to volume files')
+    parser.add_argument('--label', type=str, action='append', default=[], metavar='FILE',
+                        help='Path to a label volume, stored with compact labels')
+    parser.add_argument('--labels', type=str, default='auto', choices=('auto', 'all', 'none'),
+                        help='Which of the volumes hold labels; auto: those with "label" in their name')
+    parser.add_argument('--out', '-o', type=str, default='.',
+                        help='Output directory; each volume is written to <name>.chunks in it')
+    parser.add_argument('--chunks', type=int, nargs=3, default=[64, 64, 64], help='Chunk shape (x, y, z)')
+    parser.add_argument('--level', type=int, default=1, help='zlib compression level (1: fastest)')
+    parser.add_argument('--workers', type=int, default=None, help='Compression threads')
+    args = parser.parse_args()
+    if not args.volumes and not args.label:
+        parser.error('no volumes given')
+
+    def is_label(filename):
+        if args.labels == 'auto':
+            return 'label' in case_name(filename).lower()
+        return args.labels == 'all'
+
+    inputs = [(filename, is_label(filename)) for filename in args.volumes] + \
+             [(filename, True) for filename in args.label]
+
+    for filename, is_label in inputs:
+        start = time.time()
+        name = case_name(filename)
+        path = os.path.join(args.out, name + '.chunks')
+
+        volume, spacing = load_volume(filename)
+        # NOTE: label volumes are stored compact, so the viewer does not have to convert them
+        if is_label:
+            volume = compact_labels(volume)
+        origin, direction = geometry(filename)
+
+        write_chunked(volume, path, spacing, origin, direction,
+                      chunks=args.chunks, level=args.level, max_workers=args.workers)
+
+        stored = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        sys.stderr.write('%s -> %s: %d MB -> %d MB in %.1f s\n' %
+                         (filename, path, volume.nbytes >> 20, stored >> 20, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
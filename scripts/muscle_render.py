@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import cv2
+import SimpleITK as sitk
+
+from anatomy_viewer.render import SliceRenderer, RenderState, panelNames, get_slice
+from anatomy_viewer.stats import get_statistics
+from anatomy_viewer.labels import compact_labels
+from anatomy_viewer.cases import read_manifest, case_name
+from anatomy_viewer.utils import load_volumes, open_volume
+from anatomy_viewer.window_level import imageWindowPresets, uncertWindowPresets, adaptiveWindowPresets
+from anatomy_viewer.colormaps import default_label_cmap, default_uncert_cmap
+
+_axes = ('Axial', 'Coronal', 'Sagittal')
+_slice_axis = {'Axial': 2, 'Coronal': 1, 'Sagittal': 0}
+
+# NOTE: the case last loaded by this worker; tasks are sharded by case, so it is loaded once per worker
+_worker_case = {}
+
+
+def parse_slices(spec, n_slices):
+    """ Slice indices from `start:stop:step` or a comma separated list. """
+    if ':' in spec:
+        bounds = [int(s) if s else None for s in spec.split(':')]
+        return list(range(n_slices))[slice(*bounds)]
+    return [int(s) for s in spec.split(',') if 0 <= int(s) < n_slices]
+
+
+def volume_shape(filename):
+    """ (x, y, z) shape of a volume, read from its header. """
+    opened = open_volume(filename)
+    if opened is not None:
+        return opened[0].shape
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(filename)
+    reader.ReadImageInformation()
+    return tuple(reader.GetSize())
+
+
+def load_renderer(files):
+    """ Renderer of a case and the statistics of its image and uncertainty, cached for the next task. """
+
+    key = tuple(files)
+    if _worker_case.get('key') == key:
+        return _worker_case['renderer'], _worker_case['statistics']
+
+    _worker_case.clear()
+    (image, label, uncert), spacing = load_volumes(files)
+    label = compact_labels(label)
+    renderer = SliceRenderer(image,
+                             label, default_label_cmap,
+                             uncert, default_uncert_cmap,
+                             spacing)
+    statistics = {'image': get_statistics(image), 'uncert': get_statistics(uncert)}
+    _worker_case.update(key=key, renderer=renderer, statistics=statistics)
+    return renderer, statistics
+
+
+def compose(images, panels, spacing):
+    """ Panels side by side as one BGR frame, stretched to the physical aspect ratio. """
+    frame = np.concatenate([images[name] for name in panels], axis=1)
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+
+    if spacing is not None:
+        base = min(spacing)
+        size = (int(round(frame.shape[1] * spacing[1] / base)),
+                int(round(frame.shape[0] * spacing[0] / base)))
+        if size != (frame.shape[1], frame.shape[0]):
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_NEAREST)
+    return frame
+
+
+def render_task(task):
+    """ Render one chunk of slices of one case and axis; writes PNGs or returns the frames. """
+    files, axis, indices, options = task
+
+    renderer, statistics = load_renderer(files)
+    volumes = renderer.volumes
+
+    frames = []
+    for index in indices:
+        window_levels = {}
+        for name, presets in (('image', imageWindowPresets), ('uncert', uncertWindowPresets)):
+            preset = options[name + '_preset']
+            x = get_slice(volumes[name], axis, index) if preset in adaptiveWindowPresets else None
+            window_levels[name] = tuple(float(v) for v in presets[preset](statistics[name], x))
+
+        state = RenderState(axis, index,
+                            window_levels['image'], window_levels['uncert'],
+                            options['image_alpha'], options['uncert_alpha'])
+        images, spacing = renderer.render(state, options['panels'])
+        frame = compose(images, options['panels'], spacing if options['spacing'] else None)
+
+        if options['format'] == 'png':
+            cv2.imwrite(os.path.join(options['out'], '%s_%04d.png' % (axis, index)), frame)
+        else:
+            frames.append(frame)
+
+    return len(indices), frames
+
+
+def montage(frames, columns):
+    rows = int(np.ceil(len(frames) / float(columns)))
+    h, w = frames[0].shape[:2]
+    grid = np.zeros((rows * h, columns * w, 3), np.uint8)
+    for i, frame in enumerate(frames):
+        r, c = divmod(i, columns)
+        grid[r*h:(r+1)*h, c*w:(c+1)*w] = frame[:h, :w]
+    return grid
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Anatomy Viewer: headless batch rendering',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--case', type=str, nargs=3, action='append', default=[],
+                        metavar=('IMAGE', 'LABEL', 'UNCERTAINTY'), help='Paths to the volumes of a case')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='CSV file with the columns image, label, uncertainty and optionally name')
+    parser.add_argument('--out', '-o', type=str, default='render', help='Output directory')
+    parser.add_argument('--format', type=str, default='png', choices=('png', 'montage', 'video'),
+                        help='One PNG per slice, one montage grid or one video per case and axis')
+    parser.add_argument('--axes', type=str, nargs='+', default=list(_axes), choices=_axes)
+    parser.add_argument('--slices', type=str, default=':', help='start:stop:step or comma separated indices')
+    parser.add_argument('--panels', type=str, nargs='+', default=list(panelNames), choices=panelNames)
+    parser.add_argument('--image-preset', type=str, default=list(imageWindowPresets.keys())[0],
+                        choices=list(imageWindowPresets.keys()))
+    parser.add_argument('--uncert-preset', type=str, default=list(uncertWindowPresets.keys())[0],
+                        choices=list(uncertWindowPresets.keys()))
+    parser.add_argument('--image-alpha', type=float, default=0.2)
+    parser.add_argument('--uncert-alpha', type=float, default=0.2)
+    parser.add_argument('--no-spacing', action='store_true', help='Keep one pixel per voxel')
+    parser.add_argument('--columns', type=int, default=8, help='Columns of the montage grid')
+    parser.add_argument('--fps', type=float, default=10., help='Frame rate of the videos')
+    parser.add_argument('--chunk', type=int, default=16, help='Slices per task')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    cases = [(case_name(files[0]), files) for files in args.case]
+    if args.manifest is not None:
+        cases += read_manifest(args.manifest)
+    if not cases:
+        parser.error('no cases given, use --case or --manifest')
+
+    options = {
+        'format': args.format,
+        'panels': tuple(args.panels),
+        'image_preset': args.image_preset,
+        'uncert_preset': args.uncert_preset,
+        'image_alpha': args.image_alpha,
+        'uncert_alpha': args.uncert_alpha,
+        'spacing': not args.no_spacing,
+    }
+
+    workers = args.workers or os.cpu_count() or 1
+    executors = [ProcessPoolExecutor(max_workers=1) for _ in range(workers)] if workers > 1 else []
+
+    # NOTE: every worker process renders whole cases, or one contiguous share of a case when there are fewer
+    # cases than workers, so that each case is loaded, and its statistics gathered, by as few workers as possible
+    start = time.time()
+    jobs = []
+    for i, (name, files) in enumerate(cases):
+        shape = volume_shape(files[0])
+        out = os.path.join(args.out, name)
+        if not os.path.exists(out):
+            os.makedirs(out)
+
+        tasks = []
+        for axis in args.axes:
+            indices = parse_slices(args.slices, shape[_slice_axis[axis]])
+            chunks = [indices[k:k+args.chunk] for k in range(0, len(indices), args.chunk)]
+            tasks += [(axis, (files, axis, c, dict(options, out=out))) for c in chunks]
+
+        shares = max(1, len(executors) // len(cases))
+        group = [executors[(i * shares + k) % len(executors)] for k in range(shares)] if executors else []
+        results = {axis: [] for axis in args.axes}
+        for k, (axis, task) in enumerate(tasks):
+            if group:
+                results[axis].append(group[k * shares // len(tasks)].submit(render_task, task))
+            else:
+                results[axis].append(task)
+        jobs += [(name, axis, out, results[axis]) for axis in args.axes]
+
+    n_slices = 0
+    for name, axis, out, job_results in jobs:
+        job_start = time.time()
+        job_slices = 0
+        frames = []
+        writer = None
+
+        for result in job_results:
+            count, chunk_frames = result.result() if executors else render_task(result)
+            job_slices += count
+
+            if args.format == 'video':
+                for frame in chunk_frames:
+                    if writer is None:
+                        writer = cv2.VideoWriter(os.path.join(out, '%s.mp4' % axis),
+                                                 cv2.VideoWriter_fourcc(*'mp4v'), args.fps,
+                                                 (frame.shape[1], frame.shape[0]))
+                    writer.write(frame)
+            else:
+                frames.extend(chunk_frames)
+
+        if writer is not None:
+            writer.release()
+        if args.format == 'montage' and frames:
+            cv2.imwrite(os.path.join(out, '%s_montage.png' % axis), montage(frames, args.columns))
+
+        # NOTE: workers render ahead, so this is the time spent waiting for this job after the previous one
+        elapsed = time.time() - job_start
+        n_slices += job_slices
+        print('%s %s: %d slices in %.2f s' % (name, axis, job_slices, elapsed))
+        sys.stdout.flush()
+
+    for executor in executors:
+        executor.shutdown()
+
+    elapsed = time.time() - start
+    print('total: %d slices in %.2f s, %.1f slices/s' % (n_slices, elapsed, n_slices / max(elapsed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
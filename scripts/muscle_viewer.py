@@ -4,42 +4,72 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 
 import sys
 import argparse
-import numpy as np
-import matplotlib.pyplot as plt
 
 from anatomy_viewer import AnatomyViewerApp
-from anatomy_viewer.utils import load_volume
+from anatomy_viewer.session import SessionController, SessionBrowser
+from anatomy_viewer.cases import load_cases
+from anatomy_viewer.colormaps import default_label_cmap as _default_label_cmap
+from anatomy_viewer.colormaps import default_uncert_cmap as _default_uncert_cmap
 
-_default_label_cmap = np.array([
-    [0,0,0], [1,1,1], [1,1,1], [0,1,1], [0.75,1,0.25],
-    [1,1,0], [0,1,0], [1,0.5,0.5], [1,0.5,0.5], [0.5,0,0.5],
-    [0,0,1], [1,0,0], [1,0,1], [1,0.5,0], [0,1,1],
-    [1,0,0], [1,1,0], [1,0.5,0], [1,0,1], [0,0,1],
-    [0.5,0,0.5], [0,1,0], [0.5,0.5,0.5]])
-
-_jet_mapper = plt.get_cmap('jet', 256)
-_default_uncert_cmap = np.asarray([_jet_mapper(i)[:3] for i in range(256)])
 
 def main():
 
     parser = argparse.ArgumentParser(description='Anatomy Viewer: Muscle',
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument('image',  type=str, help='Path to image file')
-    parser.add_argument('label',  type=str, help='Path to label file')
-    parser.add_argument('uncertainty', type=str, help='Path to uncertainty file')
+    parser.add_argument('image',  type=str, nargs='?', help='Path to image file')
+    parser.add_argument('label',  type=str, nargs='?', help='Path to label file')
+    parser.add_argument('uncertainty', type=str, nargs='?', help='Path to uncertainty file')
+    parser.add_argument('--session', type=str, default=None,
+                        help='Dataset directory or CSV manifest (image, label, uncertainty) to browse case by case')
+    parser.add_argument('--session-cache', type=float, default=4., help='Memory for loaded cases [GiB]')
+    parser.add_argument('--preload', type=int, default=1, help='Cases to preload before and after the current one')
+    parser.add_argument('--triplanar', action='store_true',
+                        help='Also show the axial, coronal and sagittal planes through a cursor, linked by clicks')
+    parser.add_argument('--projection', type=str, default=None, choices=['max', 'mean', 'min'],
+                        help='Show maximum, mean or minimum intensity projections over a slab instead of slices')
+    parser.add_argument('--slab', type=int, default=9, help='Slices that projections are taken over')
+    parser.add_argument('--profile', action='store_true', help='Show the frame time in the status bar')
+    parser.add_argument('--trace', type=str, default=None, help='Write a Chrome trace of the rendering stages on exit')
     args = parser.parse_args()
 
-    image, spacing = load_volume(args.image)
-    label, _ = load_volume(args.label)
-    uncert, _ = load_volume(args.uncertainty)
+    if args.session is None and None in (args.image, args.label, args.uncertainty):
+        parser.error('image, label and uncertainty are required without --session')
 
     app = QtWidgets.QApplication(sys.argv)
-    main_window = AnatomyViewerApp(image,
-                                   label, _default_label_cmap,
-                                   uncert, _default_uncert_cmap,
-                                   spacing)
+    main_window = AnatomyViewerApp(None,
+                                   None, _default_label_cmap,
+                                   None, _default_uncert_cmap,
+                                   None,
+                                   profile=args.profile or args.trace is not None)
     main_window.show()
-    sys.exit(app.exec_())
+    if args.triplanar:
+        main_window.setTriPlanar(True)
+    main_window.setSlabThickness(args.slab)
+    main_window.setProjection(args.projection)
+
+    session = None
+    if args.session is not None:
+        cases = load_cases(args.session)
+        if not cases:
+            parser.error('no cases found in %s' % args.session)
+        session = SessionController(main_window, cases,
+                                    cache_bytes=int(args.session_cache * 1024**3),
+                                    preload=args.preload)
+        browser = SessionBrowser(session, main_window)
+        main_window.addDockWidget(QtCore.Qt.RightDockWidgetArea, browser)
+        session.open(0)
+    else:
+        main_window.loadVolumes({
+            'image': args.image,
+            'label': args.label,
+            'uncert': args.uncertainty,
+        })
+    status = app.exec_()
+    if session is not None:
+        session.shutdown()
+    if args.trace is not None:
+        main_window.exportTrace(args.trace)
+    sys.exit(status)
 
 if __name__ == '__main__':
     main()
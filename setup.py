@@ -17,6 +17,8 @@ setup(
     entry_points={
         'console_scripts': [
             'muscle_viewer=scripts.muscle_viewer:main',
+            'muscle_render=scripts.muscle_render:main',
+            'muscle_convert=scripts.muscle_convert:main',
         ]
     },
     install_requires=open('requirements.txt').readlines(),
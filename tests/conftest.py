@@ -0,0 +1,32 @@
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+import pytest
+from PyQt5 import QtWidgets
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication([])
+    return app
+
+
+@pytest.fixture
+def volumes():
+    """ Small random image, label and uncertainty volumes with a spacing. """
+    rng = np.random.RandomState(0)
+    shape = (40, 30, 20)
+    image = rng.randint(-1000, 1000, shape).astype(np.int16)
+    label = rng.randint(0, 5, shape).astype(np.uint8)
+    uncert = rng.rand(*shape).astype(np.float32)
+    return image, label, uncert, np.array([1., 1., 2.])
+
+
+@pytest.fixture
+def cmaps():
+    rng = np.random.RandomState(1)
+    return rng.rand(256, 3), rng.rand(256, 3)
@@ -0,0 +1,33 @@
+import os
+
+from anatomy_viewer.cases import find_cases
+
+
+def _touch(*parts):
+    path = os.path.join(*parts)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+    return path
+
+
+def test_find_cases_keeps_dots_in_names(tmp_path):
+    root = str(tmp_path)
+    for case in ('.hidden_case', 'case.', 'case1'):
+        for role in ('image', 'label', 'uncert'):
+            _touch(root, case, '%s.mhd' % role)
+    for role in ('image', 'label', 'uncert'):
+        _touch(root, 'flat', 'case2_%s.nii.gz' % role)
+
+    cases = find_cases(root)
+
+    assert [name for name, _ in cases] == ['.hidden_case', 'case.', 'case1', os.path.join('flat', 'case2')]
+    assert cases[1][1] == [os.path.join(root, 'case.', '%s.mhd' % role) for role in ('image', 'label', 'uncert')]
+
+
+def test_find_cases_names_a_single_case_after_the_directory(tmp_path):
+    root = os.path.join(str(tmp_path), 'subject')
+    for role in ('image', 'label', 'uncert'):
+        _touch(root, '%s.mha' % role)
+
+    assert [name for name, _ in find_cases(root)] == ['subject']
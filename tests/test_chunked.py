@@ -0,0 +1,36 @@
+import numpy as np
+
+from anatomy_viewer.chunked import ChunkedVolume, write_chunked
+
+
+def test_round_trip(tmp_path):
+    rng = np.random.RandomState(0)
+    # NOTE: shapes that are not multiples of the chunks leave partial chunks at the edges
+    volume = rng.randint(-1000, 1000, (37, 25, 19)).astype(np.int16)
+    spacing = np.array([0.5, 0.75, 2.])
+
+    write_chunked(volume, str(tmp_path), spacing=spacing, chunks=(16, 16, 8))
+    chunked = ChunkedVolume(str(tmp_path))
+
+    assert chunked.shape == volume.shape and chunked.dtype == volume.dtype
+    np.testing.assert_array_equal(chunked.spacing, spacing)
+    np.testing.assert_array_equal(chunked[...], volume)
+    np.testing.assert_array_equal(chunked[5, ::-2, 3:17], volume[5, ::-2, 3:17])
+    np.testing.assert_array_equal(chunked[:, 24, -1], volume[:, 24, -1])
+
+
+def test_sparse_volume_overwrites_an_earlier_one(tmp_path):
+    rng = np.random.RandomState(0)
+    dense = rng.randint(1, 20, (37, 25, 19)).astype(np.uint8)
+    write_chunked(dense, str(tmp_path), chunks=(16, 16, 8))
+
+    sparse = np.zeros_like(dense)
+    sparse[30:, 20:, 15:] = 7
+    write_chunked(sparse, str(tmp_path), chunks=(16, 16, 8))
+    chunked = ChunkedVolume(str(tmp_path))
+
+    np.testing.assert_array_equal(chunked[...], sparse)
+    assert chunked.max() == 7
+
+    write_chunked(np.zeros_like(dense), str(tmp_path), chunks=(16, 16, 8))
+    assert not ChunkedVolume(str(tmp_path))[...].any()
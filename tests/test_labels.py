@@ -0,0 +1,66 @@
+import numpy as np
+
+from anatomy_viewer.labels import LabelIndex, compact_labels, compute_label_report
+
+
+def test_compact_labels_keeps_memory_order():
+    rng = np.random.RandomState(0)
+    # NOTE: (x, y, z) view of (z, y, x) memory, as from `load_volume`
+    volume = rng.randint(0, 20, (50, 20, 30)).astype(np.int16).transpose(2, 1, 0)
+
+    compact = compact_labels(volume, chunk_voxels=30 * 20 * 7)
+
+    assert compact.dtype == np.uint8
+    assert compact.flags.f_contiguous
+    np.testing.assert_array_equal(compact, volume)
+
+
+def test_compact_labels_widens_when_needed():
+    rng = np.random.RandomState(0)
+    volume = rng.randint(0, 20, (30, 20, 50)).astype(np.int32)
+    volume[3, 4, 40] = 300
+
+    compact = compact_labels(volume, chunk_voxels=30 * 20 * 7)
+
+    assert compact.dtype == np.uint16
+    np.testing.assert_array_equal(compact, volume)
+
+
+def test_label_index_holds_only_present_labels():
+    rng = np.random.RandomState(0)
+    volume = np.zeros((30, 20, 50), np.uint16)
+    volume[5:20, 3:9, 10:30] = rng.choice([3, 7], (15, 6, 20))
+    volume[25, 15, 45] = 65000
+
+    index = LabelIndex(volume, chunk_voxels=30 * 20 * 7)
+
+    np.testing.assert_array_equal(index.labels, [3, 7, 65000])
+    assert all(c.shape[1] == 4 for c in index.counts)
+    assert index.bounding_box(65000) == ((25, 26), (15, 16), (45, 46))
+    assert index.bounding_box(3) == ((5, 20), (3, 9), (10, 30))
+    assert index.bounding_box(4) is None
+    for axis in range(3):
+        for i in (0, 5, 15, 19):
+            expected = np.unique(np.take(volume, i, axis=axis))
+            np.testing.assert_array_equal(index.slice_labels(axis, i), expected[expected > 0])
+    assert index.next_nonempty(2, 30, 1) == 45
+
+
+def test_label_report_matches_per_label_statistics():
+    rng = np.random.RandomState(0)
+    # NOTE: runs of labels, as in segmentations, and single voxels of many others
+    label = rng.randint(0, 6, (10, 8, 12)).astype(np.uint16).repeat(3, axis=0)
+    scattered = rng.rand(*label.shape) < .05
+    label[scattered] = rng.randint(6, 3000, scattered.sum())
+    label = np.asfortranarray(label)
+    uncert = rng.rand(*label.shape).astype(np.float32)
+
+    report = compute_label_report(label, uncert, spacing=(1., 1., 2.), chunk_voxels=30 * 8 * 5)
+
+    labels = np.unique(label[label > 0])
+    np.testing.assert_array_equal(report.labels, labels)
+    np.testing.assert_array_equal(report.voxels, [np.sum(label == l) for l in labels])
+    np.testing.assert_array_equal(report.volume_mm3, 2. * report.voxels)
+    np.testing.assert_allclose(report.uncert_mean, [uncert[label == l].mean() for l in labels], rtol=1e-6)
+    np.testing.assert_allclose(report.uncert_std, [uncert[label == l].std() for l in labels], rtol=1e-4, atol=1e-6)
+    np.testing.assert_array_equal(report.uncert_max, [uncert[label == l].max() for l in labels])
@@ -0,0 +1,90 @@
+import time
+
+import numpy as np
+
+from anatomy_viewer import AnatomyViewerApp
+
+
+def _wait(qapp, window, timeout=10.):
+    end = time.time() + timeout
+    while any(v < 1. for v in window.loadProgress.values()) and time.time() < end:
+        qapp.processEvents()
+        time.sleep(0.01)
+
+
+def _save(path, volume):
+    # NOTE: `.npy` files are stored (z, y, x)
+    np.save(str(path), np.ascontiguousarray(volume.transpose(2, 1, 0)))
+    return str(path)
+
+
+def test_mismatched_shape_fails_cleanly(qapp, tmp_path, volumes, cmaps):
+    image, label, uncert, _ = volumes
+    window = AnatomyViewerApp(None, None, cmaps[0], None, cmaps[1], None, prefetch_depth=0)
+    window.show()
+
+    window.loadVolumes({'image': _save(tmp_path / 'image.npy', image),
+                        'label': _save(tmp_path / 'label.npy', label[:-1])}, max_workers=1)
+    _wait(qapp, window)
+
+    assert window.imageVolume is not None
+    assert window.labelVolume is None
+    assert 'label.npy' in window.ui.statusBar.currentMessage()
+    window.close()
+
+
+def test_superseded_load_is_dropped(qapp, tmp_path, volumes, cmaps):
+    image, label, uncert, _ = volumes
+    window = AnatomyViewerApp(None, None, cmaps[0], None, cmaps[1], None, prefetch_depth=0)
+    window.show()
+
+    window.loadVolumes({'image': _save(tmp_path / 'old.npy', image[:-1])})
+    window.loader.executor.shutdown(wait=True)
+    window.loadVolumes({'image': _save(tmp_path / 'new.npy', image)})
+    _wait(qapp, window)
+    qapp.processEvents()
+
+    assert window.imageVolume.shape == image.shape
+    window.close()
+
+
+def test_image_spacing_wins(qapp, volumes, cmaps):
+    image, label, uncert, spacing = volumes
+    window = AnatomyViewerApp(None, None, cmaps[0], None, cmaps[1], None, prefetch_depth=0)
+
+    window.setVolume('label', label, np.ones(3))
+    window.setVolume('image', image, spacing)
+    window.setVolume('uncert', uncert, np.ones(3))
+
+    np.testing.assert_array_equal(window.volumeSpacing, spacing)
+    np.testing.assert_array_equal(window.renderer.spacing, spacing)
+    window.close()
+
+
+def test_label_report_is_gathered_by_the_loader(qapp, tmp_path, volumes, cmaps, monkeypatch):
+    import anatomy_viewer.anatomy_viewer as viewer
+
+    def fail(*args, **kwargs):
+        raise AssertionError('label report gathered on the GUI thread')
+
+    image, label, uncert, spacing = volumes
+    window = AnatomyViewerApp(None, None, cmaps[0], None, cmaps[1], None, prefetch_depth=0)
+    window.show()
+    monkeypatch.setattr(viewer, 'compute_label_report', fail)
+
+    window.loadVolumes({'label': _save(tmp_path / 'label.npy', label),
+                        'uncert': _save(tmp_path / 'uncert.npy', uncert)})
+    _wait(qapp, window)
+    end = time.time() + 10.
+    while window.labelReport is None and time.time() < end:
+        qapp.processEvents()
+        time.sleep(0.01)
+
+    report = window.labelReport
+    np.testing.assert_array_equal(report.voxels, np.bincount(label.ravel())[1:])
+    np.testing.assert_allclose(report.volume_mm3, report.voxels)
+
+    # NOTE: the image's spacing rescales the report without another sweep
+    window.setVolume('image', image, spacing)
+    np.testing.assert_allclose(window.labelReport.volume_mm3, report.voxels * np.prod(spacing))
+    window.close()
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from anatomy_viewer.oblique import ObliqueGeometry, ObliquePlane
+from anatomy_viewer.render import get_slice, get_slice_shape, slice_view
+
+_axes = ('Axial', 'Coronal', 'Sagittal')
+
+
+def _get_slab(volume):
+    return lambda axis, start, stop: slice_view(volume, axis)[start:stop]
+
+
+def _trilinear(volume, points):
+    """ `volume` interpolated at the (n, 3) voxel positions `points`, all within the volume. """
+    base = np.minimum(np.floor(points).astype(int), np.array(volume.shape) - 2)
+    t = points - base
+    out = np.zeros(len(points))
+    for corner in np.ndindex(2, 2, 2):
+        weight = np.prod(np.where(corner, t, 1 - t), axis=1)
+        out += weight * volume[tuple((base + corner).T)]
+    return out
+
+
+@pytest.mark.parametrize('base', _axes)
+@pytest.mark.parametrize('linear', [True, False])
+def test_untilted_plane_samples_the_axis_slices(base, linear):
+    rng = np.random.RandomState(0)
+    volume = rng.randint(-1000, 1000, (23, 17, 11)).astype(np.int16)
+    geometry = ObliqueGeometry(volume.shape, (0.8, 0.8, 2.), ObliquePlane(base, 0., 0.))
+
+    assert geometry.shape == get_slice_shape(volume.shape, base)
+    assert geometry.n_slices == len(slice_view(volume, base))
+    for index in range(geometry.n_slices):
+        np.testing.assert_array_equal(geometry.sample(_get_slab(volume), index, volume.dtype, linear),
+                                      get_slice(volume, base, index))
+
+
+@pytest.mark.parametrize('base', _axes)
+def test_tilted_plane_interpolates_trilinearly(base):
+    x, y, z = np.meshgrid(*[np.arange(n) for n in (23, 17, 11)], indexing='ij')
+    volume = (np.sin(x / 5.) + np.cos(y / 4.) * z / 10.).astype(np.float32)
+    geometry = ObliqueGeometry(volume.shape, (0.8, 0.8, 2.), ObliquePlane(base, 25., -15.))
+
+    upper = np.array(volume.shape) - 1
+    for index in (geometry.n_slices // 3, geometry.n_slices // 2):
+        sampled = geometry.sample(_get_slab(volume), index, volume.dtype)
+        rows, cols = np.mgrid[0:geometry.shape[0], 0:geometry.shape[1]]
+        points = geometry.voxel(index, rows.ravel()[:, None], cols.ravel()[:, None])
+
+        inside = np.all((points >= 0) & (points <= upper), axis=1)
+        outside = np.any((points < -1) | (points > upper + 1), axis=1)
+        assert inside.sum() > 0.2 * len(points)
+        np.testing.assert_allclose(sampled.ravel()[inside], _trilinear(volume, points[inside]), atol=1e-4)
+        assert not sampled.ravel()[outside].any()
@@ -0,0 +1,54 @@
+import threading
+
+import numpy as np
+
+from anatomy_viewer.cache import LRUCache
+from anatomy_viewer.prefetch import SlicePrefetcher
+from anatomy_viewer.render import RenderState, SliceRenderer, panel_key
+
+
+def _state(index=10):
+    return RenderState('Axial', index, (1000., 0.), (1., .5), .5, .5)
+
+
+def test_clones_keep_their_volumes(volumes, cmaps):
+    image, label, uncert, spacing = volumes
+    renderer = SliceRenderer(image, label, cmaps[0], uncert, cmaps[1], spacing)
+    clone = renderer.clone()
+
+    renderer.set_volume('image', image + 1)
+
+    assert clone.volumes['image'] is image
+
+
+def test_cancelled_render_is_not_cached(volumes, cmaps):
+    image, label, uncert, spacing = volumes
+    renderer = SliceRenderer(image, label, cmaps[0], uncert, cmaps[1], spacing)
+    cache = LRUCache(64 * 1024**2)
+    prefetcher = SlicePrefetcher(renderer, cache, depth=1, max_workers=1)
+
+    started, release = threading.Event(), threading.Event()
+    clone = renderer.clone()
+    render = clone.render
+
+    def blocking_render(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return render(*args, **kwargs)
+
+    clone.render = blocking_render
+    renderer.clone = lambda: clone
+
+    prefetcher.prefetch(_state(), 1, image.shape[2])
+    assert started.wait(5)
+
+    # NOTE: as `AnatomyViewerApp.setVolume` does, while the neighbour is being rendered
+    prefetcher.cancel()
+    renderer.set_volume('image', np.zeros_like(image))
+    cache.evict(lambda key: key[0] in ('image', 'labelOverlay', 'uncertOverlay'))
+    release.set()
+    prefetcher.shutdown()
+    prefetcher._executor.shutdown(wait=True)
+
+    assert len(cache) == 0
+    assert panel_key('image', _state(11)) not in cache
@@ -0,0 +1,154 @@
+import gc
+
+import numpy as np
+import pytest
+
+from anatomy_viewer.projection import SlabTables, project_slab, slab_bounds, table_bytes
+from anatomy_viewer.render import slice_view
+
+_axes = ('Axial', 'Coronal', 'Sagittal')
+
+
+def _volume(dtype):
+    rng = np.random.RandomState(0)
+    if np.dtype(dtype).kind == 'f':
+        return rng.rand(21, 19, 35).astype(dtype)
+    return rng.randint(0, 200, (21, 19, 35)).astype(dtype)
+
+
+def _request(volume, axis):
+    view = slice_view(volume, axis)
+    return volume, lambda i, j: view[i:j], len(view), view.shape[1:]
+
+
+def _get(tables, volume, axis, mode):
+    _, get_slab, n_slices, shape = _request(volume, axis)
+    return tables.get(volume, axis, mode, get_slab, n_slices, shape)
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.int16, np.float32])
+@pytest.mark.parametrize('mode', ['max', 'mean', 'min'])
+def test_tables_match_scanning(dtype, mode):
+    volume = _volume(dtype)
+    tables = SlabTables(1 << 30)
+    for axis in _axes:
+        tables.prepare([_request(volume, axis)], axis, mode)
+    tables.wait()
+
+    for axis in _axes:
+        volume, get_slab, n_slices, shape = _request(volume, axis)
+        table = tables.get(volume, axis, mode, get_slab, n_slices, shape)
+        assert table is not None
+        assert table.nbytes == table_bytes(n_slices, shape, volume.dtype, mode)
+        for lo in range(n_slices):
+            for hi in range(lo + 1, n_slices + 1):
+                projected = table.project(lo, hi, get_slab)
+                expected = project_slab(get_slab(lo, hi), mode, volume.dtype)
+                assert projected.dtype == volume.dtype
+                np.testing.assert_allclose(projected, expected, atol=1 if mode == 'mean' else 0)
+    tables.shutdown()
+
+
+def test_other_axes_do_not_replace_the_prepared_one():
+    volume = _volume(np.int16)
+    tables = SlabTables(1 << 30)
+    tables.prepare([_request(volume, 'Axial')], 'Axial', 'max')
+    # NOTE: e.g. the planes of the tri-planar view
+    for axis in _axes:
+        _get(tables, volume, axis, 'max')
+    tables.wait()
+
+    for axis in _axes:
+        assert _get(tables, volume, axis, 'max') is not None
+    tables.shutdown()
+
+
+def test_budget():
+    volume = _volume(np.int16)
+    # NOTE: room for the table of either axis, but not both
+    sizes = {}
+    for axis in ('Axial', 'Coronal'):
+        _, _, n_slices, shape = _request(volume, axis)
+        sizes[axis] = table_bytes(n_slices, shape, volume.dtype, 'max')
+    nbytes = max(sizes.values())
+    tables = SlabTables(nbytes)
+
+    tables.prepare([_request(volume, 'Axial')], 'Axial', 'max')
+    tables.wait()
+    # NOTE: tables for other axes are only built next to the prepared one if they fit
+    assert _get(tables, volume, 'Coronal', 'max') is None
+    tables.wait()
+    assert tables.nbytes == sizes['Axial']
+    assert _get(tables, volume, 'Axial', 'max') is not None
+
+    # NOTE: preparing another axis makes room for it
+    tables.prepare([_request(volume, 'Coronal')], 'Coronal', 'max')
+    tables.wait()
+    assert _get(tables, volume, 'Axial', 'max') is None
+    assert tables.nbytes == sizes['Coronal'] <= nbytes
+    tables.shutdown()
+
+
+def test_slab_bounds():
+    assert slab_bounds(10, 1, 20) == (10, 11)
+    assert slab_bounds(10, 4, 20) == (9, 13)
+    assert slab_bounds(0, 9, 20) == (0, 5)
+    assert slab_bounds(19, 9, 20) == (15, 20)
+
+
+def test_tri_planar_keeps_the_viewed_axis(qapp, volumes, cmaps):
+    from anatomy_viewer import AnatomyViewerApp
+
+    image, label, uncert, spacing = volumes
+    label_cmap, uncert_cmap = cmaps
+    window = AnatomyViewerApp(image, label, label_cmap, uncert, uncert_cmap, spacing,
+                              prefetch_depth=0, pyramid_levels=0)
+    window.show()
+    window.setSliceAxis('Axial')
+    window.setProjection('max')
+    window.setSlabThickness(10 ** 6)
+    assert window.slabThickness == window.ui.spinBoxSlabThickness.maximum() == len(slice_view(image, 'Axial'))
+
+    window.ui.checkBoxTriPlanar.setChecked(True)
+    for _ in range(3):
+        window.addSliceIndex(1)
+        window.scheduler.flush()
+        window.projections.wait()
+    window.scheduler.flush()
+    qapp.processEvents()
+
+    assert _get(window.projections, window.imageVolume, 'Axial', 'max') is not None
+    window.close()
+
+
+def test_failed_build_is_asked_for_again():
+    volume = _volume(np.int16)
+    _, _, n_slices, shape = _request(volume, 'Axial')
+    tables = SlabTables(1024**2)
+
+    def get_slab(i, j):
+        raise IOError('unreadable chunk')
+
+    assert tables.get(volume, 'Axial', 'max', get_slab, n_slices, shape) is None
+    tables.wait()
+    assert not tables._building
+
+    assert _get(tables, volume, 'Axial', 'max') is None
+    tables.wait()
+    assert _get(tables, volume, 'Axial', 'max') is not None
+    tables.shutdown()
+
+
+def test_tables_are_dropped_with_their_volume():
+    volume = _volume(np.int16)
+    tables = SlabTables(1024**2)
+    for mode in ('max', 'mean', 'min'):
+        for axis in _axes:
+            tables.prepare([_request(volume, axis)], axis, mode)
+            tables.wait()
+    assert len(tables._finalizers) == 1
+
+    del volume
+    gc.collect()
+    assert tables.nbytes == 0 and not tables._finalizers
+    tables.shutdown()
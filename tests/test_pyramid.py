@@ -0,0 +1,40 @@
+import gc
+import weakref
+
+import numpy as np
+
+from anatomy_viewer.labels import get_label_index
+from anatomy_viewer.pyramid import get_image_pyramid, get_label_pyramid, downsample_mean
+from anatomy_viewer.stats import get_statistics
+
+
+def _volume(dtype=np.int16):
+    rng = np.random.RandomState(0)
+    return rng.randint(0, 5, (20, 18, 16)).astype(dtype)
+
+
+def test_levels():
+    volume = _volume()
+    pyramid = get_image_pyramid(volume)
+    assert pyramid.level(0) is volume
+
+    while pyramid.level(2) is None:
+        pyramid.wait()
+    np.testing.assert_array_equal(pyramid.level(1), downsample_mean(volume))
+    assert pyramid.level(2).shape == (5, 5, 4)
+
+
+def test_cached_pyramid_does_not_keep_the_volume_alive():
+    for get_pyramid in (get_image_pyramid, get_label_pyramid):
+        volume = _volume(np.uint8)
+        pyramid = get_pyramid(volume)
+        while pyramid.level(2) is None:
+            pyramid.wait()
+        get_statistics(volume)
+        get_label_index(volume)
+
+        ref = weakref.ref(volume)
+        del volume
+        gc.collect()
+        assert ref() is None
+        assert pyramid.level(0) is None
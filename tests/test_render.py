@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+import pytest
+
+from anatomy_viewer import AnatomyViewerApp
+from anatomy_viewer.render import RenderState, SliceRenderer, changed_inputs, get_slice, invalidated_panels, panelNames
+from anatomy_viewer.utils import clim, lut
+
+
+def _state(**kwargs):
+    state = RenderState('Axial', 10, (1000., 0.), (1., .5), .2, .2)
+    return state._replace(**kwargs)
+
+
+@pytest.mark.parametrize('change, panels', [
+    (dict(uncert_alpha=.5), ('uncertOverlay',)),
+    (dict(image_alpha=.5), ('labelOverlay',)),
+    (dict(uncert_window_level=(.5, .25)), ('uncert', 'uncertOverlay')),
+    (dict(image_window_level=(500., 0.)), ('image', 'labelOverlay', 'uncertOverlay')),
+    (dict(index=11), ('image', 'label', 'labelOverlay', 'uncert', 'uncertOverlay')),
+    (dict(projection=('max', 5)), ('image', 'labelOverlay', 'uncert', 'uncertOverlay')),
+])
+def test_invalidated_panels(change, panels):
+    assert invalidated_panels(changed_inputs(_state(), _state(**change))) == panels
+
+
+def test_viewer_renders_only_the_affected_panels(qapp, volumes, cmaps):
+    image, label, uncert, spacing = volumes
+    label_cmap, uncert_cmap = cmaps
+    window = AnatomyViewerApp(image, label, label_cmap, uncert, uncert_cmap, spacing,
+                              cache_bytes=0, prefetch_depth=0, pyramid_levels=0)
+    window.show()
+    window.scheduler.flush()
+
+    rendered = []
+    renderPanels = window.renderPanels
+
+    def recordPanels(state, panels, level=0):
+        rendered.append(tuple(panels))
+        return renderPanels(state, panels, level)
+
+    window.renderPanels = recordPanels
+    window.setUncertAlpha(window.uncertAlpha + .1)
+    window.scheduler.flush()
+    window.setImageAlpha(window.imageAlpha + .1)
+    window.scheduler.flush()
+
+    assert rendered == [('uncertOverlay',), ('labelOverlay',)]
+    window.close()
+
+
+def _baseline(image, label, uncert, label_cmap, uncert_cmap, state):
+    """ Panels as composited before `SliceRenderer`, with `clim`, `lut` and `cv2.addWeighted`. """
+    imageWindow, imageLevel = state.image_window_level
+    imageSlice = clim(image, (imageLevel - imageWindow/2., imageLevel + imageWindow/2.)).astype(np.uint8)
+    imageSlice = cv2.cvtColor(imageSlice, cv2.COLOR_GRAY2BGR)
+
+    labelSlice = lut(np.ascontiguousarray(label, np.uint8), label_cmap)
+    labelOverlaySlice = cv2.addWeighted(imageSlice, 1.0 - state.image_alpha, labelSlice, state.image_alpha, 0)
+
+    uncertWindow, uncertLevel = state.uncert_window_level
+    uncertSlice = clim(uncert, (uncertLevel - uncertWindow/2., uncertLevel + uncertWindow/2.)).astype(np.uint8)
+    uncertSlice = lut(uncertSlice, uncert_cmap)
+    uncertOverlaySlice = cv2.addWeighted(imageSlice, 1.0 - state.uncert_alpha, uncertSlice, state.uncert_alpha, 0)
+
+    return {'image': imageSlice, 'label': labelSlice, 'labelOverlay': labelOverlaySlice,
+            'uncert': uncertSlice, 'uncertOverlay': uncertOverlaySlice}
+
+
+@pytest.mark.parametrize('axis', ['Axial', 'Coronal', 'Sagittal'])
+def test_panels_match_the_baseline_pipeline(volumes, cmaps, axis):
+    image, label, uncert, spacing = volumes
+    label_cmap, _ = cmaps
+    # NOTE: a gray ramp, so that one level of the uncertainty window is one gray level of its panels
+    uncert_cmap = np.repeat(np.linspace(0., 1., 256)[:, None], 3, axis=1)
+    renderer = SliceRenderer(image, label, label_cmap, uncert, uncert_cmap, spacing)
+
+    for index in (0, 7):
+        state = RenderState(axis, index, (1200., 100.), (.8, .4), .3, .6)
+        images, _ = renderer.render(state)
+        expected = _baseline(get_slice(image, axis, index), get_slice(label, axis, index),
+                             get_slice(uncert, axis, index), label_cmap, uncert_cmap, state)
+
+        for name in panelNames:
+            assert images[name].shape[:2] == expected[name].shape[:2]
+            difference = np.abs(images[name][..., :3].astype(int) - expected[name])
+            assert difference.max() <= 1, name
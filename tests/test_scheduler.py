@@ -0,0 +1,30 @@
+from PyQt5 import QtCore, QtGui
+
+from anatomy_viewer import AnatomyViewerApp
+
+
+def _wheel(view, delta):
+    return QtGui.QWheelEvent(QtCore.QPointF(10, 10), QtCore.QPointF(10, 10), QtCore.QPoint(),
+                             QtCore.QPoint(delta, 0), QtCore.Qt.NoButton, QtCore.Qt.NoModifier,
+                             QtCore.Qt.NoScrollPhase, False)
+
+
+def test_interaction_renders_once(qapp, volumes, cmaps):
+    image, label, uncert, spacing = volumes
+    label_cmap, uncert_cmap = cmaps
+    window = AnatomyViewerApp(image, label, label_cmap, uncert, uncert_cmap, spacing,
+                              prefetch_depth=0, pyramid_levels=0)
+    window.show()
+    window.scheduler.flush()
+    qapp.processEvents()
+
+    count, index = window.scheduler.renderCount, window.sliceIndex
+    for _ in range(5):
+        window.addSliceIndex(1)
+    for _ in range(3):
+        window.viewImage.wheelEvent(_wheel(window.viewImage, -120))
+    window.scheduler.flush()
+
+    assert window.sliceIndex == index + 8
+    assert window.scheduler.renderCount == count + 1
+    window.close()
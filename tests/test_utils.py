@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from anatomy_viewer.utils import load_volume, open_volume
+
+
+def _write(tmp_path, name, volume, spacing, compress=False):
+    filename = os.path.join(str(tmp_path), name)
+    itkimage = sitk.GetImageFromArray(volume.transpose(2, 1, 0))
+    itkimage.SetSpacing([float(s) for s in spacing])
+    sitk.WriteImage(itkimage, filename, compress)
+    return filename
+
+
+@pytest.mark.parametrize('dtype', [np.int16, np.uint8, np.float32])
+@pytest.mark.parametrize('name, compress', [
+    ('volume.mhd', False), ('volume.mha', False), ('volume.mhd', True), ('volume.mha', True),
+])
+def test_load_volume_matches_simpleitk(tmp_path, dtype, name, compress):
+    rng = np.random.RandomState(0)
+    volume = (100 * rng.rand(13, 11, 7)).astype(dtype)
+    spacing = np.array([0.7, 0.8, 2.5])
+    filename = _write(tmp_path, name, volume, spacing, compress)
+
+    loaded, loaded_spacing = load_volume(filename)
+    decoded, decoded_spacing = load_volume(filename, mmap=False)
+
+    # NOTE: compressed files cannot be mapped and are decoded instead
+    assert (open_volume(filename) is None) == compress
+    assert isinstance(loaded.base, np.memmap) != compress
+    assert loaded.shape == decoded.shape == volume.shape and loaded.dtype == decoded.dtype
+    np.testing.assert_array_equal(loaded, decoded)
+    np.testing.assert_array_equal(loaded, volume)
+    np.testing.assert_allclose(loaded_spacing, decoded_spacing)
+    np.testing.assert_allclose(loaded_spacing, spacing)
+
+
+def test_load_volume_maps_npy(tmp_path):
+    rng = np.random.RandomState(0)
+    volume = rng.randint(-1000, 1000, (13, 11, 7)).astype(np.int16)
+    filename = os.path.join(str(tmp_path), 'volume.npy')
+    # NOTE: stored in SimpleITK's (z, y, x) order
+    np.save(filename, volume.transpose(2, 1, 0))
+
+    loaded, spacing = load_volume(filename)
+
+    assert isinstance(loaded.base, np.memmap)
+    np.testing.assert_array_equal(loaded, volume)
+    np.testing.assert_array_equal(spacing, np.ones(3))